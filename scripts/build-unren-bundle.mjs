@@ -0,0 +1,51 @@
+import fs from "node:fs";
+import path from "node:path";
+import { spawnSync } from "node:child_process";
+
+function parseArgs(argv) {
+  const args = { dest: "dist/unren-bundle", python: null, zip: true };
+  for (let i = 2; i < argv.length; i += 1) {
+    const arg = argv[i];
+    if (arg === "--dest" && argv[i + 1]) {
+      args.dest = argv[i + 1];
+      i += 1;
+    } else if (arg === "--python" && argv[i + 1]) {
+      args.python = argv[i + 1];
+      i += 1;
+    } else if (arg === "--no-zip") {
+      args.zip = false;
+    }
+  }
+  return args;
+}
+
+function resolvePython(explicit) {
+  if (explicit) return explicit;
+  // Compile with the embedded runtime so the bytecode matches the interpreter that runs it.
+  const embedded = path.resolve("src/resources/python/bin/python3");
+  if (fs.existsSync(embedded)) return embedded;
+  console.log("[build:unren] embedded Python runtime not found; using python3 from PATH.");
+  return "python3";
+}
+
+const args = parseArgs(process.argv);
+const python = resolvePython(args.python);
+const resourcesDir = path.resolve("src/modules/renpy/resources");
+const dest = path.resolve(args.dest);
+
+fs.rmSync(dest, { recursive: true, force: true });
+const result = spawnSync(
+  python,
+  ["-m", "unren.bundle", "--output", dest, ...(args.zip ? [] : ["--no-zip"])],
+  {
+    stdio: "inherit",
+    env: {
+      ...process.env,
+      PYTHONPATH: resourcesDir,
+      PYTHONDONTWRITEBYTECODE: "1"
+    }
+  }
+);
+if (result.status !== 0) {
+  process.exit(result.status ?? 1);
+}
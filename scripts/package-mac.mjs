@@ -30,6 +30,7 @@ const env = { ...process.env, FORCE_COLOR: "1" };
 const extraArgs = process.argv.slice(2);
 
 run("npm", ["run", "build"], env);
+run("npm", ["run", "build:unren"], env);
 const builderEnv = { ...env };
 if (!hasDeveloperIdIdentity(builderEnv)) {
   builderEnv.CSC_IDENTITY_AUTO_DISCOVERY = "false";
@@ -762,7 +762,8 @@ module.exports = {
         { env: unren.env }
       );
 
-      context.logger?.info?.(`[renpy] running unren decompile for ${gameDir}`);
+      // One run over both roots, so scripts shipped loose and inside archives are decompiled once.
+      context.logger?.info?.(`[renpy] running unren decompile for ${gameDir} and extracted archives`);
       await runCommand(
         unren.command,
         [
@@ -774,23 +775,9 @@ module.exports = {
           extractRoot,
           "--base-dir",
           gameDir,
-          gameDir
-        ],
-        { env: unren.env }
-      );
-
-      context.logger?.info?.(`[renpy] running unren decompile for extracted archives`);
-      await runCommand(
-        unren.command,
-        [
-          ...unren.args,
-          "decompile",
-          "--mode",
-          "auto",
-          "--output",
-          extractRoot,
           "--base-dir",
           extractRoot,
+          gameDir,
           extractRoot
         ],
         { env: unren.env }
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Tuple
+
+# Files smaller than this are written as usual: a link saves little and costs the same inode.
+DEFAULT_MIN_SIZE = 64 << 10
+
+
+@dataclass
+class CollectResult:
+    blobs: int
+    freed: int
+    kept: int
+
+
+class AssetStore:
+    """
+    Extracted files kept once by content under root/objects and hard linked into each output tree,
+    so games sharing assets share the bytes on disk. Only files whose extension is not in
+    skip_extensions (scripts, which people edit) and of at least min_size bytes go through the
+    store. Blobs are read-only: a tree's copy can be replaced but not edited in place, which would
+    change it in every other tree.
+
+    A blob nothing links to any more has a link count of 1; collect removes those.
+    """
+
+    def __init__(self, root: Path, min_size: int = DEFAULT_MIN_SIZE, skip_extensions=()) -> None:
+        self.root = root
+        self.min_size = min_size
+        self.skip_extensions = {ext.lower() for ext in skip_extensions}
+        self.objects = root / "objects"
+        self.temp = root / "tmp"
+
+    def accepts(self, name: str, size: int) -> bool:
+        return size >= self.min_size and Path(name).suffix.lower() not in self.skip_extensions
+
+    def blob_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest[2:]
+
+    def _temp_path(self, digest: str) -> Path:
+        # Unique per process, so batch workers can store the same blob at once.
+        self.temp.mkdir(parents=True, exist_ok=True)
+        return self.temp / f"{digest}.{os.getpid()}"
+
+    def put(self, contents: bytes) -> Tuple[Path, bool]:
+        """Stores contents unless a blob with the same digest exists. Returns (blob, newly written)."""
+        digest = hashlib.blake2b(contents, digest_size=20).hexdigest()
+        blob = self.blob_path(digest)
+        if blob.exists():
+            return blob, False
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self._temp_path(digest)
+        try:
+            with temp_path.open("wb") as handle:
+                handle.write(contents)
+            temp_path.chmod(0o444)
+            temp_path.replace(blob)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        return blob, True
+
+    def link(self, blob: Path, out_path: Path) -> bool:
+        """
+        Points out_path at blob, replacing what was there. Falls back to a copy (returning False)
+        when the output is on another volume or the filesystem has no hard links.
+        """
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = out_path.with_name(out_path.name + ".tmp")
+        try:
+            try:
+                os.link(blob, temp_path)
+                linked = True
+            except OSError:
+                shutil.copyfile(blob, temp_path)
+                linked = False
+            temp_path.replace(out_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        return linked
+
+    def iter_blobs(self) -> Iterator[Path]:
+        if not self.objects.is_dir():
+            return
+        for folder in self.objects.iterdir():
+            if folder.is_dir():
+                yield from folder.iterdir()
+
+    def collect(self, dry_run: bool = False) -> CollectResult:
+        """
+        Removes blobs no output tree links to, and temp files left by interrupted runs. Run it while
+        nothing is extracting into the store.
+        """
+        blobs = freed = kept = 0
+        for blob in self.iter_blobs():
+            stat = blob.stat()
+            if stat.st_nlink > 1:
+                kept += 1
+                continue
+            blobs += 1
+            freed += stat.st_size
+            if not dry_run:
+                blob.unlink()
+        if not dry_run:
+            if self.temp.is_dir():
+                for temp_path in self.temp.iterdir():
+                    temp_path.unlink()
+            if self.objects.is_dir():
+                for folder in self.objects.iterdir():
+                    if folder.is_dir() and not any(folder.iterdir()):
+                        folder.rmdir()
+        return CollectResult(blobs, freed, kept)
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import base64
+import math
+import types
+from json.encoder import encode_basestring
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+DUMP_FORMATS = ("text", "json", "ndjson")
+DUMP_EXTENSIONS = {"text": ".txt", "json": ".json", "ndjson": ".ndjson"}
+
+_FLUSH_CHUNKS = 4096
+
+# What inspect.isroutine() accepts, without importing inspect on the CLI's startup path.
+_ROUTINE_TYPES = (
+    types.FunctionType,
+    types.MethodType,
+    types.BuiltinFunctionType,
+    types.MethodDescriptorType,
+    types.WrapperDescriptorType,
+    types.MethodWrapperType,
+    types.ClassMethodDescriptorType,
+)
+
+
+class AstExporter:
+    """
+    Streams a Ren'Py AST as JSON.
+
+    Objects become {"_type": "module.Class", "_id": n, ...attributes}. A reference back to an
+    object that is still being written (a cycle) becomes {"_ref": n}, or {"_ref": null} for a
+    list, set or dict that contains itself. Tuples are written as
+    arrays, sets as {"_type": "set", "items": [...]}, dicts as {"_type": "dict", "items":
+    [[key, value], ...]}, classes as {"_class": "module.Class"} and bytes as
+    {"_type": "bytes", "base64": "..."}. str subclasses such as PyExpr are written as objects
+    with a "value" key.
+    """
+
+    def __init__(self, out_file) -> None:
+        self.out_file = out_file
+        self._chunks: List[str] = []
+        self._class_keys: Dict[type, Tuple[FrozenSet[str], Tuple[str, ...]]] = {}
+        self._active: Dict[int, Optional[int]] = {}
+        self._next_id = 0
+
+    def export(self, ast) -> None:
+        self._write_value(ast)
+        self._chunks.append("\n")
+        self.flush()
+
+    def export_lines(self, ast) -> None:
+        # One top level statement per line.
+        nodes = ast if isinstance(ast, (list, tuple)) else [ast]
+        for node in nodes:
+            self._write_value(node)
+            self._chunks.append("\n")
+        self.flush()
+
+    def flush(self) -> None:
+        if self._chunks:
+            self.out_file.write("".join(self._chunks))
+            self._chunks = []
+
+    def _keys(self, obj) -> Tuple[str, ...]:
+        cls = type(obj)
+        cached = self._class_keys.get(cls)
+        if cached is None:
+            skipped = set()
+            class_keys = []
+            for name in dir(cls):
+                if name.startswith("_"):
+                    continue
+                try:
+                    value = getattr(cls, name)
+                except Exception:
+                    skipped.add(name)
+                    continue
+                if isinstance(value, _ROUTINE_TYPES):
+                    skipped.add(name)
+                else:
+                    class_keys.append(name)
+            cached = (frozenset(skipped), tuple(class_keys))
+            self._class_keys[cls] = cached
+
+        skipped, class_keys = cached
+        instance_dict = getattr(obj, "__dict__", None)
+        if not instance_dict:
+            return class_keys
+        keys = set(class_keys)
+        keys.update(key for key in instance_dict if not key.startswith("_") and key not in skipped)
+        return tuple(sorted(keys))
+
+    def _write_value(self, root) -> None:
+        # Containers are walked with an explicit stack of iterators, so deeply nested ASTs don't
+        # run into the recursion limit.
+        chunks = self._chunks
+        stack: List[Iterator] = [iter((root,))]
+        while stack:
+            try:
+                value = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+
+            if isinstance(value, _Raw):
+                chunks.append(value.text)
+                if value.release is not None:
+                    del self._active[value.release]
+                continue
+
+            if len(chunks) > _FLUSH_CHUNKS:
+                self.flush()
+                chunks = self._chunks
+
+            if value is None:
+                chunks.append("null")
+            elif value is True:
+                chunks.append("true")
+            elif value is False:
+                chunks.append("false")
+            elif type(value) is str:
+                chunks.append(encode_basestring(value))
+            elif type(value) is int:
+                chunks.append(str(value))
+            elif type(value) is float:
+                chunks.append(repr(value) if math.isfinite(value) else encode_basestring(repr(value)))
+            elif isinstance(value, type):
+                chunks.append('{"_class": %s}' % encode_basestring(_type_name(value)))
+            elif isinstance(value, (bytes, bytearray)):
+                chunks.append('{"_type": "bytes", "base64": "%s"}' % base64.b64encode(bytes(value)).decode("ascii"))
+            else:
+                if id(value) in self._active:
+                    ref = self._active[id(value)]
+                    chunks.append('{"_ref": %s}' % ("null" if ref is None else ref))
+                    continue
+                stack.append(self._members(value))
+
+    def _open(self, value) -> str:
+        node_id = self._next_id
+        self._next_id += 1
+        self._active[id(value)] = node_id
+        return '{"_type": %s, "_id": %d' % (encode_basestring(_type_name(type(value))), node_id)
+
+    def _members(self, value) -> Iterator:
+        if type(value) in (list, tuple):
+            self._active[id(value)] = None
+            yield _Raw("[")
+            for index, item in enumerate(value):
+                if index:
+                    yield _Raw(", ")
+                yield item
+            yield _Raw("]", id(value))
+            return
+
+        if isinstance(value, (set, frozenset)):
+            self._active[id(value)] = None
+            yield _Raw('{"_type": "set", "items": [')
+            for index, item in enumerate(sorted(value, key=repr)):
+                if index:
+                    yield _Raw(", ")
+                yield item
+            yield _Raw("]}", id(value))
+            return
+
+        if type(value) is dict:
+            self._active[id(value)] = None
+            yield _Raw('{"_type": "dict", "items": [')
+            for index, (key, item) in enumerate(value.items()):
+                yield _Raw(", [" if index else "[")
+                yield key
+                yield _Raw(", ")
+                yield item
+                yield _Raw("]")
+            yield _Raw("]}", id(value))
+            return
+
+        yield _Raw(self._open(value))
+        if isinstance(value, str):
+            yield _Raw(', "value": ')
+            yield str(value)
+        elif isinstance(value, (int, float)):
+            yield _Raw(', "value": %s' % encode_basestring(repr(value)))
+        elif isinstance(value, (list, tuple, set, frozenset, dict)):
+            yield _Raw(', "items": ')
+            yield list(value.items()) if isinstance(value, dict) else list(value)
+        for key in self._keys(value):
+            try:
+                item = getattr(value, key)
+            except Exception:
+                continue
+            if isinstance(item, _ROUTINE_TYPES):
+                continue
+            yield _Raw(", %s: " % encode_basestring(key))
+            yield item
+        yield _Raw("}", id(value))
+
+
+class _Raw:
+    __slots__ = ("text", "release")
+
+    def __init__(self, text: str, release=None) -> None:
+        self.text = text
+        self.release = release
+
+
+def _type_name(cls: type) -> str:
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def export_ast(out_file, ast, dump_format: str = "json") -> None:
+    exporter = AstExporter(out_file)
+    if dump_format == "ndjson":
+        exporter.export_lines(ast)
+    else:
+        exporter.export(ast)
@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import json
+import queue
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+from .detect import detect_archive_extensions, iter_files
+from .errors import ErrorRecord, capture
+from .limits import DEFAULT_LIMITS, Limits
+
+RPYC_EXTENSIONS = (".rpyc", ".rpymc")
+
+
+@dataclass
+class BatchGame:
+    root: Path
+    output: Optional[Path] = None
+    priority: int = 0
+    name: str = ""
+
+
+@dataclass
+class BatchItem:
+    game: str
+    kind: str
+    path: Path
+    state: str
+    output_path: Optional[Path] = None
+    extracted: int = 0
+    error: Optional[ErrorRecord] = None
+    seconds: float = 0.0
+
+
+@dataclass
+class GameSummary:
+    name: str
+    root: Path
+    game_dir: Path
+    output: Path
+    priority: int
+    states: Dict[str, int] = field(default_factory=dict)
+    extracted: int = 0
+    # Time from the game's first task starting to its last one finishing.
+    seconds: float = 0.0
+
+
+@dataclass
+class BatchSummary:
+    games: List[GameSummary]
+    items: List[BatchItem]
+    processes: int
+    seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return all(item.state in ("ok", "skip") for item in self.items)
+
+    def to_json(self) -> Dict:
+        def plain(value):
+            if isinstance(value, Path):
+                return str(value)
+            if isinstance(value, float):
+                return round(value, 4)
+            if isinstance(value, dict):
+                return {key: plain(item) for key, item in value.items()}
+            if isinstance(value, list):
+                return [plain(item) for item in value]
+            return value
+
+        return {
+            "processes": self.processes,
+            "seconds": round(self.seconds, 3),
+            "ok": self.ok,
+            "games": [plain(asdict(game)) for game in self.games],
+            "items": [plain(asdict(item)) for item in self.items],
+        }
+
+    def write_json(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_json(), indent=2), "utf-8")
+
+
+def resolve_game_dir(root: Path) -> Path:
+    """The directory holding the scripts and archives: root/game when there is one, else root."""
+    game_dir = root / "game"
+    return game_dir if game_dir.is_dir() else root
+
+
+def _unique_names(games: Sequence[BatchGame]) -> List[str]:
+    names: List[str] = []
+    for game in games:
+        base = game.name or game.root.name or "game"
+        name = base
+        number = 2
+        while name in names:
+            name = f"{base}-{number}"
+            number += 1
+        names.append(name)
+    return names
+
+
+# A task is (kind, game name, path, output dir, base dir). Workers keep the decompiler stacks
+# imported between tasks, whichever game they come from.
+Task = Tuple[str, str, str, str, str]
+
+
+def _run_task(task: Task, options: Dict) -> BatchItem:
+    kind, game, path, output_dir, base_dir = task
+    start = time.perf_counter()
+    try:
+        if kind == "extract":
+            from .rpa import extract_archives, open_asset_store
+
+            results = extract_archives(
+                [Path(path)],
+                output_dir=Path(output_dir),
+                base_dir=Path(base_dir),
+                recursive=False,
+                mode=options["extract_mode"],
+                detect_all=True,
+                auto_retry=options["auto_retry"],
+                asset_store=open_asset_store(Path(options["asset_store"])) if options["asset_store"] else None,
+            )
+            result = results[0]
+            item = BatchItem(game, kind, Path(path), result.state, result.output_dir, result.extracted, result.error)
+        else:
+            from .rpyc import decompile_paths
+
+            results = decompile_paths(
+                [Path(path)],
+                output_dir=Path(output_dir),
+                base_dir=Path(base_dir),
+                recursive=False,
+                overwrite=options["overwrite"],
+                try_harder=options["try_harder"],
+                mode=options["mode"],
+                auto_retry=options["auto_retry"],
+                limits=options["limits"],
+                # One file per task: nothing to hash for duplicates or to hand to writer threads.
+                duplicates="off",
+                write_threads=0,
+            )
+            result = results[0]
+            item = BatchItem(game, kind, Path(path), result.state, result.output_path, error=result.error)
+    except Exception as exc:
+        item = BatchItem(game, kind, Path(path), "error", error=capture(exc, kind))
+    item.seconds = time.perf_counter() - start
+    return item
+
+
+_worker_options: Dict = {}
+
+
+def _init_worker(options: Dict) -> None:
+    _worker_options.update(options)
+
+
+def _run_pooled(task: Task) -> BatchItem:
+    return _run_task(task, _worker_options)
+
+
+class _GameQueue:
+    """One game's ready tasks and what is still outstanding for it."""
+
+    def __init__(self, game: BatchGame, name: str, output_root: Optional[Path], detect_all: bool, extract: bool) -> None:
+        from .rpa import _iter_archives
+
+        self.name = name
+        self.priority = game.priority
+        self.game_dir = resolve_game_dir(game.root)
+        if game.output is not None:
+            self.output = game.output
+        elif output_root is not None:
+            self.output = output_root / name
+        else:
+            self.output = self.game_dir
+        self.summary = GameSummary(name, game.root, self.game_dir, self.output, game.priority)
+
+        archives: List[Path] = []
+        if extract:
+            extensions = detect_archive_extensions(self.game_dir, recursive=detect_all)
+            archives = list(_iter_archives([self.game_dir], True, extensions, detect_all))
+        scripts = [path for path in iter_files([self.game_dir], True) if path.suffix.lower() in RPYC_EXTENSIONS]
+        self.scheduled: Set[Path] = set(scripts)
+
+        # Biggest first, so a large file doesn't start last and hold the batch up.
+        tasks = [("extract", path) for path in archives] + [("decompile", path) for path in scripts]
+        tasks.sort(key=lambda item: item[1].stat().st_size, reverse=True)
+        self.ready: Deque[Task] = deque(
+            (kind, name, str(path), str(self.output), str(self.game_dir)) for kind, path in tasks
+        )
+        self.archives_left = len(archives)
+        self.running = 0
+        self.started: Optional[float] = None
+
+    def take(self) -> Task:
+        if self.started is None:
+            self.started = time.perf_counter()
+        self.running += 1
+        return self.ready.popleft()
+
+    def finish(self, item: BatchItem) -> None:
+        self.running -= 1
+        self.summary.states[item.state] = self.summary.states.get(item.state, 0) + 1
+        self.summary.extracted += item.extracted
+        if item.kind == "extract":
+            self.archives_left -= 1
+            if self.archives_left == 0:
+                self._queue_extracted()
+        if self.started is not None:
+            self.summary.seconds = time.perf_counter() - self.started
+
+    def _queue_extracted(self) -> None:
+        # Same as the launcher's decompile of the output root: what the archives put there.
+        if not self.output.is_dir():
+            return
+        found = [
+            path for path in iter_files([self.output], True)
+            if path.suffix.lower() in RPYC_EXTENSIONS and path not in self.scheduled
+        ]
+        found.sort(key=lambda path: path.stat().st_size, reverse=True)
+        for path in found:
+            self.scheduled.add(path)
+            self.ready.append(("decompile", self.name, str(path), str(self.output), str(self.output)))
+
+
+class _Scheduler:
+    """
+    Hands out tasks across games: higher priority first, round robin between games of the same
+    priority so every game keeps moving.
+    """
+
+    def __init__(self, games: List[_GameQueue]) -> None:
+        self.games = games
+        self.last = -1
+
+    def next_task(self) -> Optional[Task]:
+        ready = [game for game in self.games if game.ready]
+        if not ready:
+            return None
+        top = max(game.priority for game in ready)
+        count = len(self.games)
+        for offset in range(1, count + 1):
+            index = (self.last + offset) % count
+            game = self.games[index]
+            if game.ready and game.priority == top:
+                self.last = index
+                return game.take()
+        return None
+
+    def busy(self) -> bool:
+        return any(game.ready or game.running for game in self.games)
+
+
+def run_batch(
+    games: Sequence[BatchGame],
+    *,
+    output_root: Optional[Path] = None,
+    processes: Optional[int] = None,
+    mode: str = "auto",
+    extract: bool = True,
+    extract_mode: str = "all",
+    detect_all: bool = False,
+    try_harder: bool = False,
+    overwrite: bool = False,
+    auto_retry: bool = True,
+    limits: Limits = DEFAULT_LIMITS,
+    asset_store: Optional[Path] = None,
+    on_item: Optional[Callable[[BatchItem], None]] = None,
+) -> BatchSummary:
+    """
+    Extracts and decompiles several games through one queue and one worker pool. Each game goes
+    through the launcher's steps (extract archives, decompile the game dir, decompile what was
+    extracted), but tasks from all games share the workers.
+    """
+    start = time.perf_counter()
+    names = _unique_names(games)
+    queues = {
+        name: _GameQueue(game, name, output_root, detect_all, extract)
+        for game, name in zip(games, names)
+    }
+    scheduler = _Scheduler(list(queues.values()))
+    options = {
+        "mode": mode,
+        "extract_mode": extract_mode,
+        "try_harder": try_harder,
+        "overwrite": overwrite,
+        "auto_retry": auto_retry,
+        "limits": limits,
+        "asset_store": str(asset_store) if asset_store is not None else None,
+    }
+
+    if processes is None:
+        from os import cpu_count
+
+        processes = cpu_count() or 1
+    processes = max(1, processes)
+
+    items: List[BatchItem] = []
+
+    def record(item: BatchItem) -> None:
+        queues[item.game].finish(item)
+        items.append(item)
+        if on_item is not None:
+            on_item(item)
+
+    if processes == 1:
+        while True:
+            task = scheduler.next_task()
+            if task is None:
+                break
+            record(_run_task(task, options))
+    else:
+        from multiprocessing import Pool
+
+        done: "queue.Queue[BatchItem]" = queue.Queue()
+        # Two tasks per worker in flight, so a worker never waits on the parent for its next one.
+        window = processes * 2
+        in_flight = 0
+        with Pool(processes, initializer=_init_worker, initargs=(options,)) as pool:
+            while scheduler.busy():
+                while in_flight < window:
+                    task = scheduler.next_task()
+                    if task is None:
+                        break
+                    pool.apply_async(_run_pooled, (task,), callback=done.put, error_callback=_error_callback(task, done))
+                    in_flight += 1
+                if in_flight == 0:
+                    break
+                record(done.get())
+                in_flight -= 1
+
+    summaries = [game.summary for game in queues.values()]
+    return BatchSummary(summaries, items, processes, time.perf_counter() - start)
+
+
+def _error_callback(task: Task, done: "queue.Queue[BatchItem]"):
+    kind, game, path = task[:3]
+
+    def report(exc: BaseException) -> None:
+        # Only reached when the worker itself broke (e.g. the result couldn't be pickled).
+        done.put(BatchItem(game, kind, Path(path), "error", error=capture(exc, kind)))
+
+    return report
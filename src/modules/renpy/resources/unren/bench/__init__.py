@@ -0,0 +1 @@
+"""Synthetic workloads and benchmarks for the UnRen tooling (not shipped with the app)."""
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+from .synth import rpa_bytes
+
+
+def build_library(root: Path, games: int, shared: int, unique: int, seed: int = 0) -> None:
+    """Games made from one template: the same GUI frames and font in every archive, plus art of their own."""
+    rng = random.Random(seed)
+    template = {f"gui/frame_{index}.png": rng.randbytes(rng.randint(64 << 10, 512 << 10)) for index in range(shared)}
+    template["fonts/DejaVuSans.ttf"] = rng.randbytes(700 << 10)
+    template["gui/icon.png"] = rng.randbytes(2 << 10)
+    for game in range(games):
+        files = dict(template)
+        files.update({f"images/cg_{game}_{index}.png": rng.randbytes(rng.randint(64 << 10, 512 << 10)) for index in range(unique)})
+        files[f"script_{game}.rpy"] = b"label start:\n    return\n" * 4096
+        path = root / f"Game{game}" / "game" / "archive.rpa"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(rpa_bytes(files))
+
+
+def extract_library(library: Path, output: Path, assets) -> Dict[str, int]:
+    """Extracts every game's archive through the same member writer as `unren extract`."""
+    from ..rpa import _write_member, read_rpa_index
+    from ..timings import Timings
+
+    timings = Timings()
+    for archive in sorted(library.glob("*/game/archive.rpa")):
+        _, index = read_rpa_index(archive)
+        data = archive.read_bytes()
+        for name, entries in index.items():
+            offset, length, prefix = entries[0]
+            contents = prefix + data[offset:offset + length - len(prefix)]
+            _write_member(output / archive.parent.parent.name / name, contents, timings, assets)
+    return timings.counters
+
+
+def _disk_usage(*roots: Path) -> int:
+    # Hard links are counted once.
+    seen = set()
+    total = 0
+    for root in roots:
+        for path in root.rglob("*"):
+            stat = path.lstat()
+            if path.is_file() and (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_blocks * 512
+    return total
+
+
+def _tree_digest(root: Path) -> str:
+    digest = hashlib.sha1()
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        digest.update(path.relative_to(root).as_posix().encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.assets",
+        description=(
+            "Extracts generated games that share template assets with plain writes and through an asset "
+            "store, reports time, bytes written and linked and disk use, then deletes half the trees and runs "
+            "gc; exits non-zero if the trees differ, a script was linked, or gc removes anything still "
+            "linked."
+        ),
+    )
+    parser.add_argument("--games", type=int, default=8)
+    parser.add_argument("--shared", type=int, default=40, help="Template assets in every game.")
+    parser.add_argument("--unique", type=int, default=10, help="Assets of each game's own.")
+    args = parser.parse_args(argv)
+
+    from ..rpa import open_asset_store
+
+    problems = []
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        library = temp_dir / "library"
+        build_library(library, args.games, args.shared, args.unique)
+
+        start = time.perf_counter()
+        plain_counters = extract_library(library, temp_dir / "plain", None)
+        plain_seconds = time.perf_counter() - start
+
+        store = open_asset_store(temp_dir / "store")
+        start = time.perf_counter()
+        store_counters = extract_library(library, temp_dir / "linked", store)
+        store_seconds = time.perf_counter() - start
+
+        plain_disk = _disk_usage(temp_dir / "plain")
+        store_disk = _disk_usage(temp_dir / "linked", store.root)
+        if _tree_digest(temp_dir / "plain") != _tree_digest(temp_dir / "linked"):
+            problems.append("linked trees differ from plain extraction")
+        script = next((temp_dir / "linked").glob("*/script_*.rpy"))
+        if script.stat().st_nlink != 1:
+            problems.append(f"{script.name} was linked into the store; scripts must stay plain files")
+
+        # Drop half the games, as deleting their extraction in the launcher would.
+        dropped = sorted((temp_dir / "linked").iterdir())[: args.games // 2]
+        for game in dropped:
+            shutil.rmtree(game)
+        remaining = _tree_digest(temp_dir / "linked")
+        kept_blobs = sum(1 for _ in store.iter_blobs())
+        collected = store.collect()
+        if _tree_digest(temp_dir / "linked") != remaining:
+            problems.append("gc changed a remaining game")
+        dropped_unique = len(dropped) * args.unique
+        if collected.blobs != dropped_unique:
+            problems.append(f"gc removed {collected.blobs} blobs, expected the dropped games' {dropped_unique}")
+        if store.collect().blobs:
+            problems.append("a second gc still found blobs to remove")
+
+    mb = 1 << 20
+    print(f"{args.games} games, {args.shared + 2} template assets and {args.unique} own assets each")
+    print(f"{'extract':>8} {'ms':>9} {'written MB':>11} {'linked MB':>10} {'disk MB':>8}")
+    print(f"{'plain':>8} {plain_seconds * 1000:>9.1f} {plain_counters.get('written_bytes', 0) / mb:>11.1f} {0:>10.1f} {plain_disk / mb:>8.1f}")
+    print(f"{'store':>8} {store_seconds * 1000:>9.1f} {store_counters.get('written_bytes', 0) / mb:>11.1f} "
+          f"{store_counters.get('linked_bytes', 0) / mb:>10.1f} {store_disk / mb:>8.1f}")
+    print(f"gc after dropping {len(dropped)} games: removed {collected.blobs} of {kept_blobs} blobs ({collected.freed / mb:.1f} MB)")
+    if store_disk >= plain_disk:
+        problems.append("the store did not lower disk use")
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from ..paths import repo_root
+from .extract_game import build_fixture, extract_game_steps
+from .startup import _env
+
+
+def _tree_digest(root: Path) -> str:
+    digest = hashlib.sha1()
+    for path in sorted(root.rglob("*.rpy")):
+        digest.update(path.relative_to(root).as_posix().encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def run_loop(games: List[Path], output: Path, mode: str, python: str) -> float:
+    """The shell loop batch replaces: the launcher's unren runs per game, one game at a time."""
+    env = _env(repo_root().parent)
+    start = time.perf_counter()
+    for root in games:
+        for _, args in extract_game_steps(root / "game", output / root.name, mode):
+            subprocess.run([python, "-m", "unren", *args], env=env, capture_output=True)
+    return time.perf_counter() - start
+
+
+def run_batch(games: List[Path], output: Path, mode: str, processes: int, python: str) -> dict:
+    summary = output / "summary.json"
+    start = time.perf_counter()
+    subprocess.run(
+        [python, "-m", "unren", "batch", "--mode", mode, "-o", str(output), "-p", str(processes),
+         "--summary", str(summary), *map(str, games)],
+        env=_env(repo_root().parent),
+        capture_output=True,
+    )
+    seconds = time.perf_counter() - start
+    report = json.loads(summary.read_text("utf-8"))
+    summary.unlink()
+    report["wall"] = seconds
+    return report
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.batch",
+        description=(
+            "Builds a library of generated games and compares unren batch with the per-game shell loop it "
+            "replaces (wall time, worker utilization), failing if their decompiled output differs."
+        ),
+    )
+    parser.add_argument("--games", type=int, default=6)
+    parser.add_argument("--assets", type=int, default=200, help="Image files per game (audio and gui get a tenth each).")
+    parser.add_argument("--scripts", type=int, default=20, help="Script files per game, half loose and half archived.")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--mode", default="auto", choices=["auto", "current", "legacy"])
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to run (use the embedded runtime).")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        games = []
+        for index in range(args.games):
+            root = temp_dir / "library" / f"Game{index}"
+            build_fixture(root, args.assets, args.scripts, seed=index)
+            games.append(root)
+
+        loop_seconds = run_loop(games, temp_dir / "loop", args.mode, args.python)
+        report = run_batch(games, temp_dir / "batch", args.mode, args.processes, args.python)
+
+        problems = []
+        for root in games:
+            loop_digest = _tree_digest(temp_dir / "loop" / root.name)
+            batch_digest = _tree_digest(temp_dir / "batch" / root.name)
+            if loop_digest != batch_digest:
+                problems.append(f"{root.name}: batch output {batch_digest} differs from the loop's {loop_digest}")
+
+    states = {}
+    for item in report["items"]:
+        states[item["state"]] = states.get(item["state"], 0) + 1
+    busy = sum(item["seconds"] for item in report["items"])
+    print(f"{args.games} games, {len(report['items'])} tasks ({', '.join(f'{k} {v}' for k, v in sorted(states.items()))})")
+    print(f"shell loop: {loop_seconds * 1000:>10.1f} ms")
+    print(f"batch -p {args.processes}: {report['wall'] * 1000:>10.1f} ms  ({loop_seconds / report['wall']:.2f}x)")
+    print(f"worker busy time {busy * 1000:.1f} ms, utilization {busy / (report['seconds'] * args.processes):.0%}")
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
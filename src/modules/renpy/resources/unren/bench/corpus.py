@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from .synth import RPYC_LAYOUTS, game_script, rpyc_bytes
+
+DEFAULT_SIZES = ("1K", "64K", "1M")
+_SIZE_RE = re.compile(r"^(\d+(?:\.\d+)?)([KMG]?)B?$", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+# Chapter settings for targets smaller than one full chapter.
+_SMALL_CHAPTER = {"items": 2, "depth": 1, "says": 1, "atl_steps": 1, "python_statements": 2}
+
+
+@dataclass
+class CorpusFile:
+    path: Path
+    layout: str
+    size: str
+    bytes: int
+
+
+def parse_size(value: str) -> int:
+    match = _SIZE_RE.match(value.strip())
+    if match is None:
+        raise ValueError(f"Bad size: {value!r} (expected e.g. 512, 64K, 50M)")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def script_for_size(target: int, seed: int = 0) -> List:
+    """Returns a game_script whose RPYC2 file comes out close to target bytes."""
+    sample = 8
+    per_chapter = len(rpyc_bytes(game_script(sample, seed))) / sample
+    if target < per_chapter:
+        return game_script(1, seed, **_SMALL_CHAPTER)
+    return game_script(max(1, round(target / per_chapter)), seed)
+
+
+def write_corpus(
+    dest: Path,
+    sizes: Sequence[str] = DEFAULT_SIZES,
+    layouts: Sequence[str] = RPYC_LAYOUTS,
+    files: int = 1,
+    seed: int = 0,
+) -> List[CorpusFile]:
+    """Writes dest/game/<layout>/<size>_<n>.rpyc for every size, layout and file number."""
+    corpus: List[CorpusFile] = []
+    for size in sizes:
+        target = parse_size(size)
+        for number in range(files):
+            nodes = script_for_size(target, seed + number)
+            for layout in layouts:
+                path = dest / "game" / layout / f"{size}_{number}.rpyc"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                data = rpyc_bytes(nodes, layout=layout)
+                path.write_bytes(data)
+                corpus.append(CorpusFile(path, layout, size, len(data)))
+    return corpus
+
+
+def corpus_summary(corpus: Sequence[CorpusFile]) -> Dict[str, int]:
+    totals: Dict[str, int] = {}
+    for item in corpus:
+        totals[item.layout] = totals.get(item.layout, 0) + item.bytes
+    return totals
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.corpus",
+        description=(
+            "Writes a synthetic game (defines, ATL transforms and images, SL2 screens, init python blocks, "
+            "labels with nested menus) as .rpyc files of roughly the given sizes, in the rpyc1, rpyc2, "
+            "rpyc2-hash, rpyc2-py2 (Ren'Py 7 style Python 2 pickle) and obfuscated layouts."
+        ),
+    )
+    parser.add_argument("-o", "--output", required=True, help="Directory to write the corpus into.")
+    parser.add_argument("--sizes", nargs="+", default=list(DEFAULT_SIZES), help="Target file sizes (e.g. 1K 64K 1M 50M).")
+    parser.add_argument("--layouts", nargs="+", choices=RPYC_LAYOUTS, default=list(RPYC_LAYOUTS))
+    parser.add_argument("--files", type=int, default=1, help="Files per size and layout.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    corpus = write_corpus(Path(args.output).expanduser(), args.sizes, args.layouts, args.files, args.seed)
+    for item in corpus:
+        print(f"{item.bytes:>12,}  {item.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import sys
+import time
+from typing import Optional, Sequence
+
+from ..vendor import import_unrpyc_legacy_decompiler
+from .synth import menu_heavy_script
+
+
+def render(ast, init_offset: bool = True) -> str:
+    decompiler_module = import_unrpyc_legacy_decompiler()
+    options = decompiler_module.Options(log=[], init_offset=init_offset)
+    out = io.StringIO()
+    decompiler_module.pprint(out, ast, options)
+    return out.getvalue()
+
+
+def time_render(ast, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render(ast)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.decompiler",
+        description=(
+            "Renders a synthetic menu-heavy script at each --depth and prints timings plus an output hash."
+        ),
+    )
+    parser.add_argument("--labels", type=int, default=40)
+    parser.add_argument("--items", type=int, default=4)
+    parser.add_argument("--depth", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--says", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'depth':>5} {'lines':>8} {'bytes':>10} {'best ms':>10}  sha1")
+    for depth in args.depth:
+        ast = menu_heavy_script(args.labels, args.items, depth, args.says)
+        text = render(ast)
+        elapsed = time_render(ast, args.repeat)
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        print(f"{depth:>5} {text.count(chr(10)):>8} {len(text):>10} {elapsed * 1000:>10.2f}  {digest}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional, Sequence
+
+from .batch import _tree_digest
+from .synth import game_script, rpyc_bytes
+
+
+def build_roots(game_dir: Path, extract_root: Path, scripts: int, chapters: int) -> None:
+    """
+    A game dir with loose scripts and an extraction root as the archives would leave it: every
+    script again at the same path, a copy under patch/ and, for every third one, under an old/ name.
+    """
+    for index in range(scripts):
+        data = rpyc_bytes(game_script(chapters, seed=index))
+        for path in (game_dir / f"script_{index}.rpyc", extract_root / f"script_{index}.rpyc", extract_root / "patch" / f"script_{index}.rpyc"):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        if index % 3 == 0:
+            path = extract_root / "old" / f"chapter_{index}.rpyc"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.dedup",
+        description=(
+            "Builds a game dir and an extraction root that ship each script several times (same path, patch/ "
+            "and old/ copies) and compares two separate decompile runs with one multi-root run per "
+            "--duplicates mode; exits non-zero if the outputs differ or a script is decompiled more than once "
+            "with deduplication."
+        ),
+    )
+    parser.add_argument("--scripts", type=int, default=30)
+    parser.add_argument("--chapters", type=int, default=2, help="Chapters per script (size of each output).")
+    args = parser.parse_args(argv)
+
+    from ..rpyc import decompile_paths
+
+    problems = []
+    rows = []
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        game_dir = temp_dir / "game"
+        source_root = temp_dir / "extracted"
+        build_roots(game_dir, source_root, args.scripts, args.chapters)
+        digests = {}
+        for label, duplicates in (("two runs", "off"), ("off", "off"), ("copy", "copy"), ("link", "link")):
+            extract_root = temp_dir / label
+            shutil.copytree(source_root, extract_root)
+            start = time.perf_counter()
+            if label == "two runs":
+                # What the launcher ran before: the game dir, then the extraction root.
+                results = decompile_paths([game_dir], output_dir=extract_root, base_dir=game_dir, duplicates=duplicates)
+                results += decompile_paths([extract_root], output_dir=extract_root, base_dir=extract_root, duplicates=duplicates)
+            else:
+                results = decompile_paths(
+                    [game_dir, extract_root],
+                    output_dir=extract_root,
+                    base_dirs=[game_dir, extract_root],
+                    duplicates=duplicates,
+                )
+            seconds = time.perf_counter() - start
+            decompiled = sum(result.state == "ok" and result.duplicate_of is None for result in results)
+            deduplicated = sum(result.duplicate_of is not None for result in results)
+            failed = [result for result in results if result.state not in ("ok", "skip")]
+            if failed:
+                problems.append(f"{label}: {len(failed)} files failed, first {failed[0].input_path}: {failed[0].error}")
+            digests[label] = _tree_digest(extract_root)
+            rows.append((label, seconds, decompiled, deduplicated))
+
+    print(f"{args.scripts} scripts, each also archived at the same path and under patch/, every third under old/")
+    print(f"{'run':>9} {'ms':>9} {'decompiled':>11} {'deduplicated':>13}")
+    for label, seconds, decompiled, deduplicated in rows:
+        print(f"{label:>9} {seconds * 1000:>9.1f} {decompiled:>11} {deduplicated:>13}")
+
+    for label, digest in digests.items():
+        if digest != digests["two runs"]:
+            problems.append(f"{label}: output {digest} differs from the two runs' {digests['two runs']}")
+    counts = {label: decompiled for label, _, decompiled, _ in rows}
+    if counts["copy"] != args.scripts or counts["link"] != args.scripts:
+        problems.append(f"expected {args.scripts} decompiles with deduplication, got {counts['copy']} (copy) and {counts['link']} (link)")
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
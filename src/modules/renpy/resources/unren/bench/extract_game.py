@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from ..paths import repo_root
+from .startup import _env
+from .synth import game_script, rpa_bytes, rpyc_bytes
+
+# Runs `python -m unren ...` and saves the kernel's I/O counters for the process on exit.
+# /proc/self/io only exists on Linux; elsewhere the rusage block counts are all there is.
+_CHILD = """
+import atexit, json, runpy, sys
+report, sys.argv = sys.argv[1], ["unren"] + sys.argv[2:]
+def _save():
+    try:
+        with open("/proc/self/io") as f:
+            io = dict((k, int(v)) for k, v in (line.split(":") for line in f))
+    except OSError:
+        io = {}
+    with open(report, "w") as f:
+        json.dump(io, f)
+atexit.register(_save)
+runpy.run_module("unren", run_name="__main__", alter_sys=True)
+"""
+
+
+def build_fixture(root: Path, assets: int = 2000, scripts: int = 40, seed: int = 0) -> Dict[str, int]:
+    """
+    Writes a game the way extractGame sees it: root/game with loose .rpyc files, an images and an
+    audio archive, a scripts archive, and an archive with a non-standard extension that only
+    --detect-all finds.
+    """
+    rng = random.Random(seed)
+    game = root / "game"
+    game.mkdir(parents=True, exist_ok=True)
+
+    loose = scripts // 2
+    for index in range(loose):
+        (game / f"script_{index}.rpyc").write_bytes(rpyc_bytes(game_script(2, seed + index)))
+    packed = {
+        f"chapters/chapter_{index}.rpyc": rpyc_bytes(game_script(2, seed + loose + index))
+        for index in range(scripts - loose)
+    }
+    images = {f"images/bg_{index}.png": rng.randbytes(rng.randint(1 << 10, 16 << 10)) for index in range(assets)}
+    audio = {f"audio/track_{index}.ogg": rng.randbytes(rng.randint(16 << 10, 64 << 10)) for index in range(assets // 10)}
+    data = {f"gui/frame_{index}.png": rng.randbytes(rng.randint(1 << 10, 4 << 10)) for index in range(assets // 10)}
+
+    (game / "scripts.rpa").write_bytes(rpa_bytes(packed))
+    (game / "images.rpa").write_bytes(rpa_bytes(images))
+    (game / "audio.rpa").write_bytes(rpa_bytes(audio))
+    (game / "data.dat").write_bytes(rpa_bytes(data))
+    return {
+        "loose_scripts": loose,
+        "archived_scripts": len(packed),
+        "archived_assets": len(images) + len(audio) + len(data),
+        "bytes": sum(path.stat().st_size for path in game.rglob("*") if path.is_file()),
+    }
+
+
+def extract_game_steps(game_dir: Path, extract_root: Path, mode: str = "auto") -> List[tuple]:
+    """The unren invocations of extractGame in renpy/main.js, in order."""
+    return [
+        ("extract", ["extract", "--mode", "all", "--output", str(extract_root), "--base-dir", str(game_dir),
+                     "--detect-all", str(game_dir)]),
+        ("decompile", ["decompile", "--mode", mode, "--output", str(extract_root), "--base-dir", str(game_dir),
+                       "--base-dir", str(extract_root), str(game_dir), str(extract_root)]),
+    ]
+
+
+def _tree_stats(root: Path) -> Dict[str, int]:
+    stats = {"files": 0, "bytes": 0, "rpy": 0, "rpyc": 0}
+    if not root.is_dir():
+        return stats
+    for path in root.rglob("*"):
+        if not path.is_file():
+            continue
+        stats["files"] += 1
+        stats["bytes"] += path.stat().st_size
+        suffix = path.suffix.lower()
+        if suffix in (".rpy", ".rpyc"):
+            stats[suffix[1:]] += 1
+    return stats
+
+
+def _rusage():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_CHILDREN)
+
+
+def run_step(name: str, args: Sequence[str], python_path: Path, extract_root: Path, report: Path,
+             python: str = sys.executable) -> Dict:
+    before_tree = _tree_stats(extract_root)
+    before = _rusage()
+    start = time.perf_counter()
+    result = subprocess.run([python, "-c", _CHILD, str(report), *args], env=_env(python_path),
+                            capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    after = _rusage()
+    after_tree = _tree_stats(extract_root)
+
+    step = {
+        "step": name,
+        "args": list(args),
+        "exit": result.returncode,
+        "wall_ms": round(wall * 1000, 1),
+        "io": json.loads(report.read_text()) if report.exists() else {},
+        "files": {key: after_tree[key] - before_tree[key] for key in after_tree},
+        "errors": sum(1 for line in result.stdout.splitlines() if " -> error: " in line),
+    }
+    if before is not None and after is not None:
+        step["cpu_ms"] = round((after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime) * 1000, 1)
+        step["blocks_in"] = after.ru_inblock - before.ru_inblock
+        step["blocks_out"] = after.ru_oublock - before.ru_oublock
+    if result.returncode != 0 and result.stderr:
+        step["stderr"] = result.stderr.strip().splitlines()[-1]
+    return step
+
+
+def _regressions(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    found = []
+    previous = {step["step"]: step for step in baseline.get("steps", [])}
+    for step in report["steps"]:
+        old = previous.get(step["step"])
+        if old is None or not old["wall_ms"]:
+            continue
+        if step["wall_ms"] > old["wall_ms"] * (1 + tolerance):
+            found.append(f"{step['step']} {step['wall_ms']:.0f} ms > {old['wall_ms']:.0f} ms baseline")
+    if baseline.get("total_ms") and report["total_ms"] > baseline["total_ms"] * (1 + tolerance):
+        found.append(f"total {report['total_ms']:.0f} ms > {baseline['total_ms']:.0f} ms baseline")
+    return found
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.extract_game",
+        description=(
+            "Replays the launcher's extractGame sequence (extract with --detect-all, then one decompile of "
+            "the game dir and the extraction root) through the unren CLI on a generated game with thousands "
+            "of archived assets, and reports wall/CPU time, I/O volume and syscall counts (Linux "
+            "/proc/self/io), block I/O and new files per step."
+        ),
+    )
+    parser.add_argument("--assets", type=int, default=2000, help="Image files in the fixture (audio and gui get a tenth each).")
+    parser.add_argument("--scripts", type=int, default=40, help="Script files in the fixture, half loose and half archived.")
+    parser.add_argument("--mode", default="auto", choices=["auto", "current", "legacy"], help="Decompile mode (extractGame uses auto).")
+    parser.add_argument("--bundle", help="Run from a bundle (unren.zip or its directory) instead of the source tree.")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to run (use the embedded runtime).")
+    parser.add_argument("--json", help="Write the report to this file.")
+    parser.add_argument("--history", help="Append the report as one JSON line to this file.")
+    parser.add_argument("--baseline", help="Report from an earlier run; steps slower than it by --tolerance fail.")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    python_path = repo_root().parent
+    if args.bundle:
+        bundle = Path(args.bundle).expanduser()
+        python_path = bundle / "unren.zip" if bundle.is_dir() and (bundle / "unren.zip").exists() else bundle
+
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        fixture = build_fixture(temp_dir / "Game", args.assets, args.scripts)
+        game_dir = temp_dir / "Game" / "game"
+        extract_root = temp_dir / "extracted"
+        extract_root.mkdir()
+
+        steps = []
+        print(f"{'step':>20} {'exit':>4} {'wall ms':>10} {'cpu ms':>10} {'read MB':>8} {'write MB':>8} {'syscalls':>9} {'files':>6} {'errors':>6}")
+        for name, step_args in extract_game_steps(game_dir, extract_root, args.mode):
+            step = run_step(name, step_args, python_path, extract_root, temp_dir / f"{name}.io.json", args.python)
+            steps.append(step)
+            io = step["io"]
+            read_mb = f"{io['rchar'] / (1 << 20):.1f}" if "rchar" in io else "-"
+            write_mb = f"{io['wchar'] / (1 << 20):.1f}" if "wchar" in io else "-"
+            syscalls = io.get("syscr", 0) + io.get("syscw", 0) if io else "-"
+            print(f"{name:>20} {step['exit']:>4} {step['wall_ms']:>10.1f} {step.get('cpu_ms', 0):>10.1f} "
+                  f"{read_mb:>8} {write_mb:>8} {syscalls:>9} {step['files']['files']:>6} {step['errors']:>6}")
+            if "stderr" in step:
+                print(f"{'':>20} {step['stderr']}")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": sys.platform,
+        "bundle": bool(args.bundle),
+        "mode": args.mode,
+        "fixture": fixture,
+        "steps": steps,
+        "total_ms": round(sum(step["wall_ms"] for step in steps), 1),
+    }
+    print(f"total {report['total_ms']:.1f} ms")
+    if args.json:
+        Path(args.json).expanduser().write_text(json.dumps(report, indent=2), "utf-8")
+    if args.history:
+        with Path(args.history).expanduser().open("a", encoding="utf-8") as history:
+            history.write(json.dumps(report) + "\n")
+
+    failures = [f"{step['step']} exited with {step['exit']}" for step in steps if step["exit"] != 0]
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).expanduser().read_text("utf-8"))
+        failures.extend(_regressions(report, baseline, args.tolerance))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
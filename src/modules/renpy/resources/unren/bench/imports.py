@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from ..bundle import build_bundle
+from .startup import import_report, load_budget
+from .synth import rpa_bytes
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.imports",
+        description=(
+            "Checks that unren detect and unren list stay under the import-time budget in bench/budget.json "
+            "and never import the decompiler stacks."
+        ),
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command; the fastest one is checked.")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to measure (use the embedded runtime).")
+    args = parser.parse_args(argv)
+
+    budget = load_budget()["imports"]
+    failures: List[str] = []
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        game = temp_dir / "game"
+        game.mkdir()
+        (game / "archive.rpa").write_bytes(rpa_bytes({"script.rpyc": b"", "images/bg.png": b""}))
+        bundle = build_bundle(temp_dir / "bundle", zipped=True)
+        commands = {
+            "detect": ["detect", str(game)],
+            "list": ["list", "--files", str(game)],
+        }
+
+        print(f"{'command':>8} {'import ms':>10} {'budget':>8}  modules")
+        for label, command in commands.items():
+            reports = [import_report(bundle, command, args.python) for _ in range(args.runs)]
+            total = min(sum(self_us for _, self_us in report) for report in reports) / 1000
+            modules = {name for name, _ in reports[0]}
+            ours = sorted(name for name in modules if name.split(".")[0].startswith("unren"))
+            print(f"{label:>8} {total:>10.1f} {budget[f'{label}_ms']:>8}  {', '.join(ours)}")
+
+            if total > budget[f"{label}_ms"]:
+                failures.append(f"{label} imports {total:.1f} ms > {budget[f'{label}_ms']} ms")
+            for name in sorted(modules):
+                if any(name == blocked or name.startswith(blocked + ".") for blocked in budget["forbidden"]):
+                    failures.append(f"{label} imports {name}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional, Sequence
+
+from .store import build_game
+from .synth import game_script, rpyc_bytes
+
+QUERIES = ("chapter_3", "points", "Choice", "flag_2")
+
+
+def grep(root: Path, term: str) -> int:
+    """What the index replaces: reading every decompiled file for lines holding term."""
+    hits = 0
+    for path in root.rglob("*.rpy"):
+        with path.open(encoding="utf-8") as handle:
+            hits += sum(term in line for line in handle)
+    return hits
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.index",
+        description=(
+            "Indexes a generated game, then again unchanged, after changing one script and after deleting "
+            "one, and compares search with reading every decompiled file for a few terms; exits non-zero if a "
+            "run reads the wrong number of files or an indexed label or say line isn't at its line in the "
+            "decompiled output."
+        ),
+    )
+    parser.add_argument("--files", type=int, default=100, help="Scripts in the generated game.")
+    parser.add_argument("--chapters", type=int, default=4, help="Chapters per script.")
+    args = parser.parse_args(argv)
+
+    from ..rpyc_legacy import decompile_paths_legacy
+    from ..searchindex import build_index, search_index
+
+    problems = []
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        game = temp_dir / "game"
+        decompiled = temp_dir / "decompiled"
+        db_path = temp_dir / "index.sqlite"
+        build_game(game, args.files, args.chapters)
+        decompile_paths_legacy([game], output_dir=decompiled, base_dir=game)
+
+        runs = []
+
+        def run(label: str, expect_indexed: int, expect_removed: int = 0) -> None:
+            start = time.perf_counter()
+            summary = build_index([game], db_path, processes=1)
+            seconds = time.perf_counter() - start
+            indexed = sum(result.state == "ok" for result in summary.results)
+            failed = [result for result in summary.results if result.state == "error"]
+            runs.append((label, seconds, indexed, summary.removed))
+            if failed:
+                problems.append(f"{label}: {failed[0].input_path}: {failed[0].error}")
+            if (indexed, summary.removed) != (expect_indexed, expect_removed):
+                problems.append(f"{label}: indexed {indexed} and removed {summary.removed}, expected {expect_indexed} and {expect_removed}")
+
+        run("full", args.files)
+        run("unchanged", 0)
+        (game / "chapter1" / "script_1.rpyc").write_bytes(rpyc_bytes(game_script(args.chapters, seed=10_000)))
+        run("one changed", 1)
+        (game / "chapter2" / "script_2.rpyc").unlink()
+        run("one deleted", 0, 1)
+        # The decompiled tree should match what is indexed again.
+        decompile_paths_legacy([game], output_dir=decompiled, base_dir=game, overwrite=True)
+        (decompiled / "chapter2" / "script_2.rpy").unlink()
+
+        rows = []
+        for term in QUERIES:
+            start = time.perf_counter()
+            grep_hits = grep(decompiled, term)
+            grep_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            search_index(db_path, term)
+            search_seconds = time.perf_counter() - start
+            hits = len(search_index(db_path, term, limit=1_000_000))
+            rows.append((term, grep_seconds, grep_hits, search_seconds, hits))
+
+        # Entries carry Ren'Py's line numbers, which the decompiler reproduces; it can only fall a
+        # few lines behind where the generated python blocks are longer than their numbering.
+        for hit in search_index(db_path, "chapter_3", kinds=["label", "say"], limit=1_000_000):
+            lines = (decompiled / hit.path).read_text("utf-8").splitlines()
+            wanted = f"label {hit.name}:" if hit.kind == "label" else hit.text
+            if not any(wanted in line for line in lines[hit.line - 1:hit.line + 2]):
+                problems.append(f"{hit.path}:{hit.line} is {lines[hit.line - 1].strip()!r}, expected {wanted!r}")
+                break
+        labels = search_index(db_path, "chapter_3", kinds=["label"], limit=1_000_000)
+        if len(labels) != grep(decompiled, "label chapter_3:"):
+            problems.append(f"{len(labels)} chapter_3 labels indexed, the decompiled files have {grep(decompiled, 'label chapter_3:')}")
+
+    print(f"{args.files} scripts, {args.chapters} chapters each")
+    print(f"{'index run':>12} {'ms':>9} {'indexed':>8} {'removed':>8}")
+    for label, seconds, indexed, removed in runs:
+        print(f"{label:>12} {seconds * 1000:>9.1f} {indexed:>8} {removed:>8}")
+    print("search: the best 50 hits; hits counts all of them (case-insensitive, by word, unlike grep)")
+    print(f"{'query':>12} {'grep ms':>9} {'lines':>7} {'search ms':>10} {'hits':>7}")
+    for term, grep_seconds, grep_hits, search_seconds, hits in rows:
+        print(f"{term:>12} {grep_seconds * 1000:>9.1f} {grep_hits:>7} {search_seconds * 1000:>10.2f} {hits:>7}")
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
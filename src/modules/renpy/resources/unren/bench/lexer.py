@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import sys
+import time
+from typing import Callable, Optional, Sequence
+
+from ..vendor import import_unrpyc_legacy_decompiler
+from .synth import dialogue_corpus, expression_corpus, python_block_source
+
+
+def best_of(func: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.lexer",
+        description=(
+            "Times the decompiler lexer helpers on synthetic python blocks, expressions and dialogue."
+        ),
+    )
+    parser.add_argument("--statements", type=int, default=2000)
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    util = import_unrpyc_legacy_decompiler().util
+    source = python_block_source(args.statements)
+    expressions = expression_corpus(args.count)
+    dialogue = dialogue_corpus(args.count)
+
+    cases = (
+        ("split_logical_lines", lambda: util.split_logical_lines(source)),
+        ("simple_expression_guard", lambda: [util.simple_expression_guard(s) for s in expressions]),
+        ("encode_say_string", lambda: [util.encode_say_string(s) for s in dialogue]),
+        ("string_escape", lambda: [util.string_escape(s) for s in dialogue]),
+    )
+
+    print(f"{'function':<24} {'best ms':>10}  sha1")
+    for name, func in cases:
+        digest = hashlib.sha1(repr(func()).encode("utf-8")).hexdigest()[:12]
+        print(f"{name:<24} {best_of(func, args.repeat) * 1000:>10.2f}  {digest}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import argparse
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from ..limits import Limits
+from .synth import _rpyc2_bytes, game_script, rpyc_bytes
+
+# Caps used for the hostile files, low enough that each case runs in a moment.
+TEST_LIMITS = Limits(max_decompressed=64 << 20, max_objects=200_000, max_memo=100_000, max_depth=1_000)
+
+
+def zlib_bomb(size: int, layout: str = "rpyc2") -> bytes:
+    """An rpyc whose slot 1 (or whole file, for rpyc1) inflates to size zero bytes."""
+    compressor = zlib.compressobj(9)
+    chunk = bytes(1 << 20)
+    blob = b"".join(compressor.compress(chunk) for _ in range(size >> 20)) + compressor.flush()
+    return blob if layout == "rpyc1" else _rpyc2_bytes(b"RENPY RPC2", [blob], b"\0")
+
+
+def pickle_rpyc(body: bytes) -> bytes:
+    # The trailing byte lets the deobfuscator's extractors accept slot 1.
+    return _rpyc2_bytes(b"RENPY RPC2", [zlib.compress(b"\x80\x02" + body + b".")], b"\0")
+
+
+def object_bomb(count: int) -> bytes:
+    # MARK, count empty lists, TUPLE.
+    return pickle_rpyc(b"(" + b"]" * count + b"t")
+
+
+def memo_bomb(count: int) -> bytes:
+    # MARK, count Nones each memoized under a new index, TUPLE.
+    return pickle_rpyc(b"(" + b"N\x94" * count + b"t")
+
+
+def depth_bomb(count: int) -> bytes:
+    # count nested MARKs closed into nested tuples.
+    return pickle_rpyc(b"(" * count + b"t" * count)
+
+
+def list_depth_bomb(count: int) -> bytes:
+    # count empty lists, each appended into the one below it: no MARKs at all.
+    return pickle_rpyc(b"]" * count + b"a" * (count - 1))
+
+
+def tuple_depth_bomb(count: int) -> bytes:
+    # An empty tuple wrapped count times with TUPLE1, so the stack never grows.
+    return pickle_rpyc(b")" + b"\x85" * count)
+
+
+def memo_depth_bomb(count: int) -> bytes:
+    # A chain grown from the top: fetch the last list from the memo, append a new one, memoize it.
+    body = bytearray(b"]r" + struct.pack("<I", 0))
+    for index in range(1, count):
+        body += b"j" + struct.pack("<I", index - 1) + b"]r" + struct.pack("<I", index) + b"a0"
+    return pickle_rpyc(bytes(body))
+
+
+def _cases(bomb_size: int) -> List[tuple]:
+    # name, file contents, read options, expected state, expected limit
+    return [
+        ("game", rpyc_bytes(game_script(4)), {}, "ok", None),
+        ("zlib-rpyc2", zlib_bomb(bomb_size), {}, "limit_exceeded", "max_decompressed"),
+        ("zlib-rpyc1", zlib_bomb(bomb_size, "rpyc1"), {}, "limit_exceeded", "max_decompressed"),
+        ("zlib-deobfuscate", zlib_bomb(bomb_size), {"try_harder": True, "auto_retry": False}, "limit_exceeded", "max_decompressed"),
+        ("objects", object_bomb(TEST_LIMITS.max_objects * 2), {}, "limit_exceeded", "max_objects"),
+        ("memo", memo_bomb(TEST_LIMITS.max_memo * 2), {}, "limit_exceeded", "max_memo"),
+        ("depth", depth_bomb(TEST_LIMITS.max_depth * 2), {}, "limit_exceeded", "max_depth"),
+        ("depth-lists", list_depth_bomb(TEST_LIMITS.max_depth * 2), {}, "limit_exceeded", "max_depth"),
+        ("depth-tuples", tuple_depth_bomb(TEST_LIMITS.max_depth * 2), {}, "limit_exceeded", "max_depth"),
+        ("depth-memo", memo_depth_bomb(TEST_LIMITS.max_depth * 2), {}, "limit_exceeded", "max_depth"),
+        ("objects-deobfuscate", object_bomb(TEST_LIMITS.max_objects * 2), {"try_harder": True, "auto_retry": False}, "limit_exceeded", "max_objects"),
+    ]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.limits",
+        description=(
+            "Feeds the legacy stack zlib bombs (rpyc1, rpyc2 and through the deobfuscator) and pickles with "
+            "too many objects, memo entries or nesting levels (nested MARKs, and lists and tuples nested "
+            "without MARKs, bottom-up and from the top through the memo), and exits non-zero unless each one "
+            "ends in limit_exceeded within twice the decompression cap of memory."
+        ),
+    )
+    parser.add_argument("--bomb-mb", type=int, default=1024, help="Size the zlib bombs inflate to without limits.")
+    parser.add_argument("--slack-mb", type=int, default=32, help="Allowed peak memory above twice max_decompressed.")
+    args = parser.parse_args(argv)
+
+    from ..rpyc_legacy import decompile_paths_legacy
+
+    problems = []
+    # zlib joins its output blocks into the result, so a capped decompress peaks at twice the cap.
+    peak_limit = 2 * TEST_LIMITS.max_decompressed + (args.slack_mb << 20)
+    print(f"{'case':>20} {'state':>15} {'ms':>8} {'peak MB':>8}  error")
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        for name, data, options, expected_state, expected_limit in _cases(args.bomb_mb << 20):
+            path = temp_dir / name / "script.rpyc"
+            path.parent.mkdir()
+            path.write_bytes(data)
+            del data
+
+            start = time.perf_counter()
+            tracemalloc.start()
+            (result,) = decompile_paths_legacy([path], output_dir=temp_dir / "out" / name, limits=TEST_LIMITS, **options)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            elapsed = time.perf_counter() - start
+
+            message = result.error.message if result.error is not None else ""
+            print(f"{name:>20} {result.state:>15} {elapsed * 1000:>8.1f} {peak / (1 << 20):>8.1f}  {message}")
+            if result.state != expected_state:
+                problems.append(f"{name}: expected {expected_state}, got {result.state} ({message})")
+            elif expected_limit is not None and not message.startswith(expected_limit):
+                problems.append(f"{name}: expected {expected_limit}, got {message}")
+            if peak > peak_limit:
+                problems.append(f"{name}: peak memory {peak / (1 << 20):.0f} MB over {peak_limit / (1 << 20):.0f} MB")
+
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Optional, Sequence
+
+from .synth import AstBuilder, game_script, rpyc_bytes
+
+# Retained memory per failed file that still counts as flat: the result and its error record
+# (whose traceback errors.TRACEBACK_CHARS caps) only.
+DEFAULT_PER_FAILURE = 3 << 10
+
+
+def failing_rpyc(chapters: int = 1) -> bytes:
+    """An rpyc that unpickles fine and then fails on the first statement the decompiler prints."""
+    nodes = game_script(chapters)
+    nodes.insert(0, AstBuilder().say("e", None))
+    return rpyc_bytes(nodes)
+
+
+def _fill(corpus: Path, count: int, data: bytes) -> None:
+    corpus.mkdir(parents=True, exist_ok=True)
+    first = corpus / "broken_0.rpyc"
+    first.write_bytes(data)
+    for index in range(1, count):
+        target = corpus / f"broken_{index}.rpyc"
+        try:
+            os.link(first, target)
+        except OSError:
+            shutil.copyfile(first, target)
+
+
+def _live_ast_nodes() -> int:
+    return sum(1 for obj in gc.get_objects() if type(obj).__module__.startswith("renpy."))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.memory",
+        description=(
+            "Decompiles N copies of a script that fails after unpickling, keeps every result, and exits "
+            "non-zero if retained memory grows by more than --per-failure bytes per failure or any AST node "
+            "outlives its decompile."
+        ),
+    )
+    parser.add_argument("--failures", type=int, default=2000)
+    parser.add_argument("--chapters", type=int, default=1, help="Size of each failing script.")
+    parser.add_argument("--per-failure", type=int, default=DEFAULT_PER_FAILURE, help="Allowed growth per failure in bytes.")
+    args = parser.parse_args(argv)
+
+    from ..rpyc_legacy import iter_decompile_paths_legacy
+
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        data = failing_rpyc(args.chapters)
+        _fill(temp_dir / "game", args.failures, data)
+
+        # Keep every result, as an API caller would; the errors must not keep their ASTs.
+        results = []
+        warmup = max(1, args.failures // 10)
+        baseline = None
+        start = time.perf_counter()
+        tracemalloc.start()
+        for result in iter_decompile_paths_legacy([temp_dir / "game"], output_dir=temp_dir / "out", overwrite=True):
+            results.append(result)
+            if len(results) == warmup:
+                baseline = tracemalloc.get_traced_memory()[0]
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        elapsed = time.perf_counter() - start
+
+    failures = sum(1 for result in results if result.state == "error")
+    growth = current - (baseline or current)
+    per_failure = growth / max(1, failures - warmup)
+    live = _live_ast_nodes()
+    print(f"{failures} failures of {len(data):,} byte files in {elapsed:.1f} s")
+    print(f"traced memory: {baseline or 0:,} after {warmup}, {current:,} at the end, peak {peak:,}")
+    print(f"growth per failure: {per_failure:,.0f} bytes (allowed {args.per_failure:,}); live AST nodes: {live}")
+
+    problems = []
+    if failures != args.failures:
+        problems.append(f"expected {args.failures} failures, got {failures}")
+    if per_failure > args.per_failure:
+        problems.append(f"memory grows by {per_failure:,.0f} bytes per failure")
+    if live:
+        problems.append(f"{live} AST nodes are still alive")
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
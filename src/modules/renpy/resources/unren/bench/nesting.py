@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import argparse
+import importlib
+import io
+import sys
+import time
+from typing import Callable, Optional, Sequence
+
+from ..vendor import import_unrpyc_legacy_decompiler
+from .decompiler import render
+from .synth import nested_script
+
+
+def _dump(ast) -> str:
+    out = io.StringIO()
+    import_unrpyc_legacy_decompiler().astdump.pprint(out, ast)
+    return out.getvalue()
+
+
+def _translate(ast) -> None:
+    decompiler_module = import_unrpyc_legacy_decompiler()
+    translate = importlib.import_module(decompiler_module.__name__ + ".translate")
+    translate.Translator("english").translate_dialogue(ast)
+
+
+def _attempt(func: Callable[[], object]) -> str:
+    start = time.perf_counter()
+    try:
+        func()
+    except RecursionError:
+        return "RecursionError"
+    except Exception as e:  # noqa: BLE001
+        return type(e).__name__
+    return f"{(time.perf_counter() - start) * 1000:.1f} ms"
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.nesting",
+        description=(
+            "Decompiles, dumps and translates deeply nested scripts and exits non-zero if any of them fail."
+        ),
+    )
+    parser.add_argument("--depth", type=int, nargs="+", default=[100, 400, 2000])
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'depth':>6} {'decompile':>16} {'astdump':>16} {'translate':>16}")
+    for depth in args.depth:
+        ast = nested_script(depth)
+        results = [
+            _attempt(lambda: render(ast)),
+            _attempt(lambda: _dump(ast)),
+            _attempt(lambda: _translate(nested_script(depth))),
+        ]
+        failed = failed or any(not result.endswith(" ms") for result in results)
+        print(f"{depth:>6} " + " ".join(f"{result:>16}" for result in results))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
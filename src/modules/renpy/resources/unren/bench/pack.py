@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+from .synth import game_script, rpa_bytes, rpyc_bytes
+
+
+def build_game(game_dir: Path, files: int, seed: int = 0) -> Dict[str, bytes]:
+    """
+    A game dir as a modded or extracted game leaves it: thousands of loose images and sounds, a
+    few scripts, an original archive whose files were also extracted next to it, and one loose
+    file that replaces the archived copy. Returns what Ren'Py should load for every name.
+    """
+    rng = random.Random(seed)
+    loose: Dict[str, bytes] = {}
+    for index in range(files):
+        folder = ("images/bg", "images/cg", "images/sprites", "audio/sfx")[index % 4]
+        ext = ".ogg" if folder.startswith("audio") else ".png"
+        loose[f"{folder}/file_{index}{ext}"] = rng.randbytes(rng.randint(1 << 10, 24 << 10))
+    for index in range(8):
+        loose[f"script_{index}.rpyc"] = rpyc_bytes(game_script(1, seed=index))
+        loose[f"script_{index}.rpy"] = b"label start:\n    return\n"
+    loose["gui/frame.png"] = loose["images/bg/file_0.png"]
+
+    archived = {f"images/bg/file_{index}.png": loose[f"images/bg/file_{index}.png"] for index in range(0, files, 4)}
+    archived["images/cg/old.png"] = rng.randbytes(4 << 10)
+    loose["images/cg/old.png"] = rng.randbytes(4 << 10)
+    (game_dir / "saves").mkdir(parents=True)
+    (game_dir / "saves" / "persistent").write_bytes(b"\0" * 64)
+    (game_dir / "archive.rpa").write_bytes(rpa_bytes(archived))
+    for name, data in loose.items():
+        path = game_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return {**archived, **loose}
+
+
+def resolve(game_dir: Path) -> Dict[str, bytes]:
+    """Every name Ren'Py can load, read the way it does: a loose file first, else the archive listing it."""
+    from ..rpa import read_rpa_index
+
+    files: Dict[str, bytes] = {}
+    for archive_path in sorted(game_dir.glob("*.rpa")):
+        _, index = read_rpa_index(archive_path)
+        data = archive_path.read_bytes()
+        for name, entries in index.items():
+            if name in files:
+                raise ValueError(f"{name} is in more than one archive")
+            offset, length, prefix = entries[0]
+            files[name] = prefix + data[offset:offset + length - len(prefix)]
+    for path in game_dir.rglob("*"):
+        if path.is_file() and path.suffix != ".rpa" and "saves" not in path.parts:
+            files[path.relative_to(game_dir).as_posix()] = path.read_bytes()
+    return files
+
+
+def scan(game_dir: Path, runs: int) -> float:
+    """Best time for what Ren'Py does at start before loading anything: list the game dir, read every archive index."""
+    from ..pack import startup_files
+
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        startup_files(game_dir)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.pack",
+        description=(
+            "Generates a game dir with thousands of loose assets, scripts, an original archive that was "
+            "extracted in place and one loose override, packs its images with and without reader threads, "
+            "then runs pack --repack --delete and reports pack times, and loose files, archives and start-up "
+            "scan time before and after; exits non-zero if the threaded archive differs, any name loads "
+            "different bytes afterwards, or the override or saves were touched."
+        ),
+    )
+    parser.add_argument("--files", type=int, default=8000, help="Loose images and sounds in the generated game.")
+    parser.add_argument("--runs", type=int, default=5, help="Start-up scans to take the best of.")
+    args = parser.parse_args(argv)
+
+    from ..pack import collect_members, pack_archive, repack_game, startup_files
+
+    problems = []
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        game_dir = temp_dir / "Game" / "game"
+        expected = build_game(game_dir, args.files)
+        if resolve(game_dir) != expected:
+            problems.append("the generated game does not load what it should")
+
+        pack_rows = []
+        digests = set()
+        members = collect_members([game_dir / "images"], game_dir)
+        for threads in (0, 4):
+            archive_path = temp_dir / f"images-{threads}.rpa"
+            start = time.perf_counter()
+            result = pack_archive(archive_path, members, threads=threads)
+            pack_rows.append((threads, time.perf_counter() - start, result))
+            digests.add(archive_path.read_bytes())
+            if result.state != "ok":
+                problems.append(f"pack with {threads} threads: {result.error}")
+        if len(digests) != 1:
+            problems.append("archives packed with and without threads differ")
+
+        before = startup_files(game_dir)
+        before_seconds = scan(game_dir, args.runs)
+        start = time.perf_counter()
+        repacked = repack_game(game_dir.parent, delete=True)
+        repack_seconds = time.perf_counter() - start
+        after = startup_files(game_dir)
+        after_seconds = scan(game_dir, args.runs)
+
+        failed = [result for result in repacked.archives if result.state != "ok"]
+        if repacked.error is not None or failed:
+            problems.append(f"repack failed: {repacked.error or failed[0].error}")
+        if resolve(game_dir) != expected:
+            problems.append("after repacking the game no longer loads the same bytes for every name")
+        if [path.name for path in repacked.overrides] != ["old.png"]:
+            problems.append(f"expected only old.png left loose as an override, got {[str(path) for path in repacked.overrides]}")
+        if not (game_dir / "saves" / "persistent").exists():
+            problems.append("repack touched the saves")
+        if after[0] >= before[0] // 10:
+            problems.append(f"{after[0]} loose files left of {before[0]}")
+        names = sorted(os.listdir(game_dir))
+
+    print(f"{args.files} loose assets, {before[2]} files in an original archive")
+    print(f"{'pack':>8} {'threads':>8} {'ms':>9} {'files':>7} {'stored MB':>10} {'shared':>7}")
+    for threads, seconds, result in pack_rows:
+        print(f"{'images':>8} {threads:>8} {seconds * 1000:>9.1f} {result.files:>7} {result.stored_bytes / (1 << 20):>10.1f} {result.duplicates:>7}")
+    print(f"repack --delete: {repack_seconds * 1000:.1f} ms, {len(repacked.archives)} archives, "
+          f"{len(repacked.archived)} files already archived, {len(repacked.overrides)} overrides kept loose")
+    print(f"{'start':>8} {'loose':>7} {'archives':>9} {'indexed':>8} {'scan ms':>9}")
+    print(f"{'before':>8} {before[0]:>7} {before[1]:>9} {before[2]:>8} {before_seconds * 1000:>9.1f}")
+    print(f"{'after':>8} {after[0]:>7} {after[1]:>9} {after[2]:>8} {after_seconds * 1000:>9.1f}")
+    print(f"game dir now: {' '.join(names)}")
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from .synth import AstBuilder, game_script, rpyc_bytes
+
+
+def _cases() -> List[tuple]:
+    # name, file contents, options, expected state, expected failure class, expected read attempts
+    good = rpyc_bytes(game_script(2))
+    broken = rpyc_bytes([AstBuilder().say("e", None)] + game_script(1))
+    return [
+        ("ok", good, {}, "ok", None, 1),
+        # Another reader may understand a header unrpyc doesn't: both are tried.
+        ("bad-header", b"RENPY RPC2" + bytes(range(256)) * 4, {"try_harder": True}, "error", "bad_header", 2),
+        ("truncated", good[: len(good) // 2], {"try_harder": True}, "error", "bad_header", 2),
+        # The output can't be written: nothing else is tried.
+        ("unwritable", good, {"try_harder": True, "blocked": True}, "error", "io", 1),
+        ("decompile", broken, {"try_harder": True}, "error", "decompile", 1),
+    ]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.retry",
+        description=(
+            "Checks which read attempts run for a bad header, a truncated file, an unwritable output and a "
+            "decompiler error, and that Ctrl-C is not swallowed; exits non-zero on any difference."
+        ),
+    )
+    parser.parse_args(argv)
+
+    from .. import rpyc_legacy
+    from ..rpyc_legacy import decompile_paths_legacy
+
+    problems = []
+    print(f"{'case':>12} {'state':>8} {'failure':>11} {'reads':>6} {'ms':>8}  error")
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        for name, data, options, expected_state, expected_failure, expected_reads in _cases():
+            path = temp_dir / name / "script.rpyc"
+            path.parent.mkdir()
+            path.write_bytes(data)
+            output = temp_dir / "out" / name
+            if options.pop("blocked", False):
+                # A file where the output directory should be.
+                output.parent.mkdir(exist_ok=True)
+                output.write_bytes(b"")
+                output = output / "game"
+
+            start = time.perf_counter()
+            (result,) = decompile_paths_legacy([path], output_dir=output, base_dir=path.parent, timings=True, **options)
+            elapsed = time.perf_counter() - start
+
+            failure = result.error.failure if result.error is not None else None
+            reads = result.timings.counters.get("read_attempts", 0)
+            message = result.error.message.splitlines()[0] if result.error is not None else ""
+            print(f"{name:>12} {result.state:>8} {failure or '-':>11} {reads:>6} {elapsed * 1000:>8.1f}  {message}")
+            if (result.state, failure, reads) != (expected_state, expected_failure, expected_reads):
+                problems.append(
+                    f"{name}: expected {expected_state}/{expected_failure} after {expected_reads} reads, "
+                    f"got {result.state}/{failure} after {reads}"
+                )
+
+        # Ctrl-C while decompiling stops the run instead of being recorded as a failed file.
+        def interrupt(*args, **kwargs):
+            raise KeyboardInterrupt
+
+        original = rpyc_legacy._decompile_ast
+        rpyc_legacy._decompile_ast = interrupt
+        try:
+            decompile_paths_legacy([temp_dir / "ok"], output_dir=temp_dir / "out" / "interrupt")
+            problems.append("interrupt: KeyboardInterrupt was swallowed")
+        except KeyboardInterrupt:
+            print(f"{'interrupt':>12} raised")
+        finally:
+            rpyc_legacy._decompile_ast = original
+
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+from ..paths import repo_root
+from .corpus import parse_size, script_for_size
+from .synth import RPYC_LAYOUTS, rpyc_bytes
+from .throughput import _peak_rss
+
+VARIANTS = ("copy", "view")
+
+
+def _read_copying(path: Path, context, renpycompat):
+    # How rpycfile read an rpyc before slots were views: the file, a copy of slot 1 and the
+    # decompressed pickle are all alive while unpickling.
+    from ..rpycfile import rpyc_slot
+
+    raw = path.read_bytes()
+    blob = bytes(rpyc_slot(raw, context, 1))
+    contents = zlib.decompress(blob)
+    _, stmts = renpycompat.pickle_safe_loads(contents)
+    return stmts
+
+
+def run_child(variant: str, path: Path, traced: bool) -> Dict:
+    """Reads path once in this process (a fresh child) and returns the peaks."""
+    from ..patches import apply_limit_patches
+    from ..rpyc_legacy import Context
+    from ..rpycfile import read_rpyc_ast
+    from ..vendor import import_unrpyc_legacy_renpycompat
+
+    renpycompat = import_unrpyc_legacy_renpycompat()
+    apply_limit_patches(renpycompat)
+    if traced:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if variant == "copy":
+        stmts = _read_copying(path, Context(), renpycompat)
+    else:
+        stmts = read_rpyc_ast(path, Context(), renpycompat)
+    seconds = time.perf_counter() - start
+    report = {"variant": variant, "statements": len(stmts), "seconds": seconds, "peak_rss": _peak_rss()}
+    if traced:
+        report["peak_traced"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return report
+
+
+def measure(variant: str, path: Path, traced: bool, python: str = sys.executable) -> Dict:
+    result = subprocess.run(
+        [python, "-m", "unren.bench.slots", "--child", variant, str(path), "traced" if traced else "rss"],
+        cwd=repo_root().parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "--child":
+        print(json.dumps(run_child(argv[1], Path(argv[2]), argv[3] == "traced")))
+        return 0
+
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.slots",
+        description=(
+            "Reads one large rpyc in fresh processes, once through rpycfile.read_rpyc_ast (slots as views of "
+            "the file, freed before unpickling) and once copying the slot, and reports peak RSS and traced "
+            "memory; exits non-zero if the views don't lower the traced peak."
+        ),
+    )
+    parser.add_argument("--size", default="8M", help="Target rpyc size (e.g. 8M, 50M).")
+    parser.add_argument("--layout", choices=[layout for layout in RPYC_LAYOUTS if layout != "obfuscated"], default="rpyc2")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to run the reads with.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp:
+        path = Path(temp) / "script.rpyc"
+        data = rpyc_bytes(script_for_size(parse_size(args.size)), layout=args.layout)
+        path.write_bytes(data)
+        from ..rpycfile import rpyc_slot
+        from ..rpyc_legacy import Context
+
+        decompressed = len(zlib.decompress(rpyc_slot(data, Context())))
+        print(f"{args.layout} file {len(data) / (1 << 20):.1f} MB, pickle {decompressed / (1 << 20):.1f} MB")
+        del data
+
+        reports = {}
+        for variant in VARIANTS:
+            report = measure(variant, path, False, args.python)
+            report["peak_traced"] = measure(variant, path, True, args.python)["peak_traced"]
+            reports[variant] = report
+
+    print(f"{'variant':>8} {'ms':>10} {'peak RSS MB':>12} {'peak traced MB':>15}")
+    for variant, report in reports.items():
+        print(f"{variant:>8} {report['seconds'] * 1000:>10.1f} {report['peak_rss'] / (1 << 20):>12.1f} "
+              f"{report['peak_traced'] / (1 << 20):>15.1f}")
+
+    problems = []
+    copy, view = reports["copy"], reports["view"]
+    if copy["statements"] != view["statements"]:
+        problems.append(f"statement counts differ: {copy['statements']} and {view['statements']}")
+    if view["peak_traced"] >= copy["peak_traced"]:
+        problems.append("reading through views did not lower the traced peak")
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ..bundle import BUNDLE_ZIP, build_bundle, iter_bundle_files
+from ..paths import repo_root
+from .synth import menu_heavy_script, rpyc_bytes
+
+BUDGET_PATH = Path(__file__).resolve().parent / "budget.json"
+
+
+def load_budget() -> Dict:
+    return json.loads(BUDGET_PATH.read_text("utf-8"))
+
+
+def _source_copy(dest: Path) -> Path:
+    # What ships without the bundle: sources only, and PYTHONDONTWRITEBYTECODE keeps it that way.
+    for path, relative in iter_bundle_files(repo_root()):
+        target = dest / "unren" / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, target)
+    return dest
+
+
+def _env(python_path: Path) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(python_path)
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def import_report(python_path: Path, args: Sequence[str], python: str = sys.executable) -> List[Tuple[str, int]]:
+    """Runs unren under -X importtime and returns (module, self time in us) for every import."""
+    result = subprocess.run(
+        [python, "-X", "importtime", "-m", "unren", *args],
+        env=_env(python_path),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        report.append((name.strip(), int(self_us)))
+    return report
+
+
+def import_times(python_path: Path, args: Sequence[str], python: str = sys.executable) -> Tuple[float, float]:
+    """Returns (all modules, unren modules) import self time in ms."""
+    report = import_report(python_path, args, python)
+    total = sum(self_us for _, self_us in report)
+    ours = sum(self_us for name, self_us in report if name.startswith("unren"))
+    return total / 1000, ours / 1000
+
+
+def wall_time(python_path: Path, args: Sequence[str], runs: int, python: str = sys.executable) -> float:
+    """Median wall-clock ms of `python -m unren args` over runs, after one warm-up run."""
+    samples = []
+    for index in range(runs + 1):
+        start = time.perf_counter()
+        subprocess.run([python, "-m", "unren", *args], env=_env(python_path), capture_output=True, check=True)
+        if index:
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.startup",
+        description=(
+            "Times unren detect and a small unren decompile from the source tree and from the bundle (wall "
+            "clock and -X importtime totals), and exits non-zero when the bundle is over the budget in "
+            "bench/budget.json."
+        ),
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--bundle", help="Measure an existing bundle (unren.zip or its directory) as the zip layout.")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to measure (use the embedded runtime).")
+    args = parser.parse_args(argv)
+
+    budget = load_budget()["startup"]
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        game = temp_dir / "game"
+        game.mkdir()
+        (game / "script.rpyc").write_bytes(rpyc_bytes(menu_heavy_script(labels=2, depth=1)))
+        commands = {
+            "detect": ["detect", str(game)],
+            # Pulls in the vendored decompiler, which is where compiling from source hurts.
+            "decompile": ["decompile", "--mode", "legacy", "--overwrite", "-o", str(temp_dir / "out"), str(game)],
+        }
+
+        layouts = {"source": _source_copy(temp_dir / "source")}
+        if args.bundle:
+            bundle = Path(args.bundle).expanduser()
+            layouts["zip"] = bundle / BUNDLE_ZIP if bundle.is_dir() else bundle
+        else:
+            layouts["zip"] = build_bundle(temp_dir / "zip", zipped=True)
+            layouts["dir"] = build_bundle(temp_dir / "dir", zipped=False)
+
+        print(f"{'layout':>8} {'command':>10} {'wall ms':>10} {'import ms':>10} {'unren ms':>10}")
+        measured = {}
+        for name, python_path in layouts.items():
+            for label, command in commands.items():
+                wall = wall_time(python_path, command, args.runs, args.python)
+                total, ours = import_times(python_path, command, args.python)
+                measured[name, label] = (wall, total)
+                print(f"{name:>8} {label:>10} {wall:>10.1f} {total:>10.1f} {ours:>10.1f}")
+
+    over = []
+    for label in commands:
+        wall, total = measured[budget["layout"], label]
+        if wall > budget[f"{label}_ms"]:
+            over.append(f"{label} {wall:.1f} ms > {budget[f'{label}_ms']} ms")
+        if total > budget[f"{label}_import_ms"]:
+            over.append(f"{label} imports {total:.1f} ms > {budget[f'{label}_import_ms']} ms")
+    if over:
+        print(f"over budget ({budget['layout']}): " + ", ".join(over))
+        return 1
+    print(f"within budget ({budget['layout']})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
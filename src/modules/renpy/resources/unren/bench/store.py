@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+from .synth import game_script, rpyc_bytes
+
+TARGETS = ("files", "zip", "sqlite")
+
+
+def _tree_digest(root: Path) -> str:
+    digest = hashlib.sha1()
+    for path in sorted(root.rglob("*.rpy")):
+        digest.update(path.relative_to(root).as_posix().encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def _disk_usage(root: Path) -> int:
+    return sum(path.stat().st_blocks * 512 for path in root.rglob("*") if path.is_file())
+
+
+def build_game(root: Path, files: int, chapters: int) -> None:
+    for index in range(files):
+        path = root / f"chapter{index % 10}" / f"script_{index}.rpyc"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(rpyc_bytes(game_script(chapters, seed=index)))
+
+
+def run_target(target: str, game: Path, output: Path, reads: int) -> Dict:
+    from ..rpyc_legacy import iter_decompile_paths_legacy
+    from ..store import STORE_FILE_NAMES, open_store
+
+    store = open_store(output / STORE_FILE_NAMES[target], output, target) if target != "files" else None
+    start = time.perf_counter()
+    try:
+        results = list(iter_decompile_paths_legacy([game], output_dir=output, base_dir=game, output_store=store))
+    finally:
+        if store is not None:
+            store.close()
+    seconds = time.perf_counter() - start
+
+    names = [result.output_path.relative_to(output).as_posix() for result in results]
+    picks = random.Random(0).choices(names, k=reads)
+    start = time.perf_counter()
+    if store is None:
+        for name in picks:
+            (output / name).read_bytes()
+    else:
+        with open_store(store.path) as reader:
+            for name in picks:
+                reader.read(name)
+    read_seconds = time.perf_counter() - start
+
+    return {
+        "target": target,
+        "ok": sum(result.state == "ok" for result in results),
+        "seconds": seconds,
+        "read_us": read_seconds / max(1, reads) * 1e6,
+        "files": sum(1 for path in output.rglob("*") if path.is_file()),
+        "disk": _disk_usage(output),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.store",
+        description=(
+            "Decompiles a generated game of N scripts to a file tree, a zip store and a SQLite store, and "
+            "reports time, files created, disk use, random single-entry read time and materialize time; exits "
+            "non-zero if a materialized store differs from the file tree."
+        ),
+    )
+    parser.add_argument("--files", type=int, default=500, help="Scripts in the generated game.")
+    parser.add_argument("--chapters", type=int, default=2, help="Chapters per script (size of each output).")
+    parser.add_argument("--reads", type=int, default=1000, help="Random single-file reads after the decompile.")
+    args = parser.parse_args(argv)
+
+    from ..store import materialize, open_store
+
+    problems = []
+    reports = []
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        game = temp_dir / "game"
+        build_game(game, args.files, args.chapters)
+        digests = {}
+        for target in TARGETS:
+            output = temp_dir / target
+            report = run_target(target, game, output, args.reads)
+            reports.append(report)
+            if target == "files":
+                digests[target] = _tree_digest(output)
+                continue
+            tree = temp_dir / f"{target}-tree"
+            start = time.perf_counter()
+            with open_store(next(output.iterdir())) as store:
+                for _ in materialize(store, tree):
+                    pass
+            report["materialize"] = time.perf_counter() - start
+            digests[target] = _tree_digest(tree)
+
+    print(f"{args.files} scripts")
+    print(f"{'target':>7} {'ok':>6} {'ms':>9} {'files':>6} {'disk KB':>9} {'read us':>8} {'materialize ms':>15}")
+    for report in reports:
+        materialized = f"{report['materialize'] * 1000:.1f}" if "materialize" in report else "-"
+        print(f"{report['target']:>7} {report['ok']:>6} {report['seconds'] * 1000:>9.1f} {report['files']:>6} "
+              f"{report['disk'] / 1024:>9.0f} {report['read_us']:>8.1f} {materialized:>15}")
+
+    for report in reports:
+        if report["ok"] != args.files:
+            problems.append(f"{report['target']}: {report['ok']} of {args.files} files decompiled")
+    for target, digest in digests.items():
+        if digest != digests["files"]:
+            problems.append(f"{target}: materialized output {digest} differs from the file tree's {digests['files']}")
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,474 @@
+from __future__ import annotations
+
+import base64
+import copyreg
+import hashlib
+import io
+import pickle
+import random
+import struct
+import textwrap
+import zlib
+from typing import List, Optional
+
+from ..patches import extend_class_factory_module
+from ..vendor import import_unrpyc_legacy_renpycompat
+
+
+class AstBuilder:
+    """Builds Ren'Py AST nodes out of the decompiler's fake classes."""
+
+    def __init__(self, renpycompat=None, filename: str = "game/script.rpy", seed: int = 0) -> None:
+        if renpycompat is None:
+            renpycompat = import_unrpyc_legacy_renpycompat()
+            extend_class_factory_module(renpycompat)
+        self.renpycompat = renpycompat
+        self.filename = filename
+        self.linenumber = 0
+        self.random = random.Random(seed)
+
+    def next_line(self, step: int = 1) -> int:
+        self.linenumber += step
+        return self.linenumber
+
+    def node(self, module: str, class_name: str, linenumber: Optional[int] = None, /, **attrs):
+        cls = self.renpycompat.CLASS_FACTORY(class_name, module)
+        obj = cls.__new__(cls)
+        if linenumber is not None:
+            obj.filename = self.filename
+            obj.linenumber = linenumber
+        obj.__dict__.update(attrs)
+        return obj
+
+    def expr(self, source: str, linenumber: Optional[int] = None):
+        if linenumber is None:
+            linenumber = self.linenumber
+        pyexpr = self.renpycompat.CLASS_FACTORY("PyExpr", "renpy.ast")
+        return pyexpr(source, self.filename, linenumber)
+
+    def say(self, who: Optional[str], what: str, interact: bool = True, linenumber: Optional[int] = None):
+        return self.node(
+            "renpy.ast",
+            "Say",
+            linenumber if linenumber is not None else self.next_line(),
+            who=who,
+            what=what,
+            with_=None,
+            interact=interact,
+            attributes=None,
+        )
+
+    def jump(self, target: str):
+        return self.node("renpy.ast", "Jump", self.next_line(), target=target, expression=False)
+
+    def python_line(self, source: str):
+        line = self.next_line()
+        code = self.node("renpy.ast", "PyCode", source=source, location=(self.filename, line), mode="exec")
+        return self.node("renpy.ast", "Python", line, code=code, hide=False, store="store")
+
+    def menu(self, items, linenumber: Optional[int] = None):
+        return self.node(
+            "renpy.ast",
+            "Menu",
+            linenumber if linenumber is not None else self.linenumber,
+            items=items,
+            item_arguments=[None] * len(items),
+            set=None,
+            with_=None,
+        )
+
+    def if_(self, entries, linenumber: Optional[int] = None):
+        return self.node(
+            "renpy.ast",
+            "If",
+            linenumber if linenumber is not None else self.linenumber,
+            entries=entries,
+        )
+
+    def label(self, name: str, block: List, linenumber: int):
+        return self.node("renpy.ast", "Label", linenumber, name=name, block=block, parameters=None)
+
+    def return_(self):
+        return self.node("renpy.ast", "Return", self.linenumber, expression=None)
+
+    def init(self, block: List, priority: int = 0, linenumber: Optional[int] = None):
+        return self.node(
+            "renpy.ast",
+            "Init",
+            linenumber if linenumber is not None else block[0].linenumber,
+            block=block,
+            priority=priority,
+        )
+
+    def define(self, varname: str, source: str):
+        line = self.next_line()
+        code = self.node("renpy.ast", "PyCode", source=source, location=(self.filename, line), mode="eval")
+        return self.init([self.node("renpy.ast", "Define", line, varname=varname, code=code, store="store", operator="=", index=None)])
+
+    def default(self, varname: str, source: str):
+        line = self.next_line()
+        code = self.node("renpy.ast", "PyCode", source=source, location=(self.filename, line), mode="eval")
+        return self.init([self.node("renpy.ast", "Default", line, varname=varname, code=code, store="store")])
+
+    def python_block(self, source: str, priority: Optional[int] = None):
+        # `init python:` when a priority is given, a plain `python:` block otherwise.
+        line = self.next_line()
+        code = self.node("renpy.ast", "PyCode", source=source, location=(self.filename, line), mode="exec")
+        python = self.node("renpy.ast", "Python", line, code=code, hide=False, store="store")
+        self.next_line(source.count("\n"))
+        if priority is None:
+            return python
+        return self.init([python], priority, line)
+
+    def atl_block(self, statements: List):
+        # ATL blocks point at their first line, one below the statement that opens them.
+        return self.node("renpy.atl", "RawBlock", loc=(self.filename, self.linenumber + 1), statements=statements, animation=False)
+
+    def atl_step(self, properties=(), warper: Optional[str] = None, duration: str = "0", expressions=()):
+        return self.node(
+            "renpy.atl",
+            "RawMultipurpose",
+            loc=(self.filename, self.next_line()),
+            warper=warper,
+            duration=duration,
+            warp_function=None,
+            revolution=None,
+            circles="0",
+            splines=[],
+            properties=list(properties),
+            expressions=list(expressions),
+        )
+
+    def atl_repeat(self):
+        return self.node("renpy.atl", "RawRepeat", loc=(self.filename, self.next_line()), repeats=None)
+
+    def transform(self, varname: str, steps: int):
+        line = self.next_line()
+        atl = self.atl_block([self.atl_step([("xalign", f"0.{index % 10}")], "ease", "0.5") for index in range(steps)])
+        node = self.node("renpy.ast", "Transform", line, varname=varname, parameters=None, atl=atl, store="store")
+        return self.init([node], 0, line)
+
+    def image(self, name, steps: int):
+        line = self.next_line()
+        statements = [self.atl_step(expressions=[(f'"{"/".join(name)}_{index}.png"', None)]) for index in range(steps)]
+        statements.append(self.atl_step(warper="linear", duration="1.0", properties=[("alpha", "1.0")]))
+        statements.append(self.atl_repeat())
+        atl = self.atl_block(statements)
+        node = self.node("renpy.ast", "Image", line, imgname=tuple(name), code=None, atl=atl)
+        return self.init([node], 990, line)
+
+    def imspec(self, name, at_list=()):
+        return (tuple(name), None, None, list(at_list), None, None, [])
+
+    def scene(self, name):
+        return self.node("renpy.ast", "Scene", self.next_line(), imspec=self.imspec(name), layer="master", atl=None)
+
+    def show(self, name, at_list=()):
+        return self.node("renpy.ast", "Show", self.next_line(), imspec=self.imspec(name, at_list), atl=None)
+
+    # Screen language nodes take their line before their children do, so children are passed as
+    # callables that build them afterwards.
+
+    def sl_displayable(self, module: str, class_name: str, style, positional=(), keyword=(), children_fn=None):
+        line = self.next_line()
+        keyword = [(key, self.expr(value, line)) for key, value in keyword]
+        return self.node(
+            "renpy.sl2.slast",
+            "SLDisplayable",
+            location=(self.filename, line),
+            displayable=self.renpycompat.CLASS_FACTORY(class_name, module),
+            style=style,
+            positional=list(positional),
+            keyword=keyword,
+            children=children_fn() if children_fn is not None else [],
+            variable=None,
+        )
+
+    def sl_for(self, variable: str, expression: str, children_fn):
+        line = self.next_line()
+        return self.node(
+            "renpy.sl2.slast",
+            "SLFor",
+            location=(self.filename, line),
+            variable=variable,
+            expression=expression,
+            children=children_fn(),
+            index_expression=None,
+        )
+
+    def screen(self, name: str, children_fn, parameters=None):
+        line = self.next_line()
+        screen = self.node(
+            "renpy.sl2.slast",
+            "SLScreen",
+            location=(self.filename, line),
+            name=name,
+            parameters=parameters,
+            keyword=[],
+            children=children_fn(),
+            tag=None,
+        )
+        return self.init([self.node("renpy.ast", "Screen", line, screen=screen)], -500, line)
+
+
+def _menu_block(builder: AstBuilder, items: int, depth: int, says: int, tag: str) -> List:
+    # Mirrors the layout Ren'Py produces for:
+    #     menu:
+    #         e "caption"
+    #         "Choice":
+    #             ...
+    # The caption says are split between ones that fit before the first choice and ones that
+    # have to be pushed after the choices, so both menu layout paths are exercised.
+    nodes = []
+    menu_line = builder.next_line()
+    if builder.random.random() < 0.5:
+        caption = builder.say("e", f"What now? ({tag})", interact=False, linenumber=builder.next_line())
+    else:
+        caption = builder.say("e", f"What now? ({tag})", interact=False, linenumber=menu_line)
+
+    entries = []
+    for index in range(items):
+        builder.next_line()
+        condition = "True"
+        if builder.random.random() < 0.25:
+            condition = builder.expr(f"flag_{tag}_{index}")
+        block = []
+        for line in range(says):
+            block.append(builder.say("e", f"Line {line} of choice {index} in {tag}."))
+        if depth > 1 and index % 2 == 0:
+            block.extend(_menu_block(builder, items, depth - 1, says, f"{tag}_{index}"))
+        else:
+            block.append(builder.python_line(f"points += {index}"))
+        entries.append((f"Choice {index} ({tag})", condition, block))
+
+    menu = builder.menu(entries, linenumber=menu_line)
+    nodes.append(caption)
+    nodes.append(menu)
+    return nodes
+
+
+def menu_heavy_script(labels: int = 20, items: int = 4, depth: int = 3, says: int = 2, seed: int = 0):
+    """Returns a list of top level nodes of a menu-heavy script (dating-sim style branching)."""
+    builder = AstBuilder(seed=seed)
+    nodes = []
+    for index in range(labels):
+        label_line = builder.next_line(2)
+        block = [builder.say(None, f"Scene {index} begins.")]
+        block.extend(_menu_block(builder, items, depth, says, f"l{index}"))
+        block.append(builder.jump(f"scene_{index + 1}"))
+        nodes.append(builder.label(f"scene_{index}", block, label_line))
+    nodes.append(builder.return_())
+    return nodes
+
+
+def nested_script(depth: int = 1000, seed: int = 0):
+    """Returns a label whose body nests `depth` levels of alternating if statements and menus."""
+    builder = AstBuilder(seed=seed)
+    label_line = builder.next_line()
+    root: List = []
+    block = root
+    for level in range(depth):
+        line = builder.next_line()
+        inner = [builder.say("e", f"Level {level}.")]
+        if level % 2:
+            node = builder.menu([(f"Go deeper {level}", "True", inner)], linenumber=line)
+            builder.next_line()
+        else:
+            node = builder.if_([(builder.expr(f"depth > {level}", line), inner), ("True", [builder.jump("done")])], line)
+        block.append(node)
+        block = inner
+    nodes = [builder.label("deep", root, label_line)]
+    nodes.append(builder.return_())
+    return nodes
+
+
+def _hud_screen(builder: AstBuilder, index: int, buttons: int):
+    def choices():
+        return [builder.sl_displayable(
+            "renpy.ui", "_textbutton", "button",
+            positional=[f'"Option [i] of {index}"'],
+            keyword=[("action", f"Return(i)"), ("xalign", "0.5")],
+        )]
+
+    def frame():
+        return [builder.sl_displayable(
+            "renpy.display.layout", "MultiBox", "vbox",
+            keyword=[("spacing", "10")],
+            children_fn=lambda: [
+                builder.sl_displayable("renpy.text.text", "Text", "text", positional=[f'"Chapter {index}"']),
+                builder.sl_displayable("renpy.text.text", "Text", "text", positional=['"Points: [points]"']),
+                builder.sl_for("i", f"range({buttons})", choices),
+            ],
+        )]
+
+    return builder.screen(f"hud_{index}", lambda: [
+        builder.sl_displayable("renpy.display.layout", "Window", "frame", keyword=[("xalign", "1.0")], children_fn=frame),
+    ])
+
+
+def game_chapter(builder: AstBuilder, index: int, items: int = 4, depth: int = 2, says: int = 3,
+                 atl_steps: int = 4, python_statements: int = 40) -> List:
+    """Returns the top level nodes of one chapter: init statements, ATL, a screen and a label."""
+    character = f"c{index}"
+    nodes = [
+        builder.define(character, f'Character("Person {index}", color="#c8ffc8")'),
+        builder.default(f"flag_{index}", "False"),
+        builder.transform(f"slide_{index}", atl_steps),
+        builder.image(("bg", f"room_{index}"), atl_steps),
+        _hud_screen(builder, index, items),
+    ]
+    source = textwrap.dedent(python_block_source(python_statements, seed=builder.random.randint(0, 1 << 30)))
+    nodes.append(builder.python_block(source, priority=0))
+
+    label_line = builder.next_line(2)
+    block = [
+        builder.scene(("bg", f"room_{index}")),
+        builder.show((character, "happy"), [f"slide_{index}"]),
+    ]
+    for line in range(says):
+        block.append(builder.say(character, f"Line {line} of chapter {index}, with [points] points."))
+    block.extend(_menu_block(builder, items, depth, says, f"c{index}"))
+    block.append(builder.python_line(f"renpy.show_screen('hud_{index}')"))
+    block.append(builder.jump(f"chapter_{index + 1}"))
+    nodes.append(builder.label(f"chapter_{index}", block, label_line))
+    return nodes
+
+
+def game_script(chapters: int = 10, seed: int = 0, **chapter_args) -> List:
+    """Returns the top level nodes of a script mixing every statement kind the corpus covers."""
+    builder = AstBuilder(seed=seed)
+    nodes = []
+    for index in range(chapters):
+        nodes.extend(game_chapter(builder, index, **chapter_args))
+    nodes.append(builder.return_())
+    return nodes
+
+
+_PYTHON_TEMPLATES = (
+    "    {name} = {value}",
+    "    {name} = [{value}, {value}, ({value}, {value})]",
+    "    {name} = {{'{key}': {value}, \"{key}\": [{value}]}}",
+    "    if {name} > {value}:  # {key} (unbalanced in a comment",
+    "        renpy.notify(\"{key} ({value}\")",
+    "    {name} = some_call({value},\n        {value},\n        key='{key}')",
+    "    {name} = {value} + \\\n        {value}",
+    "    doc = '''{key}\n    spans \"lines\" ({value}\n    '''",
+    "    def {name}_fn(a, b={value}):\n        return [a, b, '{key}']",
+)
+
+
+def python_block_source(statements: int = 200, seed: int = 0) -> str:
+    """Returns the source of a large init python block with strings, brackets and comments."""
+    rng = random.Random(seed)
+    lines = []
+    for index in range(statements):
+        template = rng.choice(_PYTHON_TEMPLATES)
+        lines.append(template.format(
+            name=f"var_{index}",
+            key=f"key_{rng.randint(0, 999)}",
+            value=rng.choice(("1", "2.5", "None", "persistent.flag", "u'str'", "\"x\"", "(1)")),
+        ))
+    return "\n" + "\n".join(lines) + "\n"
+
+
+_EXPRESSIONS = (
+    "e", "persistent.flag", "store.e.name", "if", "a.in", "char(1)", "x[1]",
+    "\"quoted\"", "1.5", "a + b", "f(a)(b).c", "renpy.random.choice([1, 2])", "ex.é",
+)
+
+
+def expression_corpus(count: int = 1000, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [rng.choice(_EXPRESSIONS) for _ in range(count)]
+
+
+def dialogue_corpus(count: int = 1000, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    words = ("Hello", "there,", "\"friend\"", "how\nare", "you?", " ", "  ", "back\\slash")
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(1, 12))) for _ in range(count)]
+
+
+class _RpycPickler(pickle._Pickler):
+    # Pickles the decompiler's fake classes as references to the Ren'Py classes they stand in for.
+
+    def save_global(self, obj, name=None):
+        module = obj.__module__
+        if module.split(".")[0] in ("renpy", "store"):
+            self.write(pickle.GLOBAL + f"{module}\n{name or obj.__qualname__}\n".encode("utf-8"))
+            self.memoize(obj)
+        else:
+            super().save_global(obj, name)
+
+    def reducer_override(self, obj):
+        if type(obj).__name__ == "PyCode" and type(obj).__module__ == "renpy.ast":
+            state = (1, obj.source, obj.location, obj.mode, None)
+            return copyreg.__newobj__, (type(obj),), state
+        return NotImplemented
+
+
+class _Py2RpycPickler(_RpycPickler):
+    # Writes identifiers (attribute names, dict keys) as byte strings, the way Ren'Py 7 on Python 2
+    # pickles str. They load back as the same str.
+    dispatch = dict(_RpycPickler.dispatch)
+
+    def save_str(self, obj):
+        if not (obj.isascii() and obj.isidentifier()):
+            return super().save_str(obj)
+        data = obj.encode("ascii")
+        if len(data) < 256:
+            self.write(pickle.SHORT_BINSTRING + bytes([len(data)]) + data)
+        else:
+            self.write(pickle.BINSTRING + struct.pack("<i", len(data)) + data)
+        self.memoize(obj)
+
+    dispatch[str] = save_str
+
+
+# rpyc1: Ren'Py 6.17 and older, the whole file is one zlib blob.
+# rpyc2: RPYC2 header with the AST in slot 1.
+# rpyc2-hash: slot 2 also holds the md5 of the source, as Ren'Py 7.5 and later write it.
+# rpyc2-py2: rpyc2-hash with a Python 2 style pickle, as Ren'Py 7 writes it.
+# obfuscated: a changed magic and a base64 layer over slot 1; only --try-harder reads it.
+RPYC_LAYOUTS = ("rpyc1", "rpyc2", "rpyc2-hash", "rpyc2-py2", "obfuscated")
+
+
+def _rpyc2_bytes(header: bytes, slots: List[bytes], trailer: bytes = b"") -> bytes:
+    position = len(header) + 12 * (len(slots) + 1)
+    entries = []
+    for slot, blob in enumerate(slots, 1):
+        entries.append(struct.pack("<III", slot, position, len(blob)))
+        position += len(blob)
+    return header + b"".join(entries) + struct.pack("<III", 0, 0, 0) + b"".join(slots) + trailer
+
+
+def rpyc_bytes(nodes, version: int = 5003000, layout: str = "rpyc2") -> bytes:
+    """Serializes top level nodes the way Ren'Py writes a .rpyc file (RPYC2, slot 1 only by default)."""
+    buffer = io.BytesIO()
+    pickler = _Py2RpycPickler if layout == "rpyc2-py2" else _RpycPickler
+    pickler(buffer, 2).dump(({"version": version, "key": "unlocked"}, nodes))
+    blob = zlib.compress(buffer.getvalue())
+    if layout == "rpyc1":
+        return blob
+    if layout == "rpyc2":
+        return _rpyc2_bytes(b"RENPY RPC2", [blob])
+    digest = hashlib.md5(blob).digest()
+    if layout in ("rpyc2-hash", "rpyc2-py2"):
+        return _rpyc2_bytes(b"RENPY RPC2", [blob, digest])
+    if layout == "obfuscated":
+        # The trailing byte keeps slot 2 short of the end of the file, which the header scan wants.
+        return _rpyc2_bytes(b"UNRPYC NO!", [base64.b64encode(blob), digest], b"\0")
+    raise ValueError(f"Unknown rpyc layout: {layout}")
+
+
+def rpa_bytes(files, key: int = 0x42424242) -> bytes:
+    """Builds an RPA-3.0 archive holding files ({name: bytes})."""
+    header_length = 34
+    body = io.BytesIO()
+    index = {}
+    for name, data in files.items():
+        offset = header_length + body.tell()
+        body.write(data)
+        index[name] = [(offset ^ key, len(data) ^ key, b"")]
+    index_offset = header_length + body.tell()
+    header = b"RPA-3.0 %016x %08x\n" % (index_offset, key)
+    return header + body.getvalue() + zlib.compress(pickle.dumps(index, 2))
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from ..paths import repo_root
+from .corpus import DEFAULT_SIZES, write_corpus
+from .synth import RPYC_LAYOUTS
+
+# name -> (entry point, keyword arguments)
+RUNS = {
+    "current": ("decompile_paths", {"mode": "current", "legacy_fallback": False}),
+    "auto": ("decompile_paths", {"mode": "auto"}),
+    "auto-unrouted": ("decompile_paths", {"mode": "auto", "route": False}),
+    "legacy": ("decompile_paths_legacy", {}),
+    "current-try-harder": ("decompile_paths", {"mode": "current", "legacy_fallback": False, "try_harder": True}),
+    "legacy-try-harder": ("decompile_paths_legacy", {"try_harder": True}),
+}
+DEFAULT_RUNS = ("current", "legacy", "current-try-harder", "legacy-try-harder")
+
+
+def _peak_rss() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _output_digest(output_dir: Path) -> str:
+    digest = hashlib.sha1()
+    for path in sorted(output_dir.rglob("*.rpy")):
+        digest.update(path.relative_to(output_dir).as_posix().encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def run_child(run: str, corpus_dir: Path, output_dir: Path) -> Dict:
+    """Decompiles the corpus in this process and returns the measurements (runs in a fresh child)."""
+    entry, kwargs = RUNS[run]
+    if entry == "decompile_paths":
+        from ..rpyc import decompile_paths as decompile
+    else:
+        from ..rpyc_legacy import decompile_paths_legacy as decompile
+
+    start = time.perf_counter()
+    try:
+        results = decompile([corpus_dir], output_dir=output_dir, base_dir=corpus_dir, overwrite=True, timings=True, **kwargs)
+    except ImportError as exc:
+        # The stack for this run isn't vendored in this tree.
+        return {"run": run, "unavailable": repr(exc)}
+    seconds = time.perf_counter() - start
+
+    phases: Dict[str, float] = {}
+    counters: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+    ok_bytes = 0
+    for result in results:
+        if result.timings is not None:
+            for name, value in result.timings.phases.items():
+                phases[name] = phases.get(name, 0.0) + value
+            for name, value in result.timings.counters.items():
+                counters[name] = counters.get(name, 0) + value
+        if result.state == "ok":
+            ok_bytes += result.input_path.stat().st_size
+        else:
+            layout = result.input_path.parent.name
+            errors[layout] = errors.get(layout, 0) + 1
+    return {
+        "run": run,
+        "files": len(results),
+        "ok": sum(1 for result in results if result.state == "ok"),
+        "ok_bytes": ok_bytes,
+        "errors": errors,
+        "first_error": next((f"{r.error.type}: {r.error.message}" for r in results if r.state == "error" and r.error is not None), None),
+        "seconds": seconds,
+        "phases": phases,
+        "counters": counters,
+        "peak_rss": _peak_rss(),
+        "digest": _output_digest(output_dir),
+    }
+
+
+def measure(run: str, corpus_dir: Path, output_dir: Path, python: str = sys.executable) -> Dict:
+    result = subprocess.run(
+        [python, "-m", "unren.bench.throughput", "--child", run, str(corpus_dir), str(output_dir)],
+        cwd=repo_root().parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def _format_row(report: Dict) -> str:
+    seconds = report["seconds"]
+    files_per_s = report["ok"] / seconds if seconds else 0.0
+    mb_per_s = report["ok_bytes"] / (1 << 20) / seconds if seconds else 0.0
+    rss = f"{report['peak_rss'] / (1 << 20):.0f}" if report["peak_rss"] is not None else "-"
+    return (f"{report['run']:>20} {report['ok']:>5}/{report['files']:<5} {seconds * 1000:>10.1f} "
+            f"{files_per_s:>9.1f} {mb_per_s:>8.2f} {rss:>8}  {report['digest']}")
+
+
+def _format_phases(report: Dict) -> List[str]:
+    lines = []
+    phases = sorted(report["phases"].items(), key=lambda item: -item[1])
+    if phases:
+        lines.append("    " + "  ".join(f"{name} {seconds * 1000:.1f}" for name, seconds in phases))
+    if report["errors"]:
+        failed = ", ".join(f"{layout} {count}" for layout, count in sorted(report["errors"].items()))
+        lines.append(f"    errors: {failed}; first: {report['first_error']}")
+    return lines
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "--child":
+        print(json.dumps(run_child(argv[1], Path(argv[2]), Path(argv[3]))))
+        return 0
+
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.throughput",
+        description=(
+            "Decompiles a synthetic corpus once per run in a fresh process and reports files/s, MB/s, peak "
+            "RSS, per-phase times and an output hash."
+        ),
+    )
+    parser.add_argument("--sizes", nargs="+", default=list(DEFAULT_SIZES), help="Target file sizes (e.g. 1K 64K 1M 50M).")
+    parser.add_argument("--layouts", nargs="+", choices=RPYC_LAYOUTS, default=list(RPYC_LAYOUTS))
+    parser.add_argument("--files", type=int, default=2, help="Files per size and layout.")
+    parser.add_argument("--runs", nargs="+", choices=list(RUNS), default=list(DEFAULT_RUNS))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per configuration; the fastest one is reported.")
+    parser.add_argument("--corpus", help="Use (or keep) the corpus in this directory instead of a temporary one.")
+    parser.add_argument("--json", help="Also write the reports to this file.")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to measure (use the embedded runtime).")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        corpus_dir = Path(args.corpus).expanduser() if args.corpus else temp_dir / "corpus"
+        if not (corpus_dir / "game").is_dir():
+            write_corpus(corpus_dir, args.sizes, args.layouts, args.files)
+        total = sum(path.stat().st_size for path in corpus_dir.rglob("*.rpyc"))
+        print(f"corpus: {corpus_dir} ({total / (1 << 20):.2f} MB)")
+
+        print(f"{'run':>20} {'ok':>11} {'wall ms':>10} {'files/s':>9} {'MB/s':>8} {'RSS MB':>8}  sha1")
+        reports = []
+        for run in args.runs:
+            samples = [measure(run, corpus_dir, temp_dir / "out" / run, args.python) for _ in range(args.repeat)]
+            if "unavailable" in samples[0]:
+                print(f"{run:>20} unavailable: {samples[0]['unavailable']}")
+                continue
+            report = min(samples, key=lambda sample: sample["seconds"])
+            report["peak_rss"] = max((s["peak_rss"] for s in samples if s["peak_rss"] is not None), default=None)
+            reports.append(report)
+            print(_format_row(report))
+            for line in _format_phases(report):
+                print(line)
+
+    if args.json:
+        Path(args.json).expanduser().write_text(json.dumps(reports, indent=2), "utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
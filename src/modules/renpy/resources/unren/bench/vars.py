@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional, Sequence
+
+from .store import build_game
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.vars",
+        description=(
+            "Times a full legacy decompile of a generated game against collect_variables on it, and exits "
+            "non-zero if a file fails, a variable isn't set near its line in the decompiled output, a define "
+            "or default is missing, or default flag_N = False doesn't come out as a bool literal."
+        ),
+    )
+    parser.add_argument("--files", type=int, default=60, help="Scripts in the generated game.")
+    parser.add_argument("--chapters", type=int, default=4, help="Chapters per script.")
+    args = parser.parse_args(argv)
+
+    from ..rpyc_legacy import decompile_paths_legacy
+    from ..variables import collect_variables, write_json
+
+    problems = []
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        game = temp_dir / "Game" / "game"
+        build_game(game, args.files, args.chapters)
+        # The scripts are Ren'Py 7 ones; a game ships the Ren'Py that says so.
+        (game.parent / "renpy").mkdir()
+        (game.parent / "renpy" / "version.py").write_text("version_tuple = (7, 4, 11, 2266)\n")
+
+        # What the cheats engine had before: decompile everything, then read the sources.
+        start = time.perf_counter()
+        results = decompile_paths_legacy([game], output_dir=temp_dir / "decompiled", base_dir=game)
+        decompile_seconds = time.perf_counter() - start
+        if any(result.state != "ok" for result in results):
+            problems.append("the generated game did not decompile")
+
+        start = time.perf_counter()
+        result = collect_variables([game], base_dir=game, processes=1)
+        buffer = io.StringIO()
+        write_json(result, buffer)
+        vars_seconds = time.perf_counter() - start
+        data = json.loads(buffer.getvalue())
+
+        if data["errors"]:
+            problems.append(f"{len(data['errors'])} files failed, first {data['errors'][0]}")
+        by_kind = {}
+        for variable in data["variables"]:
+            by_kind.setdefault(variable["kind"], []).append(variable)
+        # Lines are Ren'Py's, which the decompiler can fall a few lines behind (see bench.index).
+        for variable in data["variables"]:
+            lines = (temp_dir / "decompiled" / variable["path"]).read_text("utf-8").splitlines()
+            if not any(f"{variable['name']} = " in line for line in lines[variable["line"] - 1:variable["line"] + 4]):
+                problems.append(f"{variable['name']} is not set at {variable['path']}:{variable['line']} ({lines[variable['line'] - 1].strip()!r})")
+                break
+        expected = args.files * args.chapters
+        for kind in ("define", "default"):
+            if len(by_kind.get(kind, [])) != expected:
+                problems.append(f"expected {expected} {kind} variables, got {len(by_kind.get(kind, []))}")
+        flags = [variable for variable in by_kind.get("default", []) if variable["name"].startswith("flag_")]
+        if not flags or any(variable["type"] != "bool" or variable["value"] is not False for variable in flags):
+            problems.append("default flag_N = False did not come out as a bool literal")
+        if not by_kind.get("init python"):
+            problems.append("no assignments found in init python blocks")
+
+    literal = sum(variable["type"] is not None for variable in data["variables"])
+    print(f"{args.files} scripts, {args.chapters} chapters each")
+    print(f"{'run':>10} {'ms':>9}")
+    print(f"{'decompile':>10} {decompile_seconds * 1000:>9.1f}")
+    print(f"{'vars':>10} {vars_seconds * 1000:>9.1f}   ({decompile_seconds / vars_seconds:.1f}x)")
+    print(
+        f"{len(data['variables'])} variables: "
+        + ", ".join(f"{len(items)} {kind}" for kind, items in sorted(by_kind.items()))
+        + f"; {literal} with a literal value"
+    )
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional, Sequence
+
+from .batch import _tree_digest
+from .store import build_game
+
+# (label, write_threads, max_write_buffer)
+VARIANTS = (
+    ("inline", 0, None),
+    ("threads", 4, None),
+    ("tight-buffer", 4, 1),
+)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="unren.bench.writes",
+        description=(
+            "Decompiles a generated game with writes inline, on writer threads and on writer threads with a "
+            "one-file buffer, adding the given latency to every output rename, and exits non-zero if the "
+            "outputs differ or the threads don't beat inline writes on a slow drive."
+        ),
+    )
+    parser.add_argument("--files", type=int, default=100, help="Scripts in the generated game.")
+    parser.add_argument("--chapters", type=int, default=2, help="Chapters per script (size of each output).")
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.0, 20.0], help="Added ms per output rename, as on a slow external drive.")
+    args = parser.parse_args(argv)
+
+    from ..rpyc_legacy import decompile_paths_legacy
+
+    replace = os.replace
+    problems = []
+    rows = []
+    with tempfile.TemporaryDirectory() as temp:
+        temp_dir = Path(temp)
+        game = temp_dir / "game"
+        build_game(game, args.files, args.chapters)
+        for latency in args.latency:
+            def slow_replace(src, dst, *rest, **kwargs):
+                time.sleep(latency / 1000)
+                return replace(src, dst, *rest, **kwargs)
+
+            os.replace = slow_replace
+            try:
+                seconds = {}
+                digests = {}
+                for label, threads, buffer in VARIANTS:
+                    output = temp_dir / f"out-{latency}-{label}"
+                    options = {"write_threads": threads}
+                    if buffer is not None:
+                        options["max_write_buffer"] = buffer
+                    start = time.perf_counter()
+                    results = decompile_paths_legacy([game], output_dir=output, base_dir=game, **options)
+                    seconds[label] = time.perf_counter() - start
+                    digests[label] = _tree_digest(output)
+                    ok = sum(result.state == "ok" for result in results)
+                    if ok != args.files:
+                        problems.append(f"{label} at {latency} ms: {ok} of {args.files} files written")
+                    if digests[label] != digests["inline"]:
+                        problems.append(f"{label} at {latency} ms: output {digests[label]} differs from inline {digests['inline']}")
+            finally:
+                os.replace = replace
+            rows.append((latency, seconds))
+            if latency > 0 and seconds["threads"] >= seconds["inline"]:
+                problems.append(f"writer threads did not hide {latency} ms of write latency")
+
+    print(f"{args.files} scripts")
+    print(f"{'latency ms':>10} " + " ".join(f"{label + ' ms':>16}" for label, _, _ in VARIANTS))
+    for latency, seconds in rows:
+        print(f"{latency:>10.1f} " + " ".join(f"{seconds[label] * 1000:>16.1f}" for label, _, _ in VARIANTS))
+    for problem in problems:
+        print(f"FAIL {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import hashlib
+import importlib.util
+import json
+import py_compile
+import shutil
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Tuple
+
+from .paths import repo_root
+
+BUNDLE_MANIFEST = "unren-bundle.json"
+BUNDLE_ZIP = "unren.zip"
+
+# Mirrors the unren extraResources filter in package.json.
+EXCLUDE = (
+    "__pycache__",
+    ".DS_Store",
+    ".git",
+    ".github",
+    "testcases",
+    "un.rpyc",
+    "un.rpy",
+    "UnRen-dev.bat",
+    "UnRen.ps1",
+    "make-bintray-json.sh",
+    "bintray-template.json",
+    "MANIFEST.in",
+    "setup.py",
+    "setup.cfg",
+    "pyproject.toml",
+    "*.pyc",
+)
+EXCLUDE_TOP = ("bench", "bundle.py", "third_party/unrpyc-legacy")
+
+# Fixed zip timestamps keep the bundle byte-for-byte reproducible.
+_ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+def _excluded(relative: str) -> bool:
+    if any(relative == top or relative.startswith(top + "/") for top in EXCLUDE_TOP):
+        return True
+    return any(fnmatch.fnmatch(part, pattern) for part in relative.split("/") for pattern in EXCLUDE)
+
+
+def iter_bundle_files(root: Path) -> Iterator[Tuple[Path, str]]:
+    """Yields (path, relative posix path) for every file that goes into the bundle, sorted."""
+    for path in sorted(root.rglob("*")):
+        if not path.is_file():
+            continue
+        relative = path.relative_to(root).as_posix()
+        if not _excluded(relative):
+            yield path, relative
+
+
+def _compile(source: Path, cfile: Path, dfile: str) -> None:
+    # Checked hashes instead of mtimes: the pyc stays valid after copying (mtimes change when the
+    # app is installed) and is still rejected if the source next to it is edited.
+    py_compile.compile(
+        str(source),
+        cfile=str(cfile),
+        dfile=dfile,
+        doraise=True,
+        invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
+    )
+
+
+def build_bundle(output_dir: Path, *, zipped: bool = True, root: Optional[Path] = None) -> Path:
+    """
+    Writes unren with precompiled bytecode to output_dir, either as unren.zip (legacy layout,
+    foo.pyc next to foo.py, which is what zipimport reads) or as an unren/ package with
+    __pycache__ entries. Sources are kept so another Python version falls back to compiling them.
+    Returns the path to put on PYTHONPATH.
+    """
+    root = root or repo_root()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    files = list(iter_bundle_files(root))
+    digest = hashlib.sha256()
+
+    target = output_dir / (BUNDLE_ZIP if zipped else "unren")
+    if target.is_dir():
+        shutil.rmtree(target)
+    elif target.exists():
+        target.unlink()
+
+    compiled = 0
+    if zipped:
+        with tempfile.TemporaryDirectory() as temp_dir, zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as archive:
+            for path, relative in files:
+                name = "unren/" + relative
+                data = path.read_bytes()
+                digest.update(name.encode("utf-8") + b"\0" + data)
+                archive.writestr(zipfile.ZipInfo(name, _ZIP_DATE), data, zipfile.ZIP_DEFLATED)
+                if path.suffix == ".py":
+                    cfile = Path(temp_dir) / "module.pyc"
+                    _compile(path, cfile, name)
+                    info = zipfile.ZipInfo(name[:-3] + ".pyc", _ZIP_DATE)
+                    archive.writestr(info, cfile.read_bytes(), zipfile.ZIP_DEFLATED)
+                    compiled += 1
+        entry = target
+    else:
+        for path, relative in files:
+            name = "unren/" + relative
+            destination = output_dir / name
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, destination)
+            digest.update(name.encode("utf-8") + b"\0" + path.read_bytes())
+            if path.suffix == ".py":
+                _compile(destination, Path(importlib.util.cache_from_source(str(destination))), name)
+                compiled += 1
+        entry = output_dir
+
+    manifest = {
+        "format": "zip" if zipped else "dir",
+        "entry": target.name,
+        "python": sys.implementation.cache_tag,
+        "magic": importlib.util.MAGIC_NUMBER.hex(),
+        "files": len(files),
+        "compiled": compiled,
+        "sha256": digest.hexdigest(),
+    }
+    (output_dir / BUNDLE_MANIFEST).write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    return entry
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="unren.bundle", description="Build the precompiled unren bundle.")
+    parser.add_argument("-o", "--output", required=True, help="Output directory.")
+    parser.add_argument("--no-zip", dest="zipped", action="store_false", help="Write a package directory instead of unren.zip.")
+    args = parser.parse_args(argv)
+
+    output_dir = Path(args.output).expanduser()
+    entry = build_bundle(output_dir, zipped=args.zipped)
+    manifest = json.loads((output_dir / BUNDLE_MANIFEST).read_text("utf-8"))
+    print(f"{entry} ({manifest['compiled']} modules, {manifest['python']})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
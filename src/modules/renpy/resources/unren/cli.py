@@ -5,15 +5,27 @@ import sys
 from pathlib import Path
 from typing import Optional, Sequence
 
+# Subcommand modules are imported by their handlers, so `detect` and `list` don't load the
+# decompiler stacks.
+from .astexport import DUMP_FORMATS
 from .detect import detect_archive_extensions, detect_renpy_version
-from .rpa import extract_archives
-from .rpyc import decompile_paths
+from .timings import summarize, write_trace
 
 
 def _parse_paths(values):
     return [Path(value).expanduser() for value in values]
 
 
+def _parse_key(value: str) -> int:
+    try:
+        key = int(value, 16)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a hex number, got {value!r}") from None
+    if not 0 <= key <= 0xFFFFFFFF:
+        raise argparse.ArgumentTypeError(f"expected at most 8 hex digits, got {value!r}")
+    return key
+
+
 def _parse_exts(values):
     exts = []
     for value in values:
@@ -27,6 +39,42 @@ def _parse_exts(values):
     return exts
 
 
+def _want_timings(args) -> bool:
+    return args.timings or _trace_path(args) is not None
+
+
+def _trace_path(args) -> Optional[Path]:
+    profile_out = getattr(args, "profile_out", None)
+    if profile_out and profile_out.lower().endswith(".json"):
+        return Path(profile_out).expanduser()
+    return None
+
+
+def _report_timings(args, items) -> None:
+    items = list(items)
+    if args.timings:
+        for line in summarize(items):
+            print(line, file=sys.stderr)
+    trace_path = _trace_path(args)
+    if trace_path is not None:
+        write_trace(trace_path, items)
+
+
+def _limits(args):
+    from dataclasses import replace
+
+    from .limits import DEFAULT_LIMITS
+
+    caps = {
+        "max_decompressed": args.max_decompressed << 20 if args.max_decompressed is not None else None,
+        "max_objects": args.max_pickle_objects,
+        "max_memo": args.max_pickle_memo,
+        "max_depth": args.max_pickle_depth,
+    }
+    # Unset options keep the default, 0 removes the cap.
+    return replace(DEFAULT_LIMITS, **{name: value or None for name, value in caps.items() if value is not None})
+
+
 def _cmd_detect(args) -> int:
     base_dir = Path(args.path).expanduser()
     version = detect_renpy_version(base_dir)
@@ -36,7 +84,28 @@ def _cmd_detect(args) -> int:
     return 0
 
 
+def _cmd_list(args) -> int:
+    from .rpa import list_archives
+
+    paths = _parse_paths(args.paths)
+    base_dir = Path(args.base_dir).expanduser() if args.base_dir else None
+    results = list_archives(paths, base_dir=base_dir, recursive=args.recursive, detect_all=args.detect_all)
+
+    for result in results:
+        if result.state != "ok":
+            print(f"{result.archive_path} -> error: {result.error}")
+            continue
+        print(f"{result.archive_path} (RPA-{result.version}, {len(result.files)} files)")
+        if args.files:
+            for name in result.files:
+                print(f"  {name}")
+
+    return 0 if all(r.state == "ok" for r in results) else 1
+
+
 def _cmd_extract(args) -> int:
+    from .rpa import extract_archives, open_asset_store
+
     paths = _parse_paths(args.paths)
     output_dir = Path(args.output).expanduser() if args.output else None
     base_dir = Path(args.base_dir).expanduser() if args.base_dir else None
@@ -58,6 +127,8 @@ def _cmd_extract(args) -> int:
         move_to=Path(args.move_to).expanduser() if args.move_to else None,
         auto_retry=args.auto_retry,
         detect_all=args.detect_all,
+        timings=_want_timings(args),
+        asset_store=open_asset_store(Path(args.asset_store).expanduser()) if args.asset_store else None,
     )
 
     for result in results:
@@ -65,24 +136,174 @@ def _cmd_extract(args) -> int:
             print(f"{result.archive_path} -> {result.output_dir} ({result.extracted} files)")
         else:
             print(f"{result.archive_path} -> error: {result.error}")
+    _report_timings(args, ((str(r.archive_path), r.timings) for r in results))
 
     return 0 if all(r.state == "ok" for r in results) else 1
 
 
+def _cmd_gc(args) -> int:
+    from .rpa import open_asset_store
+
+    store = open_asset_store(Path(args.store).expanduser())
+    if not store.objects.is_dir():
+        raise SystemExit(f"No asset store at {store.root}")
+    result = store.collect(dry_run=args.dry_run)
+    action = "would remove" if args.dry_run else "removed"
+    print(f"{action} {result.blobs} unreferenced blobs ({result.freed / (1 << 20):.1f} MB), {result.kept} still linked")
+    return 0
+
+
+def _cmd_pack(args) -> int:
+    from .batch import resolve_game_dir
+    from .pack import collect_members, pack_archive, repack_game, startup_files
+
+    paths = _parse_paths(args.paths)
+    key = args.key
+    mb = 1 << 20
+
+    def report(result) -> None:
+        if result.state != "ok":
+            print(f"{result.archive_path} -> error: {result.error}")
+            return
+        shared = f", {result.duplicates} stored once with an identical file" if result.duplicates else ""
+        print(f"{result.archive_path} (RPA-3.0, {result.files} files, {result.stored_bytes / mb:.1f} MB{shared})")
+
+    if not args.repack:
+        if not args.output:
+            raise SystemExit("pack needs --output ARCHIVE (or --repack)")
+        archive_path = Path(args.output).expanduser()
+        base_dir = Path(args.base_dir).expanduser().resolve() if args.base_dir else None
+        if base_dir is not None:
+            paths = [path.resolve() for path in paths]
+            for path in paths:
+                if path != base_dir and base_dir not in path.parents:
+                    raise SystemExit(f"{path} is not inside --base-dir {base_dir}")
+        members = collect_members(paths, base_dir, exclude=[archive_path])
+        result = pack_archive(archive_path, members, key=key, threads=args.threads, timings=_want_timings(args))
+        report(result)
+        _report_timings(args, [(str(result.archive_path), result.timings)])
+        return 0 if result.state == "ok" else 1
+
+    results = []
+    for root in paths:
+        before = startup_files(resolve_game_dir(root)) if args.delete else None
+        repacked = repack_game(root, prefix=args.prefix, delete=args.delete, key=key, threads=args.threads, timings=_want_timings(args))
+        if repacked.error is not None:
+            print(f"{repacked.game_dir} -> error: {repacked.error}")
+            results.append(repacked)
+            continue
+        for result in repacked.archives:
+            report(result)
+        if repacked.archived:
+            action = "removed" if args.delete else "--delete removes them"
+            print(f"{repacked.game_dir}: {len(repacked.archived)} loose files are already in an archive ({action})")
+        for path in repacked.overrides:
+            print(f"{path}: differs from the archived copy, left loose")
+        if args.delete:
+            after = startup_files(repacked.game_dir)
+            print(f"{repacked.game_dir}: Ren'Py start lists {before[0]} -> {after[0]} loose files, {before[1]} -> {after[1]} archives")
+        _report_timings(args, ((str(result.archive_path), result.timings) for result in repacked.archives))
+        results.append(repacked)
+    return 0 if all(r.error is None and all(a.state == "ok" for a in r.archives) for r in results) else 1
+
+
+def _cmd_index(args) -> int:
+    from .searchindex import build_index
+
+    paths = _parse_paths(args.paths)
+    base_dirs = [Path(value).expanduser() for value in args.base_dir]
+    summary = build_index(
+        paths,
+        Path(args.output).expanduser() if args.output else None,
+        base_dir=base_dirs[0] if len(base_dirs) == 1 else None,
+        base_dirs=base_dirs if len(base_dirs) > 1 else None,
+        recursive=args.recursive,
+        try_harder=args.try_harder,
+        processes=args.processes,
+        limits=_limits(args),
+    )
+    states = {}
+    for result in summary.results:
+        states[result.state] = states.get(result.state, 0) + 1
+        if result.state == "error":
+            print(f"{result.input_path} -> error: {result.error}")
+    entries = sum(result.entries for result in summary.results)
+    print(
+        f"{summary.db_path}: {states.get('ok', 0)} files indexed ({entries} entries), "
+        f"{states.get('skip', 0)} unchanged, {summary.removed} removed, {states.get('error', 0)} failed"
+    )
+    return 0 if not states.get("error") else 1
+
+
+def _cmd_search(args) -> int:
+    from .searchindex import search_index
+
+    hits = search_index(Path(args.index).expanduser(), args.query, kinds=args.kind, limit=args.limit)
+    for hit in hits:
+        name = f"{hit.name}: " if hit.name and hit.text else hit.name
+        print(f"{hit.path}:{hit.line}: {hit.kind} {name}{hit.text}".rstrip())
+    return 0 if hits else 1
+
+
+def _cmd_vars(args) -> int:
+    from .variables import collect_variables, write_json
+
+    base_dirs = [Path(value).expanduser() for value in args.base_dir]
+    result = collect_variables(
+        _parse_paths(args.paths),
+        base_dir=base_dirs[0] if len(base_dirs) == 1 else None,
+        base_dirs=base_dirs if len(base_dirs) > 1 else None,
+        recursive=args.recursive,
+        try_harder=args.try_harder,
+        processes=args.processes,
+        limits=_limits(args),
+    )
+    if args.output:
+        output = Path(args.output).expanduser()
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with output.open("w", encoding="utf-8") as out_file:
+            write_json(result, out_file)
+    else:
+        write_json(result, sys.stdout)
+    for path, error in result.errors:
+        print(f"{path} -> error: {error}", file=sys.stderr)
+    return 0 if not result.errors else 1
+
+
 def _cmd_decompile(args) -> int:
+    from .rpyc import iter_decompile_paths
+
     paths = _parse_paths(args.paths)
     output_dir = Path(args.output).expanduser() if args.output else None
-    base_dir = Path(args.base_dir).expanduser() if args.base_dir else None
+    base_dir = None
+    base_dirs = None
+    if len(args.base_dir) == 1:
+        base_dir = Path(args.base_dir[0]).expanduser()
+    elif args.base_dir:
+        if len(args.base_dir) != len(paths):
+            raise SystemExit(f"Got {len(args.base_dir)} --base-dir options for {len(paths)} paths: give one, or one per path.")
+        base_dirs = _parse_paths(args.base_dir)
     renpy_path = Path(args.renpy_path).expanduser() if args.renpy_path else None
+    translate_cache = Path(args.translate_cache).expanduser() if args.translate_cache else None
+    store = None
+    if args.output_store:
+        from .store import STORE_FILE_NAMES, open_store
 
-    results = decompile_paths(
+        try:
+            store = open_store(output_dir / STORE_FILE_NAMES[args.output_store], output_dir, args.output_store)
+        except ValueError as exc:
+            raise SystemExit(str(exc))
+
+    results = iter_decompile_paths(
         paths,
         output_dir=output_dir,
         base_dir=base_dir,
+        base_dirs=base_dirs,
         recursive=args.recursive,
         overwrite=args.overwrite,
         try_harder=args.try_harder,
-        dump=args.dump,
+        dump=args.dump or args.dump_format != "text",
+        dump_format=args.dump_format,
         init_offset=args.init_offset,
         mode=args.mode,
         profiles=args.profile,
@@ -91,17 +312,141 @@ def _cmd_decompile(args) -> int:
         renpy_path=renpy_path,
         auto_retry=args.auto_retry,
         legacy_fallback=args.legacy_fallback,
+        route=args.route,
+        translate=args.translate,
+        translate_cache=translate_cache,
+        processes=args.processes,
+        timings=_want_timings(args),
+        limits=_limits(args),
+        output_store=store,
+        write_threads=args.write_threads,
+        duplicates=args.duplicates,
     )
 
-    for result in results:
-        if result.state == "ok":
-            print(f"{result.input_path} -> {result.output_path}")
-        elif result.state == "skip":
-            print(f"{result.input_path} -> skipped")
+    # Results are printed as they arrive and not kept, so a large game doesn't pile them up.
+    failed = False
+    timed = []
+    deduplicated = 0
+    try:
+        for result in results:
+            _report_decompile(result, store)
+            failed = failed or result.state not in ("ok", "skip")
+            deduplicated += result.duplicate_of is not None
+            if result.timings is not None:
+                timed.append((str(result.input_path), result.timings))
+    finally:
+        if store is not None:
+            store.close()
+    if deduplicated:
+        print(f"{deduplicated} duplicate files not decompiled again ({'linked' if args.duplicates == 'link' else 'copied'})", flush=True)
+    _report_timings(args, timed)
+
+    return 1 if failed else 0
+
+
+def _report_decompile(result, store) -> None:
+    same = f" (same as {result.duplicate_of})" if result.duplicate_of is not None else ""
+    if result.state == "ok" and store is not None:
+        print(f"{result.input_path} -> {store.path}:{store.name_for(result.output_path)}{same}", flush=True)
+    elif result.state == "ok":
+        print(f"{result.input_path} -> {result.output_path}{same}", flush=True)
+    elif result.state == "skip":
+        print(f"{result.input_path} -> skipped", flush=True)
+    elif result.state == "limit_exceeded":
+        print(f"{result.input_path} -> limit exceeded: {result.error}", flush=True)
+    else:
+        print(f"{result.input_path} -> error: {result.error}", flush=True)
+
+
+def _cmd_materialize(args) -> int:
+    from .store import materialize, open_store
+
+    path = Path(args.store).expanduser()
+    if not path.is_file():
+        raise SystemExit(f"No output store at {path}")
+    output_dir = Path(args.output).expanduser() if args.output else None
+    try:
+        store = open_store(path)
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    with store:
+        missing = [name for name in args.names if name not in store]
+        for name in missing:
+            print(f"{name} -> not in {path}", file=sys.stderr)
+        names = [name for name in args.names if name in store] if args.names else None
+        if args.stdout:
+            for name in store.names() if names is None else names:
+                sys.stdout.buffer.write(store.read(name))
+            sys.stdout.flush()
+            return 1 if missing else 0
+        for name, out_path, state in materialize(store, output_dir, names, args.overwrite):
+            print(f"{name} -> {out_path}" if state == "ok" else f"{name} -> skipped", flush=True)
+    return 1 if missing else 0
+
+
+def _cmd_batch(args) -> int:
+    from .batch import BatchGame, run_batch
+
+    priorities = {}
+    for value in args.priority:
+        path, _, priority = value.rpartition("=")
+        if not path:
+            raise SystemExit(f"--priority expects GAME=N, got {value!r}")
+        priorities[Path(path).expanduser().resolve()] = int(priority)
+    games = []
+    for root in _parse_paths(args.games):
+        games.append(BatchGame(root, priority=priorities.get(root.resolve(), 0)))
+
+    def report(item) -> None:
+        if item.state == "ok" and item.kind == "extract":
+            print(f"[{item.game}] {item.path} -> {item.extracted} files", flush=True)
+        elif item.state == "ok":
+            print(f"[{item.game}] {item.path} -> {item.output_path}", flush=True)
+        elif item.state == "skip":
+            print(f"[{item.game}] {item.path} -> skipped", flush=True)
+        elif item.state == "limit_exceeded":
+            print(f"[{item.game}] {item.path} -> limit exceeded: {item.error}", flush=True)
         else:
-            print(f"{result.input_path} -> error: {result.error}")
+            print(f"[{item.game}] {item.path} -> error: {item.error}", flush=True)
+
+    summary = run_batch(
+        games,
+        output_root=Path(args.output).expanduser() if args.output else None,
+        processes=args.processes,
+        mode=args.mode,
+        extract=args.extract,
+        extract_mode=args.extract_mode,
+        detect_all=args.detect_all,
+        try_harder=args.try_harder,
+        overwrite=args.overwrite,
+        auto_retry=args.auto_retry,
+        limits=_limits(args),
+        asset_store=Path(args.asset_store).expanduser() if args.asset_store else None,
+        on_item=report,
+    )
+    for game in summary.games:
+        states = ", ".join(f"{state} {count}" for state, count in sorted(game.states.items())) or "nothing to do"
+        print(f"{game.name}: {states} ({game.seconds:.1f} s)")
+    print(f"{len(summary.games)} games, {len(summary.items)} tasks on {summary.processes} workers in {summary.seconds:.1f} s")
+    if args.summary:
+        summary.write_json(Path(args.summary).expanduser())
+    return 0 if summary.ok else 1
 
-    return 0 if all(r.state != "error" for r in results) else 1
+
+def _add_timing_arguments(parser) -> None:
+    parser.add_argument("--timings", action="store_true", help="Print per-phase timings, byte counts and the slowest files to stderr.")
+    parser.add_argument(
+        "--profile-out",
+        metavar="PATH",
+        help="Write a cProfile/pstats file, or a per-file phase trace (Chrome trace format) if PATH ends in .json.",
+    )
+
+
+def _add_limit_arguments(parser) -> None:
+    parser.add_argument("--max-decompressed", type=int, metavar="MB", help="Largest decompressed rpyc data, in MiB (default 256, 0 for no cap); a capped decompress can peak at twice this.")
+    parser.add_argument("--max-pickle-objects", type=int, metavar="N", help="Most objects one rpyc may unpickle into (default 10M, 0 for no cap).")
+    parser.add_argument("--max-pickle-memo", type=int, metavar="N", help="Most pickle memo entries per rpyc (default 10M, 0 for no cap).")
+    parser.add_argument("--max-pickle-depth", type=int, metavar="N", help="Deepest nesting of containers and objects an rpyc pickle builds, not of its MARKs (default 10000, 0 for no cap).")
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -113,7 +458,34 @@ def build_parser() -> argparse.ArgumentParser:
     detect.add_argument("--deep", action="store_true", help="Recursively scan for archives when Ren'Py handlers are unavailable.")
     detect.set_defaults(func=_cmd_detect)
 
-    extract = subparsers.add_parser("extract", help="Extract RPA archives.")
+    list_ = subparsers.add_parser(
+        "list",
+        help="List RPA archives and their contents.",
+        description=(
+            "Reads RPA-2.0/3.0/3.2 indexes directly, without rpatool, and prints each archive's file count, "
+            "or every file with --files. An index inflates to at most 256 MiB, the rpyc cap."
+        ),
+    )
+    list_.add_argument("paths", nargs="+", help="Archive or directory paths.")
+    list_.add_argument("--base-dir", help="Base directory for archive extension detection.")
+    list_.add_argument("--files", action="store_true", help="Print every file in each archive.")
+    list_.add_argument("--no-recursive", dest="recursive", action="store_false")
+    list_.add_argument("--detect-all", action="store_true", help="Detect archives by signature, not just extension.")
+    list_.set_defaults(func=_cmd_list, recursive=True)
+
+    extract = subparsers.add_parser(
+        "extract",
+        help="Extract RPA archives.",
+        description=(
+            "With --runtime-fallback, all archives in a directory are registered with Ren'Py together and "
+            "indexed with one index_archives call. Entries are then read in offset order from one open handle "
+            "using the offsets in Ren'Py's index, trusted for an extension once the first file with it "
+            "matches what Ren'Py's loader returns. An extension whose first file differs (a game that patches "
+            "archive reads) or whose entry isn't a plain offset tuple is read through Ren'Py's loader "
+            "(runtime_reads in --timings). If the shared index call fails, that directory goes back to "
+            "indexing one archive at a time."
+        ),
+    )
     extract.add_argument("paths", nargs="+", help="Archive or directory paths.")
     extract.add_argument("-o", "--output", help="Output directory.")
     extract.add_argument("--base-dir", help="Base directory for relative output paths.")
@@ -127,16 +499,35 @@ def build_parser() -> argparse.ArgumentParser:
     extract.add_argument("--runtime-fallback", action="store_true", help="Use Ren'Py runtime fallback.")
     extract.add_argument("--no-auto-retry", dest="auto_retry", action="store_false", help="Disable automatic retries.")
     extract.add_argument("--renpy-path", help="Path to add to sys.path for Ren'Py runtime.")
+    extract.add_argument("--asset-store", metavar="DIR", help="Keep extracted files of 64 KiB or more once by content in DIR and hard link them into the output (copied without hard links); scripts stay plain files.")
+    _add_timing_arguments(extract)
     extract.set_defaults(func=_cmd_extract, recursive=True, auto_retry=True, detect_all=False)
 
-    decompile = subparsers.add_parser("decompile", help="Decompile RPYC/RPYMC files.")
+    decompile = subparsers.add_parser(
+        "decompile",
+        help="Decompile RPYC/RPYMC files.",
+        description=(
+            "In auto mode, files go straight to the legacy stack when the game's renpy/version.py is older "
+            "than 8 or the pickle looks like a Python 2 one (byte strings, protocol 2 or lower); they are "
+            "decompiled together in one legacy pass, and one that fails there is retried on the current "
+            "stack. Failures are classified (io, limit, missing, bad_header, unpickle, decompile) and only "
+            "strategies that can help are retried: an unwritable output or unreadable file is not retried, a "
+            "decompiler bug moves on to the next profile and the other stack but not to another reader, and a "
+            "bad header tries the other readers. The class is kept on each error as failure. Several roots "
+            "can be given, each with its own --base-dir; when two inputs map to the same output, the first "
+            "one wins and the later one is skipped. Every rpyc is read within the --max-* caps, also inside "
+            "the deobfuscator and the translation pass; a file over a cap is reported as limit exceeded and "
+            "is not retried with the legacy stack."
+        ),
+    )
     decompile.add_argument("paths", nargs="+", help="File or directory paths.")
     decompile.add_argument("-o", "--output", help="Output directory.")
-    decompile.add_argument("--base-dir", help="Base directory for relative output paths.")
+    decompile.add_argument("--base-dir", action="append", default=[], help="Base directory for relative output paths (once, or once per path).")
     decompile.add_argument("--no-recursive", dest="recursive", action="store_false")
     decompile.add_argument("--overwrite", action="store_true")
     decompile.add_argument("--try-harder", action="store_true")
     decompile.add_argument("--dump", action="store_true", help="Dump AST to text instead of rpy.")
+    decompile.add_argument("--dump-format", choices=DUMP_FORMATS, default="text", help="AST dump format (json/ndjson imply --dump). JSON objects carry _type and _id, cycles are written as {\"_ref\": id}, and ndjson writes one top level statement per line.")
     decompile.add_argument("--no-init-offset", dest="init_offset", action="store_false")
     decompile.add_argument("--mode", choices=["auto", "current", "legacy"], default="auto")
     decompile.add_argument("--profile", action="append", default=[], help="Profile override (repeat).")
@@ -144,8 +535,171 @@ def build_parser() -> argparse.ArgumentParser:
     decompile.add_argument("--yvan", action="store_true", help="Try YVANeusEX decryption.")
     decompile.add_argument("--no-auto-retry", dest="auto_retry", action="store_false", help="Disable automatic retries.")
     decompile.add_argument("--no-legacy-fallback", dest="legacy_fallback", action="store_false", help="Disable legacy fallback in auto/current mode.")
+    decompile.add_argument("--no-route", dest="route", action="store_false", help="In auto mode, try the current stack first even for old games.")
     decompile.add_argument("--renpy-path", help="Path to add to sys.path for Ren'Py runtime.")
-    decompile.set_defaults(func=_cmd_decompile, recursive=True, init_offset=True, auto_retry=True, legacy_fallback=True)
+    decompile.add_argument("--translate", metavar="LANG", help="Write dialogue and menu strings in the given translation language, collected by a first pass over every file (see -p) and cached until an input changes.")
+    decompile.add_argument("--translate-cache", help="Directory for the cached translation index (default: <output>/.unren).")
+    decompile.add_argument("-p", "--processes", type=int, help="Worker processes for the translation pass.")
+    decompile.add_argument(
+        "--output-store",
+        choices=["zip", "sqlite"],
+        help=(
+            "Write every output into one container in the output directory (decompiled.zip or decompiled.sqlite) instead of a file each. "
+            "A zip run writes to decompiled.zip.tmp and replaces the store when it ends, so a killed run leaves the last complete store; "
+            "SQLite replaces rows in place and suits frequent incremental runs on a large store."
+        ),
+    )
+    decompile.add_argument(
+        "--duplicates",
+        choices=["copy", "link", "off"],
+        default="copy",
+        help=(
+            "Decompile identical input files (same size, then blake2b) across all roots once and copy (default) or hard link the output to the others; "
+            "off decompiles each. A file that fails fails for its twins too."
+        ),
+    )
+    decompile.add_argument("--write-threads", type=int, default=4, metavar="N", help="Threads writing output files while the next file decompiles (default 4, 0 writes each file before the next). A file is reported once it is written.")
+    _add_limit_arguments(decompile)
+    _add_timing_arguments(decompile)
+    decompile.set_defaults(func=_cmd_decompile, recursive=True, init_offset=True, auto_retry=True, legacy_fallback=True, route=True)
+
+    materialize = subparsers.add_parser(
+        "materialize",
+        help="Write the files in a decompile output store out to disk.",
+        description=(
+            "Writes all or some entries of a store written by decompile --output-store out as files (default: "
+            "next to the store), or prints them. Entries are looked up by name, so reading one doesn't scan "
+            "the rest."
+        ),
+    )
+    materialize.add_argument("store", help="decompiled.zip or decompiled.sqlite written by decompile --output-store.")
+    materialize.add_argument("names", nargs="*", help="Only these entries (paths relative to the output directory).")
+    materialize.add_argument("-o", "--output", help="Output directory (default: the directory holding the store).")
+    materialize.add_argument("--overwrite", action="store_true")
+    materialize.add_argument("--stdout", action="store_true", help="Print the entries instead of writing files.")
+    materialize.set_defaults(func=_cmd_materialize)
+
+    gc = subparsers.add_parser(
+        "gc",
+        help="Remove asset store blobs no extracted game links to any more.",
+        description=(
+            "Removes files under DIR/objects that no extracted tree links to any more, for example after a "
+            "game's extraction was deleted."
+        ),
+    )
+    gc.add_argument("store", help="Asset store directory (extract --asset-store).")
+    gc.add_argument("--dry-run", action="store_true", help="Only report what would be removed.")
+    gc.set_defaults(func=_cmd_gc)
+
+    index = subparsers.add_parser(
+        "index",
+        help="Index labels, dialogue, menu choices, variables and python in rpyc files for search.",
+        description=(
+            "Reads the ASTs of the rpyc files under each path (routed to a stack as in an auto decompile, "
+            "without rendering any text) and writes labels, say lines (who and what), menu choices, defines "
+            "and defaults (name and expression), jumps and calls (target) and python blocks to a SQLite FTS5 "
+            "database. Each entry is located by the path of the .rpy a decompile with the same base dir would "
+            "write and by Ren'Py's line number, which the decompiler reproduces. A later run re-reads only "
+            "files whose blake2b digest changed, drops files that are gone, and retries files that failed. "
+            "From Python: unren.searchindex.build_index."
+        ),
+    )
+    index.add_argument("paths", nargs="+", help="Input files or directories.")
+    index.add_argument("-o", "--output", help="Index database (default: <first path>/.unren/index.sqlite).")
+    index.add_argument("--base-dir", action="append", default=[], help="Base directory for the indexed paths (once, or once per path).")
+    index.add_argument("--no-recursive", dest="recursive", action="store_false")
+    index.add_argument("--try-harder", action="store_true")
+    index.add_argument("-p", "--processes", type=int, help="Worker processes reading files (default: CPU count).")
+    _add_limit_arguments(index)
+    index.set_defaults(func=_cmd_index, recursive=True)
+
+    search = subparsers.add_parser(
+        "search",
+        help="Search an index written by unren index.",
+        description=(
+            "Prints the best matches as file:line: kind name: text. A query FTS5 can't parse is searched as a "
+            "phrase. From Python: unren.searchindex.search_index."
+        ),
+    )
+    search.add_argument("index", help="Index database.")
+    search.add_argument("query", help="FTS5 query, e.g. 'Sylvie', 'points NOT python' or 'chap*'.")
+    search.add_argument("--kind", action="append", default=[], choices=["label", "say", "menu", "define", "default", "jump", "call", "python"])
+    search.add_argument("--limit", type=int, default=50)
+    search.set_defaults(func=_cmd_search)
+
+    vars_ = subparsers.add_parser(
+        "vars",
+        help="Print the store variables rpyc files define, with initial values, as JSON.",
+        description=(
+            "Reads the ASTs of the rpyc files under each path the same way as index and writes the store "
+            "variables the game sets up: define and default statements and plain assignments at the top level "
+            "of init python blocks, sorted in init order (priority, then file and line). Each entry has the "
+            "name (persistent.x, mystore.x for other stores), kind, expression source, file and line as in "
+            "index, the init priority, and type/value when the expression is a literal (else type is null). "
+            "Python blocks with Python 2 only syntax are read statement by statement; define x[key] = ... and "
+            "define x += ... are left out. From Python: unren.variables.collect_variables."
+        ),
+    )
+    vars_.add_argument("paths", nargs="+", help="Input files or directories.")
+    vars_.add_argument("-o", "--output", help="Write the JSON to a file instead of stdout.")
+    vars_.add_argument("--base-dir", action="append", default=[], help="Base directory for the reported paths (once, or once per path).")
+    vars_.add_argument("--no-recursive", dest="recursive", action="store_false")
+    vars_.add_argument("--try-harder", action="store_true")
+    vars_.add_argument("-p", "--processes", type=int, help="Worker processes reading files (default: CPU count).")
+    _add_limit_arguments(vars_)
+    vars_.set_defaults(func=_cmd_vars, recursive=True)
+
+    pack = subparsers.add_parser(
+        "pack",
+        help="Write files into an RPA-3.0 archive, or pack a game's loose files into a few archives.",
+        description=(
+            "Files are read and hashed ahead of the writer, identical files are stored once, and the index is "
+            "pickled with protocol 2 so Ren'Py 6 to 8 read it. --repack packs each game's loose files into "
+            "PREFIX_scripts.rpa, PREFIX_images.rpa, PREFIX_audio.rpa, PREFIX_video.rpa and PREFIX_archive.rpa "
+            "next to its other archives, never overwriting one. .rpy/.rpym sources, Python files, saves/, "
+            "cache/, python-packages/ and the presplash stay loose. A loose file whose name is already in an "
+            "archive is not packed: an identical one is reported as archived, and one that differs overrides "
+            "the archived copy and stays loose. --delete removes the packed and already archived loose files "
+            "once the new archives' indexes have been read back, and prints how many loose files and archives "
+            "Ren'Py lists at start before and after. From Python: unren.pack.pack_archive and repack_game."
+        ),
+    )
+    pack.add_argument("paths", nargs="+", help="Files and directories to pack (with --repack: game roots).")
+    pack.add_argument("-o", "--output", help="Archive to write.")
+    pack.add_argument("--base-dir", help="Name files relative to this directory (default: each directory given).")
+    pack.add_argument("--key", type=_parse_key, default="42424242", metavar="HEX", help="RPA-3.0 index key (default 42424242, 0 for none).")
+    pack.add_argument("--threads", type=int, default=4, metavar="N", help="Threads reading and hashing files ahead of the writer (default 4, 0 for none).")
+    pack.add_argument("--repack", action="store_true", help="Pack each game's loose files into PREFIX_scripts.rpa, PREFIX_images.rpa, ... in its game dir.")
+    pack.add_argument("--prefix", default="unren", help="Name prefix of the repacked archives (default unren).")
+    pack.add_argument("--delete", action="store_true", help="With --repack, remove the loose files once they are in an archive.")
+    _add_timing_arguments(pack)
+    pack.set_defaults(func=_cmd_pack)
+
+    batch = subparsers.add_parser(
+        "batch",
+        help="Extract and decompile several games with one shared worker pool.",
+        description=(
+            "Runs the launcher's extractGame steps (extract archives, decompile the game dir, decompile what "
+            "was extracted) for every game through one queue and one worker pool. Tasks run biggest first, "
+            "round robin between games. Workers are started once and keep the decompiler stacks loaded across "
+            "games. From Python: unren.batch.run_batch."
+        ),
+    )
+    batch.add_argument("games", nargs="+", help="Game roots (the folder holding game/, or game/ itself).")
+    batch.add_argument("-o", "--output", help="Write each game to OUTPUT/<game name> instead of into its game dir.")
+    batch.add_argument("-p", "--processes", type=int, help="Worker processes shared by all games (default: CPU count).")
+    batch.add_argument("--priority", action="append", default=[], metavar="GAME=N", help="Schedule a game ahead of lower ones (default 0, repeat).")
+    batch.add_argument("--mode", choices=["auto", "current", "legacy"], default="auto", help="Decompile mode.")
+    batch.add_argument("--extract-mode", choices=["all", "code", "assets"], default="all")
+    batch.add_argument("--no-extract", dest="extract", action="store_false", help="Only decompile scripts already on disk.")
+    batch.add_argument("--detect-all", action="store_true", help="Detect archives by signature, not just extension.")
+    batch.add_argument("--try-harder", action="store_true")
+    batch.add_argument("--overwrite", action="store_true")
+    batch.add_argument("--no-auto-retry", dest="auto_retry", action="store_false", help="Disable automatic retries.")
+    batch.add_argument("--summary", metavar="PATH", help="Write a JSON summary of every game (state counts and times) and task (including failure classes).")
+    batch.add_argument("--asset-store", metavar="DIR", help="Keep extracted assets once by content in DIR, hard linked into every game.")
+    _add_limit_arguments(batch)
+    batch.set_defaults(func=_cmd_batch, extract=True, auto_retry=True)
 
     return parser
 
@@ -153,6 +707,20 @@ def build_parser() -> argparse.ArgumentParser:
 def main(argv: Optional[Sequence[str]] = None) -> int:
     parser = build_parser()
     args = parser.parse_args(argv)
+    if getattr(args, "translate", None) and (args.dump or args.dump_format != "text"):
+        parser.error("--translate cannot be used with --dump.")
+    if getattr(args, "output_store", None) and not args.output:
+        parser.error("--output-store needs --output.")
+
+    profile_out = getattr(args, "profile_out", None)
+    if profile_out and _trace_path(args) is None:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(args.func, args)
+        finally:
+            profiler.dump_stats(str(Path(profile_out).expanduser()))
     return args.func(args)
 
 
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+DUPLICATE_MODES = ("copy", "link", "off")
+
+_CHUNK = 1 << 20
+
+
+def file_digest(path: Path) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(_CHUNK), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def find_duplicates(paths: Sequence[Path]) -> Dict[Path, List[Path]]:
+    """
+    Groups files with the same bytes: compared by size first, then by digest for the sizes that
+    repeat. Maps the first path of each group to the later ones; files without a twin are left out.
+    """
+    by_size: Dict[int, List[Path]] = {}
+    for path in paths:
+        by_size.setdefault(path.stat().st_size, []).append(path)
+
+    duplicates: Dict[Path, List[Path]] = {}
+    for same_size in by_size.values():
+        if len(same_size) < 2:
+            continue
+        by_digest: Dict[bytes, List[Path]] = {}
+        for path in same_size:
+            by_digest.setdefault(file_digest(path), []).append(path)
+        for group in by_digest.values():
+            if len(group) > 1:
+                duplicates[group[0]] = group[1:]
+    return duplicates
+
+
+def fan_out(source: Path, target: Path, mode: str, store=None) -> None:
+    """Gives target the output already written for source: a copy, or a hard link where possible."""
+    if store is not None:
+        store.write(store.name_for(target), store.read(store.name_for(source)))
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target.with_suffix(target.suffix + ".tmp")
+    try:
+        linked = False
+        if mode == "link":
+            try:
+                os.link(source, temp_path)
+                linked = True
+            except OSError:
+                # Another volume, or a filesystem without hard links.
+                pass
+        if not linked:
+            shutil.copyfile(source, temp_path)
+        temp_path.replace(target)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def root_bases(paths: Sequence[Path], base_dir: Optional[Path], base_dirs: Optional[Sequence[Optional[Path]]]) -> List[Optional[Path]]:
+    """The base dir for each input root: its own from base_dirs, else the shared base_dir."""
+    if base_dirs is None:
+        return [base_dir] * len(paths)
+    if len(base_dirs) != len(paths):
+        raise ValueError(f"Got {len(base_dirs)} base dirs for {len(paths)} paths")
+    return [base if base is not None else base_dir for base in base_dirs]
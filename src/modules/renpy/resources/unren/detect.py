@@ -44,6 +44,15 @@ def detect_renpy_version(base_dir: Path) -> Optional[int]:
     return None
 
 
+def find_renpy_version(path: Path, levels: int = 3) -> Optional[int]:
+    """detect_renpy_version for the game root above path (a file, the game dir or the root itself)."""
+    start = path if path.is_dir() else path.parent
+    for candidate in [start, *list(start.parents)[:levels]]:
+        if (candidate / "renpy" / "version.py").is_file():
+            return detect_renpy_version(candidate)
+    return None
+
+
 def try_renpy_handlers() -> Optional[List[str]]:
     try:
         import renpy.object  # type: ignore
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import struct
+import traceback
+import zlib
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional
+
+# Innermost frames kept in ErrorRecord.traceback, and the most characters kept of them. Every
+# result of a run can hold a record, so this is most of what a failed file costs once it's done.
+TRACEBACK_FRAMES = 12
+TRACEBACK_CHARS = 1024
+
+# What each class of failure still leaves worth trying:
+#   read     another AST reader on the same stack (deobfuscate, runtime, yvan)
+#   profile  another decompiler profile for the same AST
+#   stack    the other decompiler stack (legacy after current, current for routed files)
+#   extract  another archive extractor
+RETRY_POLICY: Dict[str, FrozenSet[str]] = {
+    "interrupt": frozenset(),
+    "io": frozenset(),
+    "limit": frozenset(),
+    "missing": frozenset({"read", "stack", "extract"}),
+    "bad_header": frozenset({"read", "stack", "extract"}),
+    "unpickle": frozenset({"read", "stack"}),
+    "decompile": frozenset({"profile", "stack"}),
+    "unknown": frozenset({"read", "profile", "stack", "extract"}),
+}
+
+
+def classify(exc: BaseException, phase: Optional[str] = None) -> str:
+    """The RETRY_POLICY class of exc, raised during phase."""
+    if not isinstance(exc, Exception):
+        return "interrupt"
+    failure = getattr(exc, "failure", None)
+    if failure in RETRY_POLICY:
+        return failure
+    if isinstance(exc, MemoryError):
+        return "limit"
+    if isinstance(exc, OSError):
+        return "io"
+    if isinstance(exc, ImportError):
+        return "missing"
+    if type(exc).__name__ == "BadRpycException" or isinstance(exc, (zlib.error, struct.error, EOFError)):
+        return "bad_header"
+    if phase in ("read", "index"):
+        return "unpickle"
+    if phase in ("decompile", "dump"):
+        return "decompile"
+    if phase == "extract":
+        return "bad_header"
+    return "unknown"
+
+
+def should_retry(exc: BaseException, phase: Optional[str], strategy: str) -> bool:
+    """Whether strategy can plausibly fix exc, raised during phase."""
+    return strategy in RETRY_POLICY[classify(exc, phase)]
+
+
+@dataclass(frozen=True)
+class ErrorRecord:
+    """What is kept of an exception once a result is recorded: no frames, no AST."""
+
+    type: str
+    message: str
+    traceback: str
+    phase: Optional[str] = None
+    # The RETRY_POLICY class, which decided what was tried after this failure.
+    failure: Optional[str] = None
+
+    @property
+    def retry(self) -> FrozenSet[str]:
+        return RETRY_POLICY.get(self.failure or "unknown", frozenset())
+
+    def __str__(self) -> str:
+        return self.message
+
+
+def _format_traceback(exc: BaseException) -> str:
+    # The innermost frames and the exception line, cut at the start of a line when too long.
+    text = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__, limit=-TRACEBACK_FRAMES))
+    if len(text) <= TRACEBACK_CHARS:
+        return text
+    tail = text[-TRACEBACK_CHARS:]
+    start = tail.find("\n") + 1
+    return "...\n" + (tail[start:] if 0 < start < len(tail) else tail)
+
+
+def capture(exc: BaseException, phase: Optional[str] = None) -> ErrorRecord:
+    """
+    Formats exc into an ErrorRecord and drops its tracebacks. The frames of a failed decompile
+    hold the unpickled AST, the raw file and the decompiler, so keeping the exception would keep
+    all of that alive for as long as the result is.
+    """
+    record = ErrorRecord(type(exc).__name__, str(exc), _format_traceback(exc), phase, classify(exc, phase))
+
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if exc.__traceback__ is not None:
+            traceback.clear_frames(exc.__traceback__)
+            exc.__traceback__ = None
+        exc = exc.__cause__ or exc.__context__
+    return record
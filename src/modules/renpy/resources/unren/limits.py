@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import pickle
+import types
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Limits:
+    """Caps for reading one untrusted rpyc file. None disables a cap."""
+
+    # Bytes a single zlib blob may expand to.
+    max_decompressed: Optional[int] = 256 << 20
+    # Objects the unpickler may build (containers, instances, strings, numbers).
+    max_objects: Optional[int] = 10_000_000
+    # Entries in the pickle memo.
+    max_memo: Optional[int] = 10_000_000
+    # How deep containers and objects nest in what the pickle builds (and open MARKs in its stream).
+    max_depth: Optional[int] = 10_000
+
+
+DEFAULT_LIMITS = Limits()
+
+
+class LimitExceeded(Exception):
+    """A file needed more than a Limits cap allows."""
+
+    failure = "limit"
+
+    def __init__(self, limit: str, value: int) -> None:
+        super().__init__(f"{limit} exceeded: more than {value:,}")
+        self.limit = limit
+        self.value = value
+
+
+class Budget:
+    """The limits for the read in progress, and the first one it ran over."""
+
+    def __init__(self, limits: Limits) -> None:
+        self.limits = limits
+        self.exceeded: Optional[LimitExceeded] = None
+
+    def check(self) -> None:
+        # Once over a cap, every later decompress or unpickle of the same read fails at once, so
+        # callers that swallow errors and retry (the deobfuscator) don't repeat the work.
+        if self.exceeded is not None:
+            raise self.exceeded
+
+    def trip(self, limit: str, value: int) -> LimitExceeded:
+        exc = LimitExceeded(limit, value)
+        if self.exceeded is None:
+            self.exceeded = exc
+        return exc
+
+
+_BUDGET: ContextVar[Optional[Budget]] = ContextVar("unren_budget", default=None)
+
+
+@contextmanager
+def enforce(limits: Limits) -> Iterator[Budget]:
+    """
+    Applies limits to every decompress and unpickle in the block, including the ones the vendored
+    deobfuscator and renpycompat make (see patches.apply_limit_patches).
+    """
+    budget = Budget(limits)
+    token = _BUDGET.set(budget)
+    try:
+        yield budget
+    finally:
+        _BUDGET.reset(token)
+
+
+def current_budget() -> Budget:
+    budget = _BUDGET.get()
+    return budget if budget is not None else Budget(DEFAULT_LIMITS)
+
+
+def decompress(data: bytes) -> bytes:
+    """zlib.decompress that stops at max_decompressed instead of allocating the whole output."""
+    budget = current_budget()
+    budget.check()
+    limit = budget.limits.max_decompressed
+    if limit is None:
+        return zlib.decompress(data)
+    decompressor = zlib.decompressobj()
+    contents = decompressor.decompress(data, limit + 1)
+    if len(contents) > limit:
+        raise budget.trip("max_decompressed", limit)
+    if not decompressor.eof:
+        raise zlib.error("Error -5 while decompressing data: incomplete or truncated stream")
+    return contents
+
+
+_OBJECT_OPCODES = (
+    pickle.EMPTY_DICT, pickle.EMPTY_LIST, pickle.EMPTY_SET, pickle.DICT, pickle.LIST, pickle.TUPLE,
+    pickle.TUPLE1, pickle.TUPLE2, pickle.TUPLE3, pickle.FROZENSET, pickle.NEWOBJ, pickle.NEWOBJ_EX,
+    pickle.OBJ, pickle.INST, pickle.REDUCE, pickle.BINUNICODE, pickle.SHORT_BINUNICODE,
+    pickle.BINUNICODE8, pickle.UNICODE, pickle.BINSTRING, pickle.SHORT_BINSTRING, pickle.STRING,
+    pickle.BINBYTES, pickle.SHORT_BINBYTES, pickle.BINBYTES8, pickle.BYTEARRAY8, pickle.LONG,
+    pickle.LONG1, pickle.LONG4, pickle.BINFLOAT, pickle.FLOAT,
+)
+_MEMO_OPCODES = (pickle.PUT, pickle.BINPUT, pickle.LONG_BINPUT, pickle.MEMOIZE)
+_FETCH_OPCODES = (pickle.GET, pickle.BINGET, pickle.LONG_BINGET, pickle.DUP)
+
+# Values nothing can nest in, and containers, which add a level over what they hold.
+_LEAVES = (str, bytes, bytearray, int, float, complex, type(None), type, types.FunctionType, types.BuiltinFunctionType)
+_CONTAINERS = (list, tuple, dict, set, frozenset)
+_LEAF_TYPES = frozenset(_LEAVES) | {bool}
+_CONTAINER_TYPES = frozenset(_CONTAINERS)
+
+
+def _top(count: int):
+    return lambda self: self.stack[-count:]
+
+
+def _marked(self):
+    # The items pushed since the last MARK; popping the mark swaps the list out rather than emptying it.
+    return self.stack
+
+
+# Opcodes that put what is on the stack into an object: (target before the op, its new children),
+# and opcodes that build a new object, which ends up on top of the stack, from their children.
+_FILLING = {
+    pickle.APPEND: lambda self: (self.stack[-2], self.stack[-1:]),
+    pickle.SETITEM: lambda self: (self.stack[-3], self.stack[-2:]),
+    pickle.BUILD: lambda self: (self.stack[-2], self.stack[-1:]),
+    pickle.APPENDS: lambda self: (self.metastack[-1][-1], self.stack),
+    pickle.SETITEMS: lambda self: (self.metastack[-1][-1], self.stack),
+    pickle.ADDITEMS: lambda self: (self.metastack[-1][-1], self.stack),
+}
+_BUILDING = {
+    pickle.TUPLE1: _top(1), pickle.TUPLE2: _top(2), pickle.TUPLE3: _top(3), pickle.REDUCE: _top(2),
+    pickle.NEWOBJ: _top(2), pickle.NEWOBJ_EX: _top(3), pickle.TUPLE: _marked, pickle.LIST: _marked,
+    pickle.DICT: _marked, pickle.FROZENSET: _marked, pickle.OBJ: _marked, pickle.INST: _marked,
+}
+
+
+def _weight(parent, child) -> int:
+    # A container is one level over what it holds; an object is as deep as its state when that is
+    # a container, and one over it otherwise.
+    return 1 if isinstance(parent, _CONTAINERS) or not isinstance(child, _CONTAINERS) else 0
+
+
+def _members(obj) -> Iterator:
+    # What an object built by the unpickler holds: the items of a container, or an instance's
+    # attributes (its state, one level down).
+    if isinstance(obj, dict):
+        yield from obj.keys()
+        yield from obj.values()
+    elif isinstance(obj, _CONTAINERS):
+        yield from obj
+    else:
+        yield from getattr(obj, "__dict__", {}).values()
+        for cls in type(obj).__mro__:
+            slots = cls.__dict__.get("__slots__", ())
+            for name in (slots,) if isinstance(slots, str) else slots:
+                if name not in ("__dict__", "__weakref__") and hasattr(obj, name):
+                    yield getattr(obj, name)
+
+
+class _Nesting:
+    """
+    How deep the objects built so far nest. Pickles store an object after everything in it, so an
+    object's height is known when it is put into another, and only objects no other object holds
+    yet are tracked. An object the memo (GET) or DUP brings back after that is measured by walking
+    it; one filled after it was brought back (cycles, crafted streams) leaves the depth to a walk
+    over the whole result, at the end of the load.
+    """
+
+    def __init__(self, budget: Budget, limit: int) -> None:
+        self.budget = budget
+        self.limit = limit
+        # id -> (object, height) for objects no other object holds yet, and for objects brought
+        # back by GET or DUP (and what they hold, once walked), which can be put into others, or
+        # filled, again. Entries keep the ids taken.
+        self.heights: Dict[int, Tuple[object, int]] = {}
+        self.fetched: Dict[int, Tuple[object, int]] = {}
+        self.late = False
+
+    def fetch(self, obj) -> None:
+        if isinstance(obj, _LEAVES):
+            return
+        key = id(obj)
+        if key in self.fetched:
+            return
+        entry = self.heights.pop(key, None)
+        if entry is None:
+            entry = (obj, self.measure(obj, self.fetched))
+        self.fetched[key] = entry
+
+    def add(self, target, children) -> None:
+        heights = self.heights
+        fetched = self.fetched
+        container = isinstance(target, _CONTAINERS)
+        height = 0
+        for child in children:
+            cls = type(child)
+            if cls in _LEAF_TYPES or (cls not in _CONTAINER_TYPES and isinstance(child, _LEAVES)):
+                height = height or 1
+                continue
+            key = id(child)
+            entry = fetched.get(key) or heights.pop(key, None)
+            child_height = entry[1] if entry is not None else 0
+            if container or not (cls in _CONTAINER_TYPES or isinstance(child, _CONTAINERS)):
+                child_height += 1
+            if child_height > height:
+                height = child_height
+
+        key = id(target)
+        entry = fetched.get(key) or heights.get(key)
+        if entry is not None and height <= entry[1]:
+            return
+        if height > self.limit:
+            raise self.budget.trip("max_depth", self.limit)
+        if key in fetched:
+            # Whatever already holds it is now deeper than recorded.
+            fetched[key] = (target, height)
+            self.late = True
+        else:
+            heights[key] = (target, height)
+
+    def finish(self, result) -> None:
+        if self.late:
+            self.measure(result, {})
+
+    def measure(self, root, heights: Dict[int, Tuple[object, int]]) -> int:
+        # Height of root, walking what it holds; heights caches what was walked. Objects still being
+        # walked (cycles) are skipped.
+        running = {id(root): 0}
+        pending = [(root, _members(root))]
+        while True:
+            current, members = pending[-1]
+            for member in members:
+                if isinstance(member, _LEAVES):
+                    running[id(current)] = max(running[id(current)], 1)
+                elif id(member) in heights:
+                    running[id(current)] = max(running[id(current)], heights[id(member)][1] + _weight(current, member))
+                elif id(member) not in running:
+                    running[id(member)] = 0
+                    pending.append((member, _members(member)))
+                    break
+            else:
+                pending.pop()
+                height = running.pop(id(current))
+                if height > self.limit:
+                    raise self.budget.trip("max_depth", self.limit)
+                heights[id(current)] = (current, height)
+                if not pending:
+                    return height
+                parent = pending[-1][0]
+                running[id(parent)] = max(running[id(parent)], height + _weight(parent, current))
+
+
+def limited_unpickler(base: type) -> type:
+    """
+    Subclass of a pure-Python unpickler (pickle._Unpickler and its subclasses) that counts what it
+    builds against the current budget.
+    """
+
+    class LimitedUnpickler(base):
+        dispatch = dict(base.dispatch)
+
+        def load(self):
+            self._budget = current_budget()
+            self._budget.check()
+            self._objects = 0
+            limit = self._budget.limits.max_depth
+            self._nesting = _Nesting(self._budget, limit) if limit is not None else None
+            try:
+                result = super().load()
+                if self._nesting is not None:
+                    self._nesting.finish(result)
+                return result
+            finally:
+                self._nesting = None
+
+    def counting(op):
+        def load_op(self):
+            self._objects += 1
+            limit = self._budget.limits.max_objects
+            if limit is not None and self._objects > limit:
+                raise self._budget.trip("max_objects", limit)
+            op(self)
+        return load_op
+
+    def memoizing(op):
+        def load_op(self):
+            op(self)
+            limit = self._budget.limits.max_memo
+            if limit is not None and len(self.memo) > limit:
+                raise self._budget.trip("max_memo", limit)
+        return load_op
+
+    def marking(op):
+        def load_op(self):
+            op(self)
+            limit = self._budget.limits.max_depth
+            if limit is not None and len(self.metastack) > limit:
+                raise self._budget.trip("max_depth", limit)
+        return load_op
+
+    def filling(op, find):
+        def load_op(self):
+            if self._nesting is None:
+                return op(self)
+            target, children = find(self)
+            op(self)
+            self._nesting.add(target, children)
+        return load_op
+
+    def building(op, find):
+        def load_op(self):
+            if self._nesting is None:
+                return op(self)
+            children = find(self)
+            op(self)
+            if not isinstance(self.stack[-1], _LEAVES):
+                self._nesting.add(self.stack[-1], children)
+        return load_op
+
+    def fetching(op):
+        def load_op(self):
+            op(self)
+            if self._nesting is not None:
+                self._nesting.fetch(self.stack[-1])
+        return load_op
+
+    dispatch = LimitedUnpickler.dispatch
+    for opcodes, wrap in ((_FETCH_OPCODES, fetching), (_OBJECT_OPCODES, counting), (_MEMO_OPCODES, memoizing), ((pickle.MARK,), marking)):
+        for opcode in opcodes:
+            if opcode[0] in dispatch:
+                dispatch[opcode[0]] = wrap(dispatch[opcode[0]])
+    for opcodes, wrap in ((_FILLING, filling), (_BUILDING, building)):
+        for opcode, find in opcodes.items():
+            if opcode[0] in dispatch:
+                dispatch[opcode[0]] = wrap(dispatch[opcode[0]], find)
+
+    LimitedUnpickler.__name__ = LimitedUnpickler.__qualname__ = f"Limited{base.__name__}"
+    return LimitedUnpickler
@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .batch import resolve_game_dir
+from .detect import detect_archive_extensions
+from .errors import ErrorRecord, capture
+from .rpa import read_rpa_index
+from .timings import Timings, new_timings, result_timings
+
+# Ren'Py's own archiver uses this key; 0 leaves the index offsets as they are.
+DEFAULT_KEY = 0x42424242
+DEFAULT_PACK_THREADS = 4
+# File bytes read ahead of the archive writer.
+DEFAULT_PACK_BUFFER = 256 << 20
+
+_HEADER_LENGTH = 34
+
+# Repacked archives by extension; everything else goes to PREFIX_archive.rpa.
+REPACK_GROUPS = {
+    "scripts": {".rpyc", ".rpymc"},
+    "images": {".png", ".jpg", ".jpeg", ".webp", ".avif", ".gif", ".bmp", ".svg"},
+    "audio": {".ogg", ".opus", ".mp3", ".wav", ".flac", ".m4a"},
+    "video": {".webm", ".mkv", ".mp4", ".ogv", ".avi", ".mpg", ".mpeg"},
+}
+# Left loose by repack: sources people edit, Python modules, and what Ren'Py reads before (or
+# without) its archives.
+LOOSE_EXTENSIONS = {".rpy", ".rpym", ".rpyb", ".rpe", ".py", ".pyc", ".pyo", ".tmp"}
+LOOSE_DIRS = {"saves", "cache", "python-packages", ".unren", "__pycache__"}
+LOOSE_NAMES = {"presplash.png", "presplash.jpg", "presplash.webp", "log.txt", "traceback.txt", "errors.txt"}
+
+# (name in the archive, file)
+Member = Tuple[str, Path]
+
+
+@dataclass
+class PackResult:
+    archive_path: Path
+    state: str
+    files: int = 0
+    stored_bytes: int = 0
+    duplicates: int = 0
+    error: Optional[ErrorRecord] = None
+    timings: Optional[Timings] = None
+
+
+@dataclass
+class RepackResult:
+    game_dir: Path
+    archives: List[PackResult] = field(default_factory=list)
+    # Loose files with the same bytes as the copy in an existing archive.
+    archived: List[Path] = field(default_factory=list)
+    # Loose files that differ from the archived copy: they override it, so they stay loose.
+    overrides: List[Path] = field(default_factory=list)
+    kept: List[Path] = field(default_factory=list)
+    removed: int = 0
+    error: Optional[ErrorRecord] = None
+
+
+def _load(path: Path) -> Tuple[bytes, bytes, float, float]:
+    start = time.perf_counter()
+    data = path.read_bytes()
+    digest = hashlib.blake2b(data, digest_size=16).digest()
+    return data, digest, start, time.perf_counter() - start
+
+
+def _read_ahead(members: Sequence[Member], threads: int, max_buffer: int) -> Iterator[Tuple[str, bytes, bytes, float, float]]:
+    """Yields (name, data, digest, start, seconds) in member order, read and hashed on threads."""
+    if threads <= 0:
+        for name, path in members:
+            yield (name,) + _load(path)
+        return
+
+    with ThreadPoolExecutor(threads, thread_name_prefix="unren-pack") as pool:
+        window: Deque[Tuple[str, int, Future]] = deque()
+        buffered = 0
+        for name, path in members:
+            size = path.stat().st_size
+            while window and (buffered + size > max_buffer or len(window) >= threads * 8):
+                done_name, done_size, future = window.popleft()
+                buffered -= done_size
+                yield (done_name,) + future.result()
+            window.append((name, size, pool.submit(_load, path)))
+            buffered += size
+        while window:
+            done_name, _, future = window.popleft()
+            yield (done_name,) + future.result()
+
+
+def pack_archive(
+    archive_path: Path,
+    members: Sequence[Member],
+    *,
+    key: int = DEFAULT_KEY,
+    threads: int = DEFAULT_PACK_THREADS,
+    max_buffer: int = DEFAULT_PACK_BUFFER,
+    timings: bool = False,
+) -> PackResult:
+    """
+    Writes members into an RPA-3.0 archive at archive_path, in the order given. Files are read and
+    hashed on threads while earlier ones are written; members with the same bytes are stored once
+    and share an index entry's offset. The archive is written to a temp file and renamed into place.
+    """
+    archive_timings = new_timings(timings)
+    stats = result_timings(archive_timings)
+    temp_path = archive_path.with_name(archive_path.name + ".tmp")
+    stored_bytes = duplicates = 0
+    try:
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
+        index: Dict[str, list] = {}
+        offsets: Dict[bytes, int] = {}
+        with temp_path.open("wb") as out:
+            out.write(b"\0" * _HEADER_LENGTH)
+            for name, data, digest, start, seconds in _read_ahead(members, threads, max_buffer):
+                archive_timings.add("read", start, seconds)
+                archive_timings.count("read_bytes", len(data))
+                offset = offsets.get(digest)
+                if offset is None:
+                    offset = out.tell()
+                    with archive_timings.phase("write"):
+                        out.write(data)
+                    offsets[digest] = offset
+                    stored_bytes += len(data)
+                    archive_timings.count("written_bytes", len(data))
+                else:
+                    duplicates += 1
+                index[name] = [(offset ^ key, len(data) ^ key, b"")]
+
+            with archive_timings.phase("index"):
+                index_offset = out.tell()
+                # Protocol 2 so Ren'Py 6 and 7 (Python 2) read it too.
+                out.write(zlib.compress(pickle.dumps(index, 2)))
+                out.seek(0)
+                out.write(b"RPA-3.0 %016x %08x\n" % (index_offset, key))
+        temp_path.replace(archive_path)
+    except Exception as exc:
+        return PackResult(archive_path, "error", error=capture(exc, "pack"), timings=stats)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    return PackResult(archive_path, "ok", len(index), stored_bytes, duplicates, timings=stats)
+
+
+def collect_members(paths: Sequence[Path], base_dir: Optional[Path] = None, exclude: Sequence[Path] = ()) -> List[Member]:
+    """
+    Members for the given files and directories, named relative to base_dir, or else to each
+    directory given (a file on its own keeps its name). Sorted by name, so related files sit
+    together in the archive.
+    """
+    skip = {path.resolve() for path in exclude}
+    members: Dict[str, Path] = {}
+    for path in paths:
+        root = base_dir or (path if path.is_dir() else path.parent)
+        files = [path] if path.is_file() else sorted(p for p in path.rglob("*") if p.is_file())
+        for file in files:
+            if file.resolve() in skip:
+                continue
+            members.setdefault(file.relative_to(root).as_posix(), file)
+    return sorted(members.items())
+
+
+def _archived_bytes(archive_path: Path, entry: Tuple[int, int, bytes]) -> bytes:
+    offset, length, prefix = entry
+    with archive_path.open("rb") as handle:
+        handle.seek(offset)
+        return prefix + handle.read(length - len(prefix))
+
+
+def _archive_name(game_dir: Path, prefix: str, group: str) -> Path:
+    # Never write over an archive, not even one an earlier repack made.
+    path = game_dir / f"{prefix}_{group}.rpa"
+    number = 2
+    while path.exists():
+        path = game_dir / f"{prefix}_{group}_{number}.rpa"
+        number += 1
+    return path
+
+
+def _remove_empty_dirs(game_dir: Path, removed: Sequence[Path]) -> None:
+    # Only folders the removed files left empty, deepest first.
+    for dir_path in sorted({path.parent for path in removed}, key=lambda path: len(path.parts), reverse=True):
+        while dir_path != game_dir and dir_path.is_dir() and not any(dir_path.iterdir()):
+            dir_path.rmdir()
+            dir_path = dir_path.parent
+
+
+def repack_game(
+    root: Path,
+    *,
+    prefix: str = "unren",
+    delete: bool = False,
+    key: int = DEFAULT_KEY,
+    threads: int = DEFAULT_PACK_THREADS,
+    max_buffer: int = DEFAULT_PACK_BUFFER,
+    timings: bool = False,
+) -> RepackResult:
+    """
+    Packs a game's loose files into a few archives (PREFIX_scripts.rpa, PREFIX_images.rpa, ...)
+    next to its other archives. Ren'Py lets a loose file win over an archived one, so loose files
+    whose name is already in an archive are left alone: identical ones are reported as archived,
+    different ones as overrides. Sources, Python modules, saves and caches stay loose.
+
+    With delete, the packed files and the identical archived ones are removed once the archive
+    holding them has been written and its index read back.
+    """
+    game_dir = resolve_game_dir(root)
+    result = RepackResult(game_dir)
+
+    extensions = {ext.lower() for ext in detect_archive_extensions(game_dir)} | {".rpa"}
+    archived: Dict[str, Tuple[Path, Tuple[int, int, bytes]]] = {}
+    try:
+        for archive_path in sorted(game_dir.iterdir()):
+            if archive_path.is_file() and archive_path.suffix.lower() in extensions:
+                _, index = read_rpa_index(archive_path)
+                for name, entries in index.items():
+                    archived.setdefault(name, (archive_path, entries[0]))
+    except Exception as exc:
+        # Without every index a loose file could be an override of something we can't see.
+        result.error = capture(exc, "index")
+        return result
+
+    groups: Dict[str, List[Member]] = {}
+    for dir_path, dir_names, file_names in os.walk(game_dir):
+        dir_names[:] = sorted(name for name in dir_names if name not in LOOSE_DIRS and not name.startswith("."))
+        for file_name in sorted(file_names):
+            path = Path(dir_path) / file_name
+            ext = path.suffix.lower()
+            name = path.relative_to(game_dir).as_posix()
+            if ext in extensions and path.parent == game_dir:
+                continue
+            if ext in LOOSE_EXTENSIONS or file_name.lower() in LOOSE_NAMES or file_name.startswith("."):
+                result.kept.append(path)
+                continue
+            if name in archived:
+                archive_path, entry = archived[name]
+                same = path.stat().st_size == entry[1] and path.read_bytes() == _archived_bytes(archive_path, entry)
+                (result.archived if same else result.overrides).append(path)
+                continue
+            group = next((group for group, members in REPACK_GROUPS.items() if ext in members), "archive")
+            groups.setdefault(group, []).append((name, path))
+
+    packed: List[Path] = []
+    for group, members in groups.items():
+        pack = pack_archive(
+            _archive_name(game_dir, prefix, group),
+            members,
+            key=key,
+            threads=threads,
+            max_buffer=max_buffer,
+            timings=timings,
+        )
+        if pack.state == "ok":
+            _, index = read_rpa_index(pack.archive_path)
+            if set(index) == {name for name, _ in members}:
+                packed.extend(path for _, path in members)
+            else:
+                pack.state = "error"
+                pack.error = capture(RuntimeError(f"{pack.archive_path} index does not list every packed file"), "pack")
+        result.archives.append(pack)
+
+    if delete:
+        for path in packed + result.archived:
+            path.unlink()
+            result.removed += 1
+        _remove_empty_dirs(game_dir, packed + result.archived)
+    return result
+
+
+def startup_files(game_dir: Path) -> Tuple[int, int, int]:
+    """
+    What Ren'Py indexes at start: (loose files, archives, archived files). It lists every file
+    under the game dir and reads the index of each archive in it.
+    """
+    extensions = {ext.lower() for ext in detect_archive_extensions(game_dir)} | {".rpa"}
+    loose = archives = members = 0
+    for dir_path, dir_names, file_names in os.walk(game_dir):
+        for file_name in file_names:
+            path = Path(dir_path) / file_name
+            if path.parent == game_dir and path.suffix.lower() in extensions:
+                archives += 1
+                try:
+                    members += len(read_rpa_index(path)[1])
+                except Exception:
+                    # Ren'Py can't index it either; it still lists the file.
+                    pass
+            else:
+                loose += 1
+    return loose, archives, members
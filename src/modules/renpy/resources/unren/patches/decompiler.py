@@ -4,6 +4,7 @@ import importlib
 from typing import Optional, Tuple, Type
 
 from ..profiles import DecompilerProfile
+from .output import buffered_base
 
 
 def _patched_reconstruct_arginfo(arginfo):
@@ -43,6 +44,12 @@ def _patched_reconstruct_arginfo(arginfo):
     return "".join(rv)
 
 
+class _SayDoesNotFit(Exception):
+    # Raised out of a menu item printed with the menu's say statement in front of it, as soon as
+    # that has put the output behind the script's line numbers.
+    pass
+
+
 def _import_decompiler_symbol(name: str):
     module = importlib.import_module("decompiler.util")
     return getattr(module, name)
@@ -75,11 +82,11 @@ def build_decompiler_class(
 
     base = decompiler_module.Decompiler
     renpy = decompiler_module.renpy
-    dispatch = decompiler_module.Dispatcher()
-    dispatch.update(base.dispatch)
+    patched_dispatch = decompiler_module.Dispatcher()
+    patched_dispatch.update(base.dispatch)
 
-    class PatchedDecompiler(base):
-        dispatch = dispatch
+    class PatchedDecompiler(base, buffered_base(decompiler_module.DecompilerBase)):
+        dispatch = patched_dispatch
 
     footer_lines = list(profile.footer_lines)
 
@@ -215,6 +222,25 @@ def build_decompiler_class(
         PatchedDecompiler.print_lex = print_lex
         PatchedDecompiler.dispatch[renpy.ast.UserStatement] = print_userstatement
 
+        def __init__(self, *args, **kwargs):
+            super(PatchedDecompiler, self).__init__(*args, **kwargs)
+            # Per say-in-front attempt (innermost last): how far behind the output may get.
+            self.say_attempts = []
+
+        def check_say_attempt(self):
+            # most_lines_behind only grows while an item is printed, so once it is over the limit
+            # the item ends up printed without the say anyway; stop it now, not at the end.
+            if self.say_attempts and self.most_lines_behind > self.say_attempts[-1]:
+                raise _SayDoesNotFit()
+
+        def advance_to_line(self, linenumber):
+            super(PatchedDecompiler, self).advance_to_line(linenumber)
+            self.check_say_attempt()
+
+        PatchedDecompiler.__init__ = __init__
+        PatchedDecompiler.check_say_attempt = check_say_attempt
+        PatchedDecompiler.advance_to_line = advance_to_line
+
         def print_menu(self, ast):
             self.indent()
             self.write("menu")
@@ -245,7 +271,6 @@ def build_decompiler_class(
                     if self.options.translator:
                         label = self.options.translator.strings.get(label, label)
 
-                    state = None
                     if isinstance(condition, str) and hasattr(condition, "linenumber"):
                         if (self.say_inside_menu is not None
                                 and condition.linenumber > self.linenumber + 1):
@@ -253,17 +278,26 @@ def build_decompiler_class(
                         self.advance_to_line(condition.linenumber)
                     elif self.say_inside_menu is not None:
                         state = self.save_state()
+                        depth = len(self.block_stack)
                         self.most_lines_behind = self.last_lines_behind
-                        self.print_say_inside_menu()
-
-                    self.print_menu_item(label, condition, block, arguments)
-
-                    if state is not None:
-                        if self.most_lines_behind > state[7]:
+                        self.say_attempts.append(state[7])
+                        try:
+                            self.print_say_inside_menu()
+                            self.print_menu_item(label, condition, block, arguments)
+                        except _SayDoesNotFit:
+                            self.say_attempts.pop()
                             self.rollback_state(state)
+                            del self.block_stack[depth:]
+                            del self.index_stack[depth:]
                             self.print_menu_item(label, condition, block, arguments)
                         else:
+                            self.say_attempts.pop()
                             self.most_lines_behind = max(state[6], self.most_lines_behind)
+                            self.commit_state(state)
+                            self.check_say_attempt()
+                        continue
+
+                    self.print_menu_item(label, condition, block, arguments)
 
         PatchedDecompiler.print_menu = print_menu
         PatchedDecompiler.dispatch[renpy.ast.Menu] = print_menu
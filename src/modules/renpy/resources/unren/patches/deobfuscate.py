@@ -1,6 +1,9 @@
 from __future__ import annotations
 
 import random
+import zlib
+
+from ..limits import decompress
 
 
 def _decrypt_inceton(data: bytes, count):
@@ -18,6 +21,45 @@ def _decrypt_inceton(data: bytes, count):
         return None
 
 
+class DeobfuscateError(ValueError):
+    """No extractor or decryptor could make sense of the file."""
+
+    failure = "bad_header"
+
+
+class _BoundedZlib:
+    # Stands in for the zlib module inside the deobfuscator, so its extractors and decryptors
+    # decompress within the current limits.
+    error = zlib.error
+    decompress = staticmethod(decompress)
+
+    def __getattr__(self, name):
+        return getattr(zlib, name)
+
+
+class _SharedFile:
+    # Handed to the extractors instead of the open file: read() returns views of one copy of the
+    # file, so each extractor slices its slots out of it instead of reading the file again.
+
+    def __init__(self, data: bytes) -> None:
+        self._view = memoryview(data)
+        self._position = 0
+
+    def seek(self, position: int, whence: int = 0) -> int:
+        base = (0, self._position, len(self._view))[whence]
+        self._position = max(0, base + position)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: int = -1) -> memoryview:
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._position + size)
+        chunk = self._view[self._position:end]
+        self._position = max(self._position, end)
+        return chunk
+
+
 def apply_deobfuscate_patches(deobfuscate_module) -> None:
     if getattr(deobfuscate_module, "_unren_patched", False):
         return
@@ -29,10 +71,12 @@ def apply_deobfuscate_patches(deobfuscate_module) -> None:
         diagnosis = ["Attempting to deobfuscate file:"]
 
         raw_datas = set()
+        f.seek(0)
+        shared = _SharedFile(f.read())
 
         for extractor in deobfuscate_module.EXTRACTORS:
             try:
-                data = extractor(f, 1)
+                data = extractor(shared, 1)
             except ValueError as e:
                 diagnosis.append(
                     f"strategy {extractor.__name__} failed: {chr(10).join(e.args)}"
@@ -43,12 +87,17 @@ def apply_deobfuscate_patches(deobfuscate_module) -> None:
 
         if not raw_datas:
             diagnosis.append("All strategies failed. Unable to extract data")
-            raise ValueError("\n".join(diagnosis))
+            raise DeobfuscateError("\n".join(diagnosis))
 
         if len(raw_datas) != 1:
             diagnosis.append("Strategies produced different results. Trying all options")
 
-        for raw_data in raw_datas:
+        # The decryptors need bytes (some decode them), so each candidate is copied out in turn; the
+        # file goes once the last view of it does.
+        candidates = list(raw_datas)
+        del raw_datas, data, shared
+        while candidates:
+            raw_data = bytes(candidates.pop(0))
             try:
                 data, stmts, detail = deobfuscate_module.try_decrypt_section(raw_data)
             except ValueError as e:
@@ -59,7 +108,8 @@ def apply_deobfuscate_patches(deobfuscate_module) -> None:
                 return stmts
 
         diagnosis.append("All strategies failed. Unable to deobfuscate data")
-        raise ValueError("\n".join(diagnosis))
+        raise DeobfuscateError("\n".join(diagnosis))
 
     deobfuscate_module.read_ast = read_ast
+    deobfuscate_module.zlib = _BoundedZlib()
     deobfuscate_module._unren_patched = True
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from ..vendor import import_unrpyc_legacy_output
+
+# The legacy tree's buffer, imported without loading its decompiler package.
+OutputBuffer = import_unrpyc_legacy_output().OutputBuffer
+
+
+def buffered_base(base):
+    """
+    Returns a subclass of the decompiler base class whose save/commit/rollback_state are O(1)
+    checkpoints into an OutputBuffer instead of copying StringIO contents at every level.
+    """
+
+    class BufferedDecompilerBase(base):
+        @property
+        def out_file(self):
+            return self._out_buffer
+
+        @out_file.setter
+        def out_file(self, out_file):
+            if not isinstance(out_file, OutputBuffer):
+                out_file = OutputBuffer(out_file)
+            self._out_buffer = out_file
+
+        def save_state(self):
+            buffer = self.out_file
+            state = super().save_state()
+            self.out_file = buffer
+            return (buffer.checkpoint(),) + tuple(state[1:])
+
+        def commit_state(self, state):
+            self.out_file.commit(state[0])
+
+        def rollback_state(self, state):
+            buffer = self.out_file
+            buffer.rollback(state[0])
+            super().rollback_state((buffer,) + tuple(state[1:]))
+
+    return BufferedDecompilerBase
@@ -3,6 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Iterable, List, Tuple, Type
 
+from ..limits import limited_unpickler
 from ..vendor import import_unrpyc_renpycompat
 
 
@@ -445,3 +446,12 @@ def extend_class_factory_module(renpycompat) -> None:
 def extend_class_factory() -> None:
     renpycompat = import_unrpyc_renpycompat()
     extend_class_factory_module(renpycompat)
+
+
+def apply_limit_patches(renpycompat_module) -> None:
+    """Makes pickle_safe_loads count what it builds against unren.limits."""
+    magic = renpycompat_module.magic
+    if getattr(magic, "_unren_limited", False):
+        return
+    magic.SafeUnpickler = limited_unpickler(magic.SafeUnpickler)
+    magic._unren_limited = True
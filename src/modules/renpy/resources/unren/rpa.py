@@ -1,13 +1,21 @@
 from __future__ import annotations
 
+import io
+import pickle
 import sys
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List, Optional, Sequence
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
 from .detect import detect_archive_extensions, is_rpa_file, iter_files
+from .errors import ErrorRecord, capture
+from .limits import DEFAULT_LIMITS, Limits, decompress, enforce
+from .timings import NULL_TIMINGS, Timings, new_timings, result_timings
 from .vendor import import_rpatool
 
+if TYPE_CHECKING:
+    from .assets import AssetStore
+
 
 CODE_EXTENSIONS = {
     ".rpy",
@@ -24,7 +32,81 @@ class ExtractResult:
     output_dir: Path
     extracted: int
     state: str
-    error: Optional[BaseException] = None
+    error: Optional[ErrorRecord] = None
+    timings: Optional[Timings] = None
+
+
+@dataclass
+class ListResult:
+    archive_path: Path
+    state: str
+    version: Optional[str] = None
+    files: List[str] = field(default_factory=list)
+    error: Optional[ErrorRecord] = None
+
+
+# name -> [(offset, length, prefix)], with the RPA-3 key already applied.
+ArchiveIndex = Dict[str, List[Tuple[int, int, bytes]]]
+
+
+class _IndexUnpickler(pickle.Unpickler):
+    # Archive indexes are plain containers and strings. Protocol 2 pickles of Python 3 bytes go
+    # through these globals, anything else is refused.
+    ALLOWED = {
+        ("__builtin__", "bytes"),
+        ("builtins", "bytes"),
+        ("_codecs", "encode"),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) in self.ALLOWED:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"archive index references {module}.{name}")
+
+
+def read_rpa_index(archive_path: Path, limits: Limits = DEFAULT_LIMITS) -> Tuple[str, ArchiveIndex]:
+    """
+    Reads the index of an RPA-2.0/3.0/3.2 archive. Returns (version, index). The index inflates
+    within limits.max_decompressed, as an rpyc does.
+    """
+    with archive_path.open("rb") as handle:
+        header = handle.readline(256)
+        parts = header.split()
+        if not parts or not parts[0].startswith(b"RPA-"):
+            raise ValueError(f"{archive_path} is not an RPA archive")
+        version = parts[0][4:].decode("ascii", "replace")
+        if version not in ("2.0", "3.0", "3.2"):
+            raise ValueError(f"unsupported RPA version {version}")
+
+        offset = int(parts[1], 16)
+        key = 0
+        for subkey in parts[3:] if version == "3.2" else parts[2:]:
+            key ^= int(subkey, 16)
+
+        handle.seek(offset)
+        with enforce(limits):
+            blob = decompress(handle.read())
+
+    raw = _IndexUnpickler(io.BytesIO(blob), encoding="bytes").load()
+    index: ArchiveIndex = {}
+    for name, entries in raw.items():
+        if isinstance(name, bytes):
+            name = name.decode("utf-8", "surrogateescape")
+        normalized = []
+        for entry in entries:
+            prefix = entry[2] if len(entry) > 2 else b""
+            if isinstance(prefix, str):
+                prefix = prefix.encode("latin-1")
+            normalized.append((entry[0] ^ key, entry[1] ^ key, prefix))
+        index[name] = normalized
+    return version, index
+
+
+def open_asset_store(root: Path) -> AssetStore:
+    """An AssetStore at root for extracted assets; scripts are always written as plain files."""
+    from .assets import AssetStore
+
+    return AssetStore(root, skip_extensions=CODE_EXTENSIONS)
 
 
 def _should_extract(name: str, mode: str, include_ext: Sequence[str], exclude_ext: Sequence[str]) -> bool:
@@ -58,29 +140,133 @@ def _iter_archives(
             yield path
 
 
+def _write_member(out_path: Path, contents: bytes, timings, assets: Optional[AssetStore] = None) -> None:
+    with timings.phase("write"):
+        if assets is not None and assets.accepts(out_path.name, len(contents)):
+            blob, written = assets.put(contents)
+            linked = assets.link(blob, out_path)
+            timings.count("written_bytes" if written or not linked else "linked_bytes", len(contents))
+            return
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            handle = out_path.open("wb")
+        except PermissionError:
+            # A read-only link into an asset store from an earlier run: replace it, don't edit the blob.
+            out_path.unlink()
+            handle = out_path.open("wb")
+        with handle:
+            handle.write(contents)
+    timings.count("written_bytes", len(contents))
+
+
 def _extract_with_rpatool(archive_path: Path, output_dir: Path, mode: str,
-                          include_ext: Sequence[str], exclude_ext: Sequence[str]) -> int:
+                          include_ext: Sequence[str], exclude_ext: Sequence[str],
+                          timings=NULL_TIMINGS, assets: Optional[AssetStore] = None) -> int:
     rpatool = import_rpatool()
-    archive = rpatool.RenPyArchive(str(archive_path))
+    with timings.phase("index"):
+        archive = rpatool.RenPyArchive(str(archive_path))
     extracted = 0
 
     for filename in archive.list():
         if not _should_extract(filename, mode, include_ext, exclude_ext):
             continue
-        contents = archive.read(filename)
+        with timings.phase("read"):
+            contents = archive.read(filename)
         if contents is None:
             continue
-        out_path = output_dir / filename
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        with out_path.open("wb") as handle:
-            handle.write(contents)
+        timings.count("read_bytes", len(contents))
+        _write_member(output_dir / filename, contents, timings, assets)
         extracted += 1
 
     return extracted
 
 
+class _RuntimeIndex:
+    """
+    Ren'Py's own index of the archives extracted through its runtime. index_archives re-reads
+    every registered archive on each call, so the candidates in a directory are registered
+    together and indexed with one call, the first time one of them is needed. If that call fails
+    (one archive Ren'Py can't read), that directory falls back to indexing archives one by one.
+    """
+
+    def __init__(self, archive_paths: Sequence[Path]) -> None:
+        self._stems: Dict[Path, List[str]] = {}
+        for path in archive_paths:
+            stems = self._stems.setdefault(path.parent, [])
+            if path.stem not in stems:
+                stems.append(path.stem)
+        self._indexed: Dict[Path, Dict[str, dict]] = {}
+        self._unbatched: Set[Path] = set()
+
+    def _index(self, renpy, archive_dir: Path, stems: List[str], timings) -> Dict[str, dict]:
+        renpy.config.archives[:] = stems
+        renpy.config.searchpath = [str(archive_dir)]
+        renpy.config.basedir = str(archive_dir.parent)
+        with timings.phase("index"):
+            renpy.loader.index_archives()
+        archives_obj = renpy.loader.archives
+        if isinstance(archives_obj, dict):
+            return {name: value[1] for name, value in archives_obj.items()}
+        return {name: data for name, data in archives_obj}
+
+    def items(self, renpy, archive_path: Path, timings):
+        archive_dir = archive_path.parent
+        base = archive_path.stem
+        if archive_dir not in self._unbatched:
+            indexes = self._indexed.get(archive_dir)
+            if indexes is None or base not in indexes:
+                stems = self._stems.get(archive_dir, [])
+                try:
+                    indexes = self._index(renpy, archive_dir, stems if base in stems else stems + [base], timings)
+                except Exception:
+                    self._unbatched.add(archive_dir)
+                    indexes = None
+                else:
+                    self._indexed[archive_dir] = indexes
+        if archive_dir in self._unbatched:
+            indexes = self._index(renpy, archive_dir, [base], timings)
+        if base not in indexes:
+            raise RuntimeError("Ren'Py runtime did not index the archive")
+        return indexes[base].items()
+
+
+def _plain_chunks(entries) -> Optional[List[Tuple[int, int, bytes]]]:
+    # Ren'Py index entries are (offset, length) or (offset, length, prefix) in the archive file;
+    # anything else is left to Ren'Py to read.
+    chunks = []
+    for entry in entries:
+        if not isinstance(entry, (tuple, list)) or len(entry) not in (2, 3):
+            return None
+        offset, length = entry[0], entry[1]
+        prefix = entry[2] if len(entry) == 3 else b""
+        if isinstance(prefix, str):
+            prefix = prefix.encode("latin-1")
+        if not isinstance(offset, int) or not isinstance(length, int) or not isinstance(prefix, bytes):
+            return None
+        chunks.append((offset, length, prefix))
+    return chunks or None
+
+
+def _read_chunks(handle, chunks: List[Tuple[int, int, bytes]]) -> bytes:
+    parts = []
+    for offset, length, prefix in chunks:
+        handle.seek(offset)
+        parts.append(prefix + handle.read(length - len(prefix)))
+    return b"".join(parts)
+
+
+def _runtime_read(renpy, filename: str):
+    if hasattr(renpy.loader, "load_from_archive"):
+        subfile = renpy.loader.load_from_archive(filename)
+    else:
+        subfile = renpy.loader.load_core(filename)
+    return subfile.read()
+
+
 def _extract_with_runtime(archive_path: Path, output_dir: Path, mode: str,
-                          include_ext: Sequence[str], exclude_ext: Sequence[str]) -> int:
+                          include_ext: Sequence[str], exclude_ext: Sequence[str],
+                          timings=NULL_TIMINGS, assets: Optional[AssetStore] = None,
+                          runtime_index: Optional[_RuntimeIndex] = None) -> int:
     try:
         import renpy  # type: ignore
         import renpy.config  # type: ignore
@@ -88,43 +274,38 @@ def _extract_with_runtime(archive_path: Path, output_dir: Path, mode: str,
     except Exception as exc:
         raise RuntimeError("Ren'Py runtime not available for fallback") from exc
 
-    base = archive_path.stem
-    if base not in renpy.config.archives:
-        renpy.config.archives.append(base)
-
-    archive_dir = archive_path.parent
-    renpy.config.searchpath = [str(archive_dir)]
-    renpy.config.basedir = str(archive_dir.parent)
-    renpy.loader.index_archives()
-
-    archives_obj = renpy.loader.archives
-    if isinstance(archives_obj, dict):
-        items = archives_obj[base][1].items()
-    else:
-        items = None
-        for name, data in archives_obj:
-            if name == base:
-                items = data.items()
-                break
-        if items is None:
-            raise RuntimeError("Ren'Py runtime did not index the archive")
+    if runtime_index is None:
+        runtime_index = _RuntimeIndex([archive_path])
+    selected = []
+    for filename, entries in runtime_index.items(renpy, archive_path, timings):
+        if _should_extract(filename, mode, include_ext, exclude_ext):
+            selected.append((filename, _plain_chunks(entries)))
+    # One pass through the file in offset order instead of a Ren'Py lookup and open per entry.
+    selected.sort(key=lambda item: item[1][0][0] if item[1] else -1)
 
     extracted = 0
-    for filename, index in items:
-        if not _should_extract(filename, mode, include_ext, exclude_ext):
-            continue
-        if hasattr(renpy.loader, "load_from_archive"):
-            subfile = renpy.loader.load_from_archive(filename)
-        else:
-            subfile = renpy.loader.load_core(filename)
-        contents = subfile.read()
-        if contents is None:
-            continue
-        out_path = output_dir / filename
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        with out_path.open("wb") as handle:
-            handle.write(contents)
-        extracted += 1
+    # A game can patch how Ren'Py reads archive data, for some kinds of file only: the offsets are
+    # trusted for an extension once they give what Ren'Py itself reads for its first file.
+    direct: Dict[str, bool] = {}
+    with archive_path.open("rb") as handle:
+        for filename, chunks in selected:
+            with timings.phase("read"):
+                contents = None
+                ext = Path(filename).suffix.lower()
+                if chunks is not None and direct.get(ext) is not False:
+                    contents = _read_chunks(handle, chunks)
+                    if ext not in direct:
+                        direct[ext] = contents == _runtime_read(renpy, filename)
+                    if not direct[ext]:
+                        contents = None
+                if contents is None:
+                    timings.count("runtime_reads", 1)
+                    contents = _runtime_read(renpy, filename)
+            if contents is None:
+                continue
+            timings.count("read_bytes", len(contents))
+            _write_member(output_dir / filename, contents, timings, assets)
+            extracted += 1
 
     return extracted
 
@@ -144,7 +325,13 @@ def extract_archives(
     move_to: Optional[Path] = None,
     auto_retry: bool = True,
     detect_all: bool = False,
+    timings: bool = False,
+    asset_store: Optional[AssetStore] = None,
 ) -> List[ExtractResult]:
+    """
+    Extracts archives. With asset_store, extracted assets are stored once by content and hard
+    linked into the output (see AssetStore).
+    """
     if renpy_path is not None:
         sys.path.insert(0, str(renpy_path))
 
@@ -155,8 +342,10 @@ def extract_archives(
     include_ext = [ext.lower() for ext in (include_ext or [])]
     exclude_ext = [ext.lower() for ext in (exclude_ext or [])]
 
+    archive_paths = list(_iter_archives(paths, recursive, extensions, detect_all))
+    runtime_index = _RuntimeIndex(archive_paths) if use_runtime else None
     results: List[ExtractResult] = []
-    for archive_path in _iter_archives(paths, recursive, extensions, detect_all):
+    for archive_path in archive_paths:
         out_dir = output_dir or archive_path.parent
         if base_dir is not None:
             try:
@@ -178,24 +367,31 @@ def extract_archives(
             methods = ["rpatool"]
 
         extracted = 0
-        last_exc: Optional[BaseException] = None
-        for method in methods:
+        last_error: Optional[ErrorRecord] = None
+        archive_timings = new_timings(timings)
+        stats = result_timings(archive_timings)
+        for attempt, method in enumerate(methods):
             try:
                 if method == "runtime":
                     extracted = _extract_with_runtime(
-                        archive_path, out_dir, mode, include_ext, exclude_ext
+                        archive_path, out_dir, mode, include_ext, exclude_ext, archive_timings, asset_store,
+                        runtime_index,
                     )
                 else:
                     extracted = _extract_with_rpatool(
-                        archive_path, out_dir, mode, include_ext, exclude_ext
+                        archive_path, out_dir, mode, include_ext, exclude_ext, archive_timings, asset_store
                     )
-                last_exc = None
+                if attempt and stats is not None:
+                    stats.fallback = method
+                last_error = None
                 break
-            except BaseException as exc:
-                last_exc = exc
+            except Exception as exc:
+                last_error = capture(exc, "extract")
+                if "extract" not in last_error.retry:
+                    break
 
-        if last_exc is not None:
-            results.append(ExtractResult(archive_path, out_dir, 0, "error", error=last_exc))
+        if last_error is not None:
+            results.append(ExtractResult(archive_path, out_dir, 0, "error", error=last_error, timings=stats))
             continue
 
         if move_to is not None:
@@ -210,6 +406,30 @@ def extract_archives(
             except Exception:
                 pass
 
-        results.append(ExtractResult(archive_path, out_dir, extracted, "ok"))
+        results.append(ExtractResult(archive_path, out_dir, extracted, "ok", timings=stats))
+
+    return results
+
+
+def list_archives(
+    paths: Iterable[Path],
+    *,
+    base_dir: Optional[Path] = None,
+    recursive: bool = True,
+    detect_all: bool = False,
+) -> List[ListResult]:
+    extensions = detect_archive_extensions(
+        base_dir or Path.cwd(),
+        recursive=detect_all and recursive,
+    )
+
+    results: List[ListResult] = []
+    for archive_path in _iter_archives(paths, recursive, extensions, detect_all):
+        try:
+            version, index = read_rpa_index(archive_path)
+        except Exception as exc:
+            results.append(ListResult(archive_path, "error", error=capture(exc, "index")))
+            continue
+        results.append(ListResult(archive_path, "ok", version, sorted(index)))
 
     return results
@@ -1,15 +1,37 @@
 from __future__ import annotations
 
-import struct
-import zlib
-from dataclasses import dataclass, field
+from dataclasses import replace
 from pathlib import Path
-from typing import Iterable, List, Optional, Sequence
+from typing import Iterable, Iterator, List, Optional, Sequence, Set
 import sys
 
-from .detect import iter_files
-from .patches import apply_deobfuscate_patches, build_decompiler_class, extend_class_factory
+from .dedup import fan_out, find_duplicates, root_bases
+from .detect import find_renpy_version, iter_files
+from .errors import ErrorRecord, capture, should_retry
+from .limits import DEFAULT_LIMITS, LimitExceeded, Limits
+from .patches import build_decompiler_class, extend_class_factory
 from .profiles import DecompilerProfile, resolve_profiles
+from .rpycfile import (
+    Context,
+    DecompileResult,
+    ReadStack,
+    _dump_ast,
+    _output_path,
+    file_result,
+    read_ast,
+    sniff_rpyc_stack,
+)
+from .store import (
+    DEFAULT_WRITE_BUFFER,
+    DEFAULT_WRITE_THREADS,
+    BackgroundWriter,
+    OutputStore,
+    background_writes,
+    output_exists,
+    output_file,
+)
+from .timings import NULL_TIMINGS, new_timings, result_timings
+from .translation import build_translation_index, default_cache_dir
 from .vendor import (
     import_gideon_decompiler,
     import_unrpyc,
@@ -19,117 +41,7 @@ from .vendor import (
 )
 
 
-@dataclass
-class DecompileResult:
-    input_path: Path
-    output_path: Optional[Path]
-    state: str
-    error: Optional[BaseException] = None
-    log: List[str] = field(default_factory=list)
-
-
-class Context:
-    def __init__(self) -> None:
-        self.log_contents: List[str] = []
-        self.error: Optional[BaseException] = None
-        self.state = "error"
-
-    def log(self, message: str) -> None:
-        self.log_contents.append(message)
-
-    def set_error(self, error: BaseException) -> None:
-        self.error = error
-
-    def set_state(self, state: str) -> None:
-        self.state = state
-
-
-def _output_path(
-    input_path: Path,
-    output_dir: Optional[Path],
-    base_dir: Optional[Path],
-    dump: bool,
-) -> Path:
-    if dump:
-        new_ext = ".txt"
-    elif input_path.suffix.lower() == ".rpymc":
-        new_ext = ".rpym"
-    else:
-        new_ext = ".rpy"
-
-    if output_dir is None:
-        return input_path.with_suffix(new_ext)
-
-    if base_dir is not None:
-        try:
-            relative = input_path.relative_to(base_dir)
-        except ValueError:
-            relative = input_path.name
-    else:
-        relative = input_path.name
-
-    return (output_dir / relative).with_suffix(new_ext)
-
-
-def _safe_loads_from_blob(blob: bytes):
-    renpycompat = import_unrpyc_renpycompat()
-    try:
-        return renpycompat.pickle_safe_loads(blob)
-    except Exception:
-        try:
-            return renpycompat.pickle_safe_loads(zlib.decompress(blob))
-        except Exception:
-            raise
-
-
-def _read_ast_from_runtime(in_file, context: Context):
-    try:
-        import renpy  # type: ignore
-        from renpy import script  # type: ignore
-    except Exception as exc:
-        context.set_error(exc)
-        raise
-
-    if not hasattr(script.Script, "read_rpyc_data"):
-        raise RuntimeError("renpy.script.Script.read_rpyc_data not available")
-
-    raw_contents = script.Script.read_rpyc_data(object, in_file, 1)
-    if isinstance(raw_contents, tuple) and len(raw_contents) == 2:
-        return raw_contents[1]
-    _, stmts = _safe_loads_from_blob(raw_contents)
-    return stmts
-
-
-def _read_ast_with_yvan(in_file, context: Context):
-    try:
-        from renpy.loader import YVANeusEX  # type: ignore
-    except Exception as exc:
-        context.set_error(exc)
-        raise
-
-    raw = in_file.read()
-    if not raw.startswith(b"RENPY RPC2"):
-        raise RuntimeError("YVANeusEX requires RPYC2 header")
-
-    position = 10
-    chunks = {}
-    while position + 12 <= len(raw):
-        slot, start, length = struct.unpack("III", raw[position: position + 12])
-        if slot == 0:
-            break
-        chunks[slot] = raw[start: start + length]
-        position += 12
-
-    if 1 not in chunks or 2 not in chunks:
-        raise RuntimeError("YVANeusEX slots missing")
-
-    decrypted = (
-        YVANeusEX.encrypt(bytearray(chunks[1]), YVANeusEX.cipherkey, True)
-        + YVANeusEX.encrypt(bytearray(chunks[2]), YVANeusEX.cipherkey, True)
-    )
-
-    _, stmts = _safe_loads_from_blob(decrypted)
-    return stmts
+_STACK = ReadStack(import_unrpyc, import_unrpyc_renpycompat, import_unrpyc_deobfuscate)
 
 
 def _get_ast(
@@ -139,49 +51,10 @@ def _get_ast(
     use_runtime: bool,
     use_yvan: bool,
     auto_retry: bool,
+    timings=NULL_TIMINGS,
+    limits: Limits = DEFAULT_LIMITS,
 ):
-    def attempt_unrpyc():
-        unrpyc = import_unrpyc()
-        with input_path.open("rb") as in_file:
-            return unrpyc.read_ast_from_file(in_file, context)
-
-    def attempt_deobfuscate():
-        deobfuscate = import_unrpyc_deobfuscate()
-        apply_deobfuscate_patches(deobfuscate)
-        with input_path.open("rb") as in_file:
-            return deobfuscate.read_ast(in_file, context)
-
-    def attempt_runtime():
-        with input_path.open("rb") as in_file:
-            return _read_ast_from_runtime(in_file, context)
-
-    def attempt_yvan():
-        with input_path.open("rb") as in_file:
-            return _read_ast_with_yvan(in_file, context)
-
-    attempts = []
-    if try_harder and not auto_retry:
-        attempts.append(attempt_deobfuscate)
-    else:
-        attempts.append(attempt_unrpyc)
-        if try_harder:
-            attempts.append(attempt_deobfuscate)
-
-    if use_runtime:
-        attempts.append(attempt_runtime)
-    if use_yvan:
-        attempts.append(attempt_yvan)
-
-    last_exc: Optional[BaseException] = None
-    for attempt in attempts:
-        try:
-            return attempt()
-        except BaseException as exc:
-            last_exc = exc
-            continue
-    if last_exc is not None:
-        raise last_exc
-    raise RuntimeError("No AST read attempts were configured.")
+    return read_ast(input_path, context, _STACK, try_harder, use_runtime, use_yvan, auto_retry, timings, limits)
 
 
 def _decompile_ast(
@@ -190,6 +63,8 @@ def _decompile_ast(
     profile: DecompilerProfile,
     init_offset: bool,
     translator=None,
+    timings=NULL_TIMINGS,
+    sink=None,
 ):
     decompiler_module = import_unrpyc_decompiler()
     gideon = import_gideon_decompiler() if profile.screenlang_v1 else None
@@ -202,38 +77,13 @@ def _decompile_ast(
         sl_custom_names=None,
     )
 
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    temp_path = out_path.with_suffix(out_path.suffix + ".tmp")
-    try:
-        with temp_path.open("w", encoding="utf-8") as out_file:
-            decompiler = DecompilerClass(out_file, options)
-            decompiler.dump(ast)
-        temp_path.replace(out_path)
-    finally:
-        if temp_path.exists():
-            try:
-                temp_path.unlink()
-            except Exception:
-                pass
+    with output_file(out_path, sink, timings) as out_file, timings.phase(f"decompile:{profile.name}", exclude="write"):
+        decompiler = DecompilerClass(out_file, options)
+        decompiler.dump(ast)
 
 
-def _dump_ast(ast, out_path: Path):
-    decompiler_module = import_unrpyc_decompiler()
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    temp_path = out_path.with_suffix(out_path.suffix + ".tmp")
-    try:
-        with temp_path.open("w", encoding="utf-8") as out_file:
-            decompiler_module.astdump.pprint(out_file, ast)
-        temp_path.replace(out_path)
-    finally:
-        if temp_path.exists():
-            try:
-                temp_path.unlink()
-            except Exception:
-                pass
-
-
-def decompile_paths(
+@background_writes
+def _iter_decompile_paths(
     paths: Iterable[Path],
     *,
     output_dir: Optional[Path] = None,
@@ -242,6 +92,7 @@ def decompile_paths(
     overwrite: bool = False,
     try_harder: bool = False,
     dump: bool = False,
+    dump_format: str = "text",
     init_offset: bool = True,
     mode: str = "auto",
     profiles: Optional[Sequence[str]] = None,
@@ -250,11 +101,27 @@ def decompile_paths(
     renpy_path: Optional[Path] = None,
     auto_retry: bool = True,
     legacy_fallback: bool = True,
-) -> List[DecompileResult]:
+    translate: Optional[str] = None,
+    translate_cache: Optional[Path] = None,
+    processes: Optional[int] = None,
+    timings: bool = False,
+    limits: Limits = DEFAULT_LIMITS,
+    route: bool = True,
+    output_store: Optional[OutputStore] = None,
+    output_writer: Optional[BackgroundWriter] = None,
+    base_dirs: Optional[Sequence[Optional[Path]]] = None,
+    exclude: Optional[Set[Path]] = None,
+) -> Iterator[DecompileResult]:
+    paths = list(paths)
+    if output_store is not None:
+        output_dir = output_store.root
+    if translate and translate_cache is None:
+        translate_cache = default_cache_dir(paths, output_dir, base_dir)
+
     if mode == "legacy" and not profiles:
-        from .rpyc_legacy import decompile_paths_legacy
+        from .rpyc_legacy import iter_decompile_paths_legacy
 
-        return decompile_paths_legacy(
+        yield from iter_decompile_paths_legacy(
             paths,
             output_dir=output_dir,
             base_dir=base_dir,
@@ -262,122 +129,314 @@ def decompile_paths(
             overwrite=overwrite,
             try_harder=try_harder,
             dump=dump,
+            dump_format=dump_format,
             init_offset=init_offset,
             use_runtime=use_runtime,
             use_yvan=use_yvan,
             renpy_path=renpy_path,
             auto_retry=auto_retry,
+            translate=translate,
+            translate_cache=translate_cache,
+            processes=processes,
+            timings=timings,
+            limits=limits,
+            output_store=output_store,
+            output_writer=output_writer,
+            # This call's writer, or none when it writes inline: never a second one.
+            write_threads=0,
+            base_dirs=base_dirs,
+            exclude=exclude,
         )
+        return
 
     if renpy_path is not None:
         sys.path.insert(0, str(renpy_path))
 
-    extend_class_factory()
-
     profile_list = resolve_profiles(mode, profiles)
-    results: List[DecompileResult] = []
-
-    for path in iter_files(paths, recursive):
-        if path.suffix.lower() not in (".rpyc", ".rpymc"):
-            continue
-
-        output_path = _output_path(path, output_dir, base_dir, dump)
-        if output_path.exists() and not overwrite:
-            results.append(DecompileResult(path, output_path, "skip"))
-            continue
-
-        context = Context()
+    route = route and mode == "auto" and not profiles
+
+    # Both passes share one index per stack. The legacy one is only built if a file falls back.
+    indexes = {}
+
+    def translation_index(legacy: bool):
+        if not translate or dump:
+            return None
+        if legacy not in indexes:
+            indexes[legacy] = build_translation_index(
+                paths,
+                translate,
+                recursive=recursive,
+                legacy=legacy,
+                try_harder=try_harder,
+                use_runtime=use_runtime,
+                use_yvan=use_yvan,
+                renpy_path=renpy_path,
+                auto_retry=auto_retry,
+                processes=processes,
+                cache_dir=translate_cache,
+                limits=limits,
+            )
+        return indexes[legacy]
 
+    def decompile_current(path: Path, output_path: Path, context: Context, file_timings, stats, allow_fallback: bool):
+        # Returns the result, or None when the file should go to the legacy stack.
         try:
-            ast = _get_ast(path, context, try_harder, use_runtime, use_yvan, auto_retry)
-        except BaseException as exc:
-            if auto_retry and legacy_fallback and mode != "legacy":
-                from .rpyc_legacy import decompile_paths_legacy
-
-                legacy_results = decompile_paths_legacy(
-                    [path],
-                    output_dir=output_dir,
-                    base_dir=base_dir,
-                    recursive=False,
-                    overwrite=overwrite,
-                    try_harder=try_harder,
-                    dump=dump,
-                    init_offset=init_offset,
-                    use_runtime=use_runtime,
-                    use_yvan=use_yvan,
-                    renpy_path=renpy_path,
-                    auto_retry=auto_retry,
-                )
-                if legacy_results:
-                    legacy_result = legacy_results[0]
-                    results.append(
-                        DecompileResult(
-                            legacy_result.input_path,
-                            legacy_result.output_path,
-                            legacy_result.state,
-                            error=legacy_result.error,
-                            log=legacy_result.log,
-                        )
-                    )
-                    continue
-            results.append(DecompileResult(path, output_path, "error", error=exc, log=context.log_contents))
-            continue
+            extend_class_factory()
+            ast = _get_ast(path, context, try_harder, use_runtime, use_yvan, auto_retry, file_timings, limits)
+        except Exception as exc:
+            if allow_fallback and not isinstance(exc, LimitExceeded) and should_retry(exc, "read", "stack"):
+                return None
+            return file_result(path, output_path, context, stats, exc)
 
         if dump:
             try:
-                _dump_ast(ast, output_path)
-                results.append(DecompileResult(path, output_path, "ok", log=context.log_contents))
-            except BaseException as exc:
-                results.append(DecompileResult(path, output_path, "error", error=exc, log=context.log_contents))
-            continue
-
-        success = False
-        last_error: Optional[BaseException] = None
+                _dump_ast(ast, output_path, import_unrpyc_decompiler(), dump_format, file_timings, output_store or output_writer)
+                return file_result(path, output_path, context, stats)
+            except Exception as exc:
+                return file_result(path, output_path, context, stats, exc, "dump")
 
+        last_error: Optional[ErrorRecord] = None
         for profile in profile_list:
             try:
-                _decompile_ast(ast, output_path, profile, init_offset)
-                success = True
-                break
-            except BaseException as exc:
-                last_error = exc
-
-        if success:
-            results.append(DecompileResult(path, output_path, "ok", log=context.log_contents))
-            continue
+                index = translation_index(False)
+                translator = index.fork() if index is not None else None
+                _decompile_ast(ast, output_path, profile, init_offset, translator, file_timings, output_store or output_writer)
+                return file_result(path, output_path, context, stats)
+            except Exception as exc:
+                last_error = capture(exc, "decompile")
+                if "profile" not in last_error.retry:
+                    break
+        if allow_fallback and last_error is not None and "stack" in last_error.retry:
+            return None
+        return DecompileResult(path, output_path, "error", error=last_error, log=context.log_contents, timings=stats)
+
+    fallback = auto_retry and legacy_fallback and mode != "legacy"
+    # Files for the legacy stack, run in one batch at the end: routed there up front, or failed on
+    # the current stack (with their timings so far).
+    legacy_paths: List[Path] = []
+    legacy_bases: List[Optional[Path]] = []
+    failed_current = {}
+    # Output paths taken by an earlier input this run: the first input keeps it, as if later ones
+    # came from a second run.
+    claimed: Set[Path] = set()
+
+    for input_path, input_base in zip(paths, root_bases(paths, base_dir, base_dirs)):
+        game_stack = None
+        if route:
+            version = find_renpy_version(input_path)
+            if version is not None:
+                game_stack = "legacy" if version < 8 else "current"
+
+        for path in iter_files([input_path], recursive):
+            if path.suffix.lower() not in (".rpyc", ".rpymc") or (exclude and path in exclude):
+                continue
 
-        if auto_retry and legacy_fallback and mode != "legacy":
-            from .rpyc_legacy import decompile_paths_legacy
+            output_path = _output_path(path, output_dir, input_base, dump, dump_format)
+            if output_path in claimed or (output_exists(output_path, output_store) and not overwrite):
+                yield DecompileResult(path, output_path, "skip")
+                continue
+            claimed.add(output_path)
+
+            stack = game_stack
+            if route and stack is None:
+                try:
+                    stack = sniff_rpyc_stack(path)
+                except Exception:
+                    # Left unrouted: the read below reports what is wrong with the file.
+                    stack = None
+            if route and stack == "legacy":
+                legacy_paths.append(path)
+                legacy_bases.append(input_base)
+                continue
 
-            legacy_results = decompile_paths_legacy(
-                [path],
-                output_dir=output_dir,
-                base_dir=base_dir,
-                recursive=False,
-                overwrite=overwrite,
-                try_harder=try_harder,
-                dump=dump,
-                init_offset=init_offset,
-                use_runtime=use_runtime,
-                use_yvan=use_yvan,
-                renpy_path=renpy_path,
-                auto_retry=auto_retry,
-            )
-            if legacy_results:
-                legacy_result = legacy_results[0]
-                results.append(
-                    DecompileResult(
-                        legacy_result.input_path,
-                        legacy_result.output_path,
-                        legacy_result.state,
-                        error=legacy_result.error,
-                        log=legacy_result.log,
-                    )
-                )
+            context = Context()
+            file_timings = new_timings(timings)
+            stats = result_timings(file_timings)
+            result = decompile_current(path, output_path, context, file_timings, stats, fallback)
+            if result is None:
+                legacy_paths.append(path)
+                legacy_bases.append(input_base)
+                failed_current[path] = (context, file_timings, stats)
                 continue
+            yield result
+
+    if not legacy_paths:
+        return
+
+    from .rpyc_legacy import iter_decompile_paths_legacy
+
+    legacy_results = iter_decompile_paths_legacy(
+        legacy_paths,
+        output_dir=output_dir,
+        base_dir=base_dir,
+        recursive=False,
+        overwrite=overwrite,
+        try_harder=try_harder,
+        dump=dump,
+        dump_format=dump_format,
+        init_offset=init_offset,
+        use_runtime=use_runtime,
+        use_yvan=use_yvan,
+        renpy_path=renpy_path,
+        auto_retry=auto_retry,
+        translation_index=translation_index(True),
+        timings=timings,
+        limits=limits,
+        output_store=output_store,
+        output_writer=output_writer,
+        write_threads=0,
+        base_dirs=legacy_bases,
+    )
+    for legacy_result in legacy_results:
+        path = legacy_result.input_path
+        if path in failed_current:
+            context, file_timings, stats = failed_current.pop(path)
+            if legacy_result.timings is not None:
+                file_timings.merge(legacy_result.timings)
+                file_timings.fallback = "legacy"
+            yield DecompileResult(
+                path,
+                legacy_result.output_path,
+                legacy_result.state,
+                error=legacy_result.error,
+                log=legacy_result.log,
+                timings=stats,
+            )
+            continue
 
-        results.append(
-            DecompileResult(path, output_path, "error", error=last_error, log=context.log_contents)
+        if legacy_result.state == "error" and auto_retry and legacy_result.error is not None and "stack" in legacy_result.error.retry:
+            # Routed to legacy up front, which can't read it either: try the current stack as the
+            # unrouted run would have, without falling back again.
+            context = Context()
+            file_timings = new_timings(timings)
+            stats = result_timings(file_timings)
+            retry = decompile_current(path, legacy_result.output_path, context, file_timings, stats, False)
+            if retry.state == "ok":
+                if stats is not None:
+                    stats.fallback = "current"
+                yield retry
+                continue
+        yield DecompileResult(
+            path,
+            legacy_result.output_path,
+            legacy_result.state,
+            error=legacy_result.error,
+            log=legacy_result.log,
+            timings=legacy_result.timings,
         )
 
-    return results
+
+def iter_decompile_paths(
+    paths: Iterable[Path],
+    *,
+    output_dir: Optional[Path] = None,
+    base_dir: Optional[Path] = None,
+    base_dirs: Optional[Sequence[Optional[Path]]] = None,
+    recursive: bool = True,
+    overwrite: bool = False,
+    try_harder: bool = False,
+    dump: bool = False,
+    dump_format: str = "text",
+    init_offset: bool = True,
+    mode: str = "auto",
+    profiles: Optional[Sequence[str]] = None,
+    use_runtime: bool = False,
+    use_yvan: bool = False,
+    renpy_path: Optional[Path] = None,
+    auto_retry: bool = True,
+    legacy_fallback: bool = True,
+    translate: Optional[str] = None,
+    translate_cache: Optional[Path] = None,
+    processes: Optional[int] = None,
+    timings: bool = False,
+    limits: Limits = DEFAULT_LIMITS,
+    route: bool = True,
+    output_store: Optional[OutputStore] = None,
+    duplicates: str = "copy",
+    write_threads: int = DEFAULT_WRITE_THREADS,
+    max_write_buffer: int = DEFAULT_WRITE_BUFFER,
+) -> Iterator[DecompileResult]:
+    """
+    Decompiles paths, yielding one result per file as it is done. Each path is a root with its own
+    base dir from base_dirs, or base_dir for all of them.
+
+    In auto mode (without explicit profiles) and with route, files of Ren'Py 7 and older games, or
+    that look like it, go straight to the legacy stack; files that fail on the current stack are
+    retried there in one batch after the rest. With output_store, outputs go into the store under
+    their path relative to its root (which replaces output_dir) instead of into files.
+
+    Inputs with the same bytes, across all roots, are decompiled once: the others get a copy of the
+    output (duplicates="copy"), a hard link to it ("link"), or are decompiled again ("off"). Their
+    results carry duplicate_of.
+    """
+    paths = list(paths)
+    if output_store is not None:
+        output_dir = output_store.root
+    bases = root_bases(paths, base_dir, base_dirs)
+
+    twins = {}
+    outputs = {}
+    if duplicates != "off":
+        # Only inputs that would be decompiled count: skipped ones keep their existing output.
+        claimed: Set[Path] = set()
+        pending: List[Path] = []
+        for input_path, input_base in zip(paths, bases):
+            for path in iter_files([input_path], recursive):
+                if path.suffix.lower() not in (".rpyc", ".rpymc"):
+                    continue
+                output_path = _output_path(path, output_dir, input_base, dump, dump_format)
+                if output_path in claimed or (output_exists(output_path, output_store) and not overwrite):
+                    continue
+                claimed.add(output_path)
+                outputs[path] = output_path
+                pending.append(path)
+        twins = find_duplicates(pending)
+
+    results = _iter_decompile_paths(
+        paths,
+        output_dir=output_dir,
+        base_dir=base_dir,
+        base_dirs=bases,
+        exclude={twin for group in twins.values() for twin in group},
+        recursive=recursive,
+        overwrite=overwrite,
+        try_harder=try_harder,
+        dump=dump,
+        dump_format=dump_format,
+        init_offset=init_offset,
+        mode=mode,
+        profiles=profiles,
+        use_runtime=use_runtime,
+        use_yvan=use_yvan,
+        renpy_path=renpy_path,
+        auto_retry=auto_retry,
+        legacy_fallback=legacy_fallback,
+        translate=translate,
+        translate_cache=translate_cache,
+        processes=processes,
+        timings=timings,
+        limits=limits,
+        route=route,
+        output_store=output_store,
+        write_threads=write_threads,
+        max_write_buffer=max_write_buffer,
+    )
+    for result in results:
+        yield result
+        for twin in twins.pop(result.input_path, ()):
+            twin_output = outputs[twin]
+            if result.state != "ok":
+                # The same bytes fail the same way.
+                yield replace(result, input_path=twin, output_path=twin_output, timings=None, duplicate_of=result.input_path)
+                continue
+            try:
+                fan_out(result.output_path, twin_output, duplicates, output_store)
+            except Exception as exc:
+                yield DecompileResult(twin, twin_output, "error", error=capture(exc, "write"), duplicate_of=result.input_path)
+                continue
+            yield DecompileResult(twin, twin_output, "ok", duplicate_of=result.input_path)
+
+
+def decompile_paths(paths: Iterable[Path], **kwargs) -> List[DecompileResult]:
+    """iter_decompile_paths, collected into a list."""
+    return list(iter_decompile_paths(paths, **kwargs))
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
-import struct
 import sys
-import zlib
-from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Iterable, Iterator, List, Optional, Sequence, Set
 
+from .dedup import root_bases
 from .detect import iter_files
-from .patches import apply_deobfuscate_patches, extend_class_factory_module
+from .limits import DEFAULT_LIMITS, Limits
+from .patches import extend_class_factory_module
+from .rpycfile import Context, DecompileResult, ReadStack, _dump_ast, _output_path, file_result, read_ast
+from .store import BackgroundWriter, OutputStore, background_writes, output_exists, output_file
+from .timings import NULL_TIMINGS, new_timings, result_timings
+from .translation import TranslationIndex, build_translation_index, default_cache_dir
 from .vendor import (
     import_unrpyc_legacy,
     import_unrpyc_legacy_decompiler,
@@ -17,116 +20,7 @@ from .vendor import (
 )
 
 
-@dataclass
-class DecompileResult:
-    input_path: Path
-    output_path: Optional[Path]
-    state: str
-    error: Optional[BaseException] = None
-    log: List[str] = field(default_factory=list)
-
-
-class Context:
-    def __init__(self) -> None:
-        self.log_contents: List[str] = []
-        self.error: Optional[BaseException] = None
-        self.state = "error"
-
-    def log(self, message: str) -> None:
-        self.log_contents.append(message)
-
-    def set_error(self, error: BaseException) -> None:
-        self.error = error
-
-    def set_state(self, state: str) -> None:
-        self.state = state
-
-
-def _output_path(
-    input_path: Path,
-    output_dir: Optional[Path],
-    base_dir: Optional[Path],
-    dump: bool,
-) -> Path:
-    if dump:
-        new_ext = ".txt"
-    elif input_path.suffix.lower() == ".rpymc":
-        new_ext = ".rpym"
-    else:
-        new_ext = ".rpy"
-
-    if output_dir is None:
-        return input_path.with_suffix(new_ext)
-
-    if base_dir is not None:
-        try:
-            relative = input_path.relative_to(base_dir)
-        except ValueError:
-            relative = input_path.name
-    else:
-        relative = input_path.name
-
-    return (output_dir / relative).with_suffix(new_ext)
-
-
-def _safe_loads_from_blob(blob: bytes):
-    renpycompat = import_unrpyc_legacy_renpycompat()
-    try:
-        return renpycompat.pickle_safe_loads(blob)
-    except Exception:
-        try:
-            return renpycompat.pickle_safe_loads(zlib.decompress(blob))
-        except Exception:
-            raise
-
-
-def _read_ast_from_runtime(in_file, context: Context):
-    try:
-        from renpy import script  # type: ignore
-    except Exception as exc:
-        context.set_error(exc)
-        raise
-
-    if not hasattr(script.Script, "read_rpyc_data"):
-        raise RuntimeError("renpy.script.Script.read_rpyc_data not available")
-
-    raw_contents = script.Script.read_rpyc_data(object, in_file, 1)
-    if isinstance(raw_contents, tuple) and len(raw_contents) == 2:
-        return raw_contents[1]
-    _, stmts = _safe_loads_from_blob(raw_contents)
-    return stmts
-
-
-def _read_ast_with_yvan(in_file, context: Context):
-    try:
-        from renpy.loader import YVANeusEX  # type: ignore
-    except Exception as exc:
-        context.set_error(exc)
-        raise
-
-    raw = in_file.read()
-    if not raw.startswith(b"RENPY RPC2"):
-        raise RuntimeError("YVANeusEX requires RPYC2 header")
-
-    position = 10
-    chunks = {}
-    while position + 12 <= len(raw):
-        slot, start, length = struct.unpack("III", raw[position: position + 12])
-        if slot == 0:
-            break
-        chunks[slot] = raw[start: start + length]
-        position += 12
-
-    if 1 not in chunks or 2 not in chunks:
-        raise RuntimeError("YVANeusEX slots missing")
-
-    decrypted = (
-        YVANeusEX.encrypt(bytearray(chunks[1]), YVANeusEX.cipherkey, True)
-        + YVANeusEX.encrypt(bytearray(chunks[2]), YVANeusEX.cipherkey, True)
-    )
-
-    _, stmts = _safe_loads_from_blob(decrypted)
-    return stmts
+_STACK = ReadStack(import_unrpyc_legacy, import_unrpyc_legacy_renpycompat, import_unrpyc_legacy_deobfuscate)
 
 
 def _get_ast(
@@ -136,97 +30,36 @@ def _get_ast(
     use_runtime: bool,
     use_yvan: bool,
     auto_retry: bool,
+    timings=NULL_TIMINGS,
+    limits: Limits = DEFAULT_LIMITS,
 ):
-    def attempt_unrpyc():
-        unrpyc = import_unrpyc_legacy()
-        with input_path.open("rb") as in_file:
-            return unrpyc.read_ast_from_file(in_file, context)
-
-    def attempt_deobfuscate():
-        deobfuscate = import_unrpyc_legacy_deobfuscate()
-        apply_deobfuscate_patches(deobfuscate)
-        with input_path.open("rb") as in_file:
-            return deobfuscate.read_ast(in_file, context)
-
-    def attempt_runtime():
-        with input_path.open("rb") as in_file:
-            return _read_ast_from_runtime(in_file, context)
-
-    def attempt_yvan():
-        with input_path.open("rb") as in_file:
-            return _read_ast_with_yvan(in_file, context)
-
-    attempts = []
-    if try_harder and not auto_retry:
-        attempts.append(attempt_deobfuscate)
-    else:
-        attempts.append(attempt_unrpyc)
-        if try_harder:
-            attempts.append(attempt_deobfuscate)
-
-    if use_runtime:
-        attempts.append(attempt_runtime)
-    if use_yvan:
-        attempts.append(attempt_yvan)
-
-    last_exc: Optional[BaseException] = None
-    for attempt in attempts:
-        try:
-            return attempt()
-        except BaseException as exc:
-            last_exc = exc
-            continue
-    if last_exc is not None:
-        raise last_exc
-    raise RuntimeError("No AST read attempts were configured.")
+    return read_ast(input_path, context, _STACK, try_harder, use_runtime, use_yvan, auto_retry, timings, limits)
 
 
 def _decompile_ast(
     ast,
     out_path: Path,
     init_offset: bool,
+    translator=None,
+    timings=NULL_TIMINGS,
+    sink=None,
 ):
     decompiler_module = import_unrpyc_legacy_decompiler()
     options = decompiler_module.Options(
         log=[],
         decompile_python=False,
-        translator=None,
+        translator=translator,
         init_offset=init_offset,
         tag_outside_block=False,
         sl_custom_names=None,
     )
 
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    temp_path = out_path.with_suffix(out_path.suffix + ".tmp")
-    try:
-        with temp_path.open("w", encoding="utf-8") as out_file:
-            decompiler_module.pprint(out_file, ast, options)
-        temp_path.replace(out_path)
-    finally:
-        if temp_path.exists():
-            try:
-                temp_path.unlink()
-            except Exception:
-                pass
-
+    with output_file(out_path, sink, timings) as out_file, timings.phase("decompile:legacy", exclude="write"):
+        decompiler_module.pprint(out_file, ast, options)
 
-def _dump_ast(ast, out_path: Path):
-    decompiler_module = import_unrpyc_legacy_decompiler()
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    temp_path = out_path.with_suffix(out_path.suffix + ".tmp")
-    try:
-        with temp_path.open("w", encoding="utf-8") as out_file:
-            decompiler_module.astdump.pprint(out_file, ast)
-        temp_path.replace(out_path)
-    finally:
-        if temp_path.exists():
-            try:
-                temp_path.unlink()
-            except Exception:
-                pass
 
-
-def decompile_paths_legacy(
+@background_writes
+def iter_decompile_paths_legacy(
     paths: Iterable[Path],
     *,
     output_dir: Optional[Path] = None,
@@ -235,48 +68,91 @@ def decompile_paths_legacy(
     overwrite: bool = False,
     try_harder: bool = False,
     dump: bool = False,
+    dump_format: str = "text",
     init_offset: bool = True,
     use_runtime: bool = False,
     use_yvan: bool = False,
     renpy_path: Optional[Path] = None,
     auto_retry: bool = True,
-) -> List[DecompileResult]:
+    translate: Optional[str] = None,
+    translation_index: Optional[TranslationIndex] = None,
+    translate_cache: Optional[Path] = None,
+    processes: Optional[int] = None,
+    timings: bool = False,
+    limits: Limits = DEFAULT_LIMITS,
+    output_store: Optional[OutputStore] = None,
+    output_writer: Optional[BackgroundWriter] = None,
+    base_dirs: Optional[Sequence[Optional[Path]]] = None,
+    exclude: Optional[Set[Path]] = None,
+) -> Iterator[DecompileResult]:
+    """
+    Decompiles paths with the legacy stack, yielding one result per file as it is done. base_dirs
+    gives each path its own base dir; files in exclude are passed over without a result.
+    """
+    if output_store is not None:
+        output_dir = output_store.root
     if renpy_path is not None:
         sys.path.insert(0, str(renpy_path))
 
     renpycompat = import_unrpyc_legacy_renpycompat()
     extend_class_factory_module(renpycompat)
 
-    results: List[DecompileResult] = []
-
-    for path in iter_files(paths, recursive):
-        if path.suffix.lower() not in (".rpyc", ".rpymc"):
-            continue
-
-        output_path = _output_path(path, output_dir, base_dir, dump)
-        if output_path.exists() and not overwrite:
-            results.append(DecompileResult(path, output_path, "skip"))
-            continue
-
+    paths = list(paths)
+    if translate and translation_index is None and not dump:
+        translation_index = build_translation_index(
+            paths,
+            translate,
+            recursive=recursive,
+            legacy=True,
+            try_harder=try_harder,
+            use_runtime=use_runtime,
+            use_yvan=use_yvan,
+            renpy_path=renpy_path,
+            auto_retry=auto_retry,
+            processes=processes,
+            cache_dir=translate_cache or default_cache_dir(paths, output_dir, base_dir),
+            limits=limits,
+        )
+
+    def decompile_file(path: Path, output_path: Path) -> DecompileResult:
         context = Context()
+        file_timings = new_timings(timings)
+        stats = result_timings(file_timings)
         try:
-            ast = _get_ast(path, context, try_harder, use_runtime, use_yvan, auto_retry)
-        except BaseException as exc:
-            results.append(DecompileResult(path, output_path, "error", error=exc, log=context.log_contents))
-            continue
+            ast = _get_ast(path, context, try_harder, use_runtime, use_yvan, auto_retry, file_timings, limits)
+        except Exception as exc:
+            return file_result(path, output_path, context, stats, exc)
 
         if dump:
             try:
-                _dump_ast(ast, output_path)
-                results.append(DecompileResult(path, output_path, "ok", log=context.log_contents))
-            except BaseException as exc:
-                results.append(DecompileResult(path, output_path, "error", error=exc, log=context.log_contents))
-            continue
+                _dump_ast(ast, output_path, import_unrpyc_legacy_decompiler(), dump_format, file_timings, output_store or output_writer)
+                return file_result(path, output_path, context, stats)
+            except Exception as exc:
+                return file_result(path, output_path, context, stats, exc, "dump")
 
         try:
-            _decompile_ast(ast, output_path, init_offset)
-            results.append(DecompileResult(path, output_path, "ok", log=context.log_contents))
-        except BaseException as exc:
-            results.append(DecompileResult(path, output_path, "error", error=exc, log=context.log_contents))
-
-    return results
+            translator = translation_index.fork() if translation_index is not None else None
+            _decompile_ast(ast, output_path, init_offset, translator, file_timings, output_store or output_writer)
+            return file_result(path, output_path, context, stats)
+        except Exception as exc:
+            return file_result(path, output_path, context, stats, exc, "decompile")
+
+    # Output paths taken by an earlier input this run: the first input keeps it, as if later ones
+    # came from a second run.
+    claimed: Set[Path] = set()
+    for input_path, input_base in zip(paths, root_bases(paths, base_dir, base_dirs)):
+        for path in iter_files([input_path], recursive):
+            if path.suffix.lower() not in (".rpyc", ".rpymc") or (exclude and path in exclude):
+                continue
+
+            output_path = _output_path(path, output_dir, input_base, dump, dump_format)
+            if output_path in claimed or (output_exists(output_path, output_store) and not overwrite):
+                yield DecompileResult(path, output_path, "skip")
+                continue
+            claimed.add(output_path)
+            yield decompile_file(path, output_path)
+
+
+def decompile_paths_legacy(paths: Iterable[Path], **kwargs) -> List[DecompileResult]:
+    """iter_decompile_paths_legacy, collected into a list."""
+    return list(iter_decompile_paths_legacy(paths, **kwargs))
@@ -0,0 +1,379 @@
+from __future__ import annotations
+
+import pickletools
+import struct
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from .astexport import DUMP_EXTENSIONS, export_ast
+from .errors import ErrorRecord, capture, should_retry
+from .limits import DEFAULT_LIMITS, LimitExceeded, Limits, decompress, enforce
+from .patches import apply_deobfuscate_patches, apply_limit_patches
+from .store import output_file
+from .timings import NULL_TIMINGS, Timings
+
+RPYC2_HEADER = b"RENPY RPC2"
+# How much of slot 1 sniff_rpyc_stack inflates. The first object's attribute names are well within it.
+_SNIFF_BYTES = 64 << 10
+
+
+@dataclass
+class DecompileResult:
+    input_path: Path
+    output_path: Optional[Path]
+    state: str
+    error: Optional[ErrorRecord] = None
+    log: List[str] = field(default_factory=list)
+    timings: Optional[Timings] = None
+    # The input with the same bytes whose output was copied instead of decompiling this one.
+    duplicate_of: Optional[Path] = None
+
+
+class Context:
+    def __init__(self) -> None:
+        self.log_contents: List[str] = []
+        self.error: Optional[BaseException] = None
+        self.state = "error"
+
+    def log(self, message: str) -> None:
+        self.log_contents.append(message)
+
+    def set_error(self, error: BaseException) -> None:
+        self.error = error
+
+    def set_state(self, state: str) -> None:
+        self.state = state
+
+
+@dataclass(frozen=True)
+class ReadStack:
+    """The vendor imports one decompiler stack reads rpyc files with."""
+
+    unrpyc: Callable
+    renpycompat: Callable
+    deobfuscate: Callable
+
+
+def file_result(
+    path: Path,
+    output_path: Optional[Path],
+    context: Context,
+    stats: Optional[Timings],
+    exc: Optional[BaseException] = None,
+    stage: str = "read",
+) -> DecompileResult:
+    """The result for one decompiled file: ok, or failed with exc at stage."""
+    if exc is None:
+        return DecompileResult(path, output_path, "ok", log=context.log_contents, timings=stats)
+    state = "limit_exceeded" if isinstance(exc, LimitExceeded) else "error"
+    return DecompileResult(path, output_path, state, error=capture(exc, stage), log=context.log_contents, timings=stats)
+
+
+def _output_path(
+    input_path: Path,
+    output_dir: Optional[Path],
+    base_dir: Optional[Path],
+    dump: bool,
+    dump_format: str = "text",
+) -> Path:
+    if dump:
+        new_ext = DUMP_EXTENSIONS[dump_format]
+    elif input_path.suffix.lower() == ".rpymc":
+        new_ext = ".rpym"
+    else:
+        new_ext = ".rpy"
+
+    if output_dir is None:
+        return input_path.with_suffix(new_ext)
+
+    if base_dir is not None:
+        try:
+            relative = input_path.relative_to(base_dir)
+        except ValueError:
+            relative = input_path.name
+    else:
+        relative = input_path.name
+
+    return (output_dir / relative).with_suffix(new_ext)
+
+
+def rpyc_slot(raw, context, slot: int = 1, bad_header=ValueError) -> memoryview:
+    """
+    Returns the zlib blob of an rpyc file as a view into raw, without copying it: the whole file
+    for v1 files, the given slot for RPYC2 files. Same rules (and log message) as unrpyc's
+    read_ast_from_file.
+    """
+    view = memoryview(raw)
+    if view[:len(RPYC2_HEADER)] != RPYC2_HEADER:
+        return view
+
+    position = len(RPYC2_HEADER)
+    slots = {}
+    have_errored = False
+    for expected_slot in range(1, 0x7FFFFFFF):
+        found, start, length = struct.unpack_from("III", view, position)
+        if found == 0:
+            break
+        if found != expected_slot and not have_errored:
+            have_errored = True
+            context.log(
+                "Warning: Encountered an unexpected slot structure. It is possible the \n"
+                "    file header structure has been changed.")
+        position += 12
+        slots[found] = (start, length)
+
+    if slot not in slots:
+        context.set_state("bad_header")
+        raise bad_header(
+            "Unable to find the right slot to load from the rpyc file. The file header "
+            "structure has been changed. File header: %s" % bytes(view[:50]))
+    start, length = slots[slot]
+    return view[start: start + length]
+
+
+def read_rpyc_ast(path: Path, context, renpycompat, timings=NULL_TIMINGS, bad_header=ValueError):
+    """
+    Reads the AST out of an rpyc file like unrpyc's read_ast_from_file, with the read, decompress
+    and unpickle phases timed separately. The file is gone from memory before unpickling starts.
+    """
+    with timings.phase("read"):
+        raw = path.read_bytes()
+    timings.count("read_bytes", len(raw))
+    header = raw[:50]
+    is_rpyc_v1 = not raw.startswith(RPYC2_HEADER)
+
+    with timings.phase("decompress"):
+        blob = rpyc_slot(raw, context, 1, bad_header)
+        del raw
+        try:
+            contents = decompress(blob)
+        except LimitExceeded:
+            raise
+        except Exception:
+            context.set_state("bad_header")
+            raise bad_header(
+                "Did not find a zlib compressed blob where it was expected. Either the header has "
+                "been modified or the file structure has been changed. File header: %s" % header)
+        finally:
+            # The last reference to the file's bytes.
+            blob.release()
+    timings.count("decompressed_bytes", len(contents))
+
+    # Current unrpyc warns about files from older Ren'Py versions. The legacy stack has no such check.
+    detect_python2 = getattr(renpycompat, "pickle_detect_python2", None)
+    if detect_python2 is not None and (is_rpyc_v1 or detect_python2(contents)):
+        version = "6" if is_rpyc_v1 else "7"
+        context.log(
+            "Warning: analysis found signs that this .rpyc file was generated by ren'py \n"
+            f"    version {version} or below, while this unrpyc version targets ren'py \n"
+            "    version 8. Decompilation will still be attempted, but errors or incorrect \n"
+            "    decompilation might occur. ")
+
+    with timings.phase("unpickle"):
+        _, stmts = renpycompat.pickle_safe_loads(contents)
+    return stmts
+
+
+def _sniff_pickle(prefix: bytes) -> Optional[str]:
+    # Python 2 pickles attribute names as byte strings (SHORT_BINSTRING/BINSTRING), Python 3 never
+    # does. Same tell as unrpyc's pickle_detect_python2, on the start of the stream only.
+    built = False
+    try:
+        for opcode, arg, _ in pickletools.genops(prefix):
+            if opcode.name in ("SHORT_BINSTRING", "BINSTRING", "STRING"):
+                return "legacy"
+            if opcode.name == "PROTO" and arg > 2:
+                return "current"
+            if opcode.name == "BUILD":
+                built = True
+    except Exception:
+        # The prefix ends mid-opcode.
+        pass
+    return "current" if built else None
+
+
+def sniff_rpyc_stack(path: Path) -> Optional[str]:
+    """
+    Guesses the decompiler stack for an rpyc file from its header and the start of its pickle:
+    "legacy" for RPYC1 files and Python 2 pickles (Ren'Py 7 and older), "current" for Python 3
+    pickles, None when it can't tell (obfuscated or damaged files).
+    """
+    try:
+        with path.open("rb") as handle:
+            head = handle.read(4096)
+            if head.startswith(RPYC2_HEADER):
+                position = len(RPYC2_HEADER)
+                # No slot entry fits in a header cut short.
+                slot = None
+                while position + 12 <= len(head):
+                    slot, start, length = struct.unpack("<III", head[position: position + 12])
+                    if slot in (0, 1):
+                        break
+                    position += 12
+                if slot != 1:
+                    return None
+                handle.seek(start)
+                blob = handle.read(min(length, _SNIFF_BYTES))
+            elif head[:1] == b"\x78":
+                # RPYC1: the whole file is one zlib blob, written by Ren'Py 6.17 or older.
+                return "legacy"
+            else:
+                return None
+        prefix = zlib.decompressobj().decompress(blob, _SNIFF_BYTES)
+    except (OSError, struct.error, zlib.error):
+        return None
+    return _sniff_pickle(prefix)
+
+
+def _safe_loads_from_blob(blob: bytes, renpycompat):
+    apply_limit_patches(renpycompat)
+    try:
+        return renpycompat.pickle_safe_loads(blob)
+    except LimitExceeded:
+        raise
+    except Exception:
+        return renpycompat.pickle_safe_loads(decompress(blob))
+
+
+def _read_ast_from_runtime(in_file, context: Context, renpycompat):
+    try:
+        from renpy import script  # type: ignore
+    except Exception as exc:
+        context.set_error(exc)
+        raise
+
+    if not hasattr(script.Script, "read_rpyc_data"):
+        raise RuntimeError("renpy.script.Script.read_rpyc_data not available")
+
+    raw_contents = script.Script.read_rpyc_data(object, in_file, 1)
+    if isinstance(raw_contents, tuple) and len(raw_contents) == 2:
+        return raw_contents[1]
+    _, stmts = _safe_loads_from_blob(raw_contents, renpycompat)
+    return stmts
+
+
+def _read_ast_with_yvan(in_file, context: Context, renpycompat):
+    try:
+        from renpy.loader import YVANeusEX  # type: ignore
+    except Exception as exc:
+        context.set_error(exc)
+        raise
+
+    if in_file.read(len(RPYC2_HEADER)) != RPYC2_HEADER:
+        raise RuntimeError("YVANeusEX requires RPYC2 header")
+
+    slots = {}
+    while True:
+        entry = in_file.read(12)
+        if len(entry) < 12:
+            break
+        slot, start, length = struct.unpack("III", entry)
+        if slot == 0:
+            break
+        slots[slot] = (start, length)
+
+    if 1 not in slots or 2 not in slots:
+        raise RuntimeError("YVANeusEX slots missing")
+
+    # Both slots are read straight into their parts of one buffer and decrypted in place there, so
+    # neither the file nor a second copy of a slot is ever held.
+    decrypted = bytearray(slots[1][1] + slots[2][1])
+    with memoryview(decrypted) as target:
+        offset = 0
+        for start, length in (slots[1], slots[2]):
+            with target[offset: offset + length] as section:
+                in_file.seek(start)
+                if in_file.readinto(section) != length:
+                    raise RuntimeError("YVANeusEX slot is truncated")
+                result = YVANeusEX.encrypt(section, YVANeusEX.cipherkey, True)
+                if result is not None and result is not section:
+                    section[:] = result
+                del result
+            offset += length
+
+    _, stmts = _safe_loads_from_blob(decrypted, renpycompat)
+    return stmts
+
+
+def read_ast(
+    input_path: Path,
+    context: Context,
+    stack: ReadStack,
+    try_harder: bool,
+    use_runtime: bool,
+    use_yvan: bool,
+    auto_retry: bool,
+    timings=NULL_TIMINGS,
+    limits: Limits = DEFAULT_LIMITS,
+):
+    """
+    Reads the AST of an rpyc file with one stack's readers: unrpyc's, then (with try_harder) the
+    deobfuscator, then the Ren'Py runtime and YVANeusEX when asked for, within limits.
+    """
+    def attempt_unrpyc():
+        unrpyc = stack.unrpyc()
+        bad_header = getattr(unrpyc, "BadRpycException", ValueError)
+        renpycompat = stack.renpycompat()
+        apply_limit_patches(renpycompat)
+        return read_rpyc_ast(input_path, context, renpycompat, timings, bad_header)
+
+    def attempt_deobfuscate():
+        deobfuscate = stack.deobfuscate()
+        apply_deobfuscate_patches(deobfuscate)
+        apply_limit_patches(stack.renpycompat())
+        with input_path.open("rb") as in_file:
+            return deobfuscate.read_ast(in_file, context)
+
+    def attempt_runtime():
+        with input_path.open("rb") as in_file:
+            return _read_ast_from_runtime(in_file, context, stack.renpycompat())
+
+    def attempt_yvan():
+        with input_path.open("rb") as in_file:
+            return _read_ast_with_yvan(in_file, context, stack.renpycompat())
+
+    attempts = []
+    if try_harder and not auto_retry:
+        attempts.append(attempt_deobfuscate)
+    else:
+        attempts.append(attempt_unrpyc)
+        if try_harder:
+            attempts.append(attempt_deobfuscate)
+
+    if use_runtime:
+        attempts.append(attempt_runtime)
+    if use_yvan:
+        attempts.append(attempt_yvan)
+
+    last_exc: Optional[Exception] = None
+    with enforce(limits) as budget:
+        for attempt in attempts:
+            name = attempt.__name__[len("attempt_"):]
+            timings.count("read_attempts", 1)
+            try:
+                if attempt is attempt_unrpyc:
+                    return attempt()
+                with timings.phase(f"read:{name}"):
+                    return attempt()
+            except Exception as exc:
+                last_exc = exc
+                # The deobfuscator swallows errors, so check the budget rather than exc. Another
+                # attempt would only decompress the same data again.
+                if budget.exceeded is not None or not should_retry(exc, "read", "read"):
+                    break
+    if budget.exceeded is not None:
+        context.set_state("limit_exceeded")
+        raise budget.exceeded
+    if last_exc is not None:
+        raise last_exc
+    raise RuntimeError("No AST read attempts were configured.")
+
+
+def _dump_ast(ast, out_path: Path, decompiler_module, dump_format: str = "text", timings=NULL_TIMINGS, sink=None):
+    with output_file(out_path, sink, timings) as out_file, timings.phase("dump", exclude="write"):
+        if dump_format == "text":
+            decompiler_module.astdump.pprint(out_file, ast)
+        else:
+            export_ast(out_file, ast, dump_format)
@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .dedup import file_digest, root_bases
+from .detect import find_renpy_version, iter_files
+from .errors import ErrorRecord, capture, should_retry
+from .limits import DEFAULT_LIMITS, LimitExceeded, Limits
+from .rpycfile import sniff_rpyc_stack
+from .translation import default_cache_dir
+
+INDEX_FILE_NAME = "index.sqlite"
+ENTRY_KINDS = ("label", "say", "menu", "define", "default", "jump", "call", "python")
+
+_SCHEMA_VERSION = 1
+_SCHEMA = """
+CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, digest BLOB NOT NULL, entries INTEGER NOT NULL);
+CREATE TABLE entries (id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, kind TEXT NOT NULL, name TEXT NOT NULL, text TEXT NOT NULL, line INTEGER NOT NULL);
+CREATE INDEX entries_file ON entries (file_id);
+CREATE INDEX entries_name ON entries (name, kind);
+CREATE VIRTUAL TABLE entries_fts USING fts5 (name, text, content='entries', content_rowid='id');
+CREATE TRIGGER entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, name, text) VALUES (new.id, new.name, new.text);
+END;
+CREATE TRIGGER entries_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, name, text) VALUES ('delete', old.id, old.name, old.text);
+END;
+"""
+
+# (kind, name, text, line)
+Entry = Tuple[str, str, str, int]
+
+
+@dataclass
+class IndexResult:
+    input_path: Path
+    path: str
+    state: str
+    entries: int = 0
+    error: Optional[ErrorRecord] = None
+
+
+@dataclass
+class IndexSummary:
+    db_path: Path
+    results: List[IndexResult] = field(default_factory=list)
+    removed: int = 0
+
+
+@dataclass
+class SearchHit:
+    kind: str
+    name: str
+    text: str
+    path: str
+    line: int
+
+
+def default_index_path(paths: Sequence[Path], base_dir: Optional[Path] = None) -> Path:
+    return default_cache_dir(paths, None, base_dir) / INDEX_FILE_NAME
+
+
+def source_name(path: Path, input_path: Path, input_base: Optional[Path]) -> str:
+    """The path of the .rpy a decompile writes for an rpyc file, relative to its base dir."""
+    root = input_base or (input_path if input_path.is_dir() else input_path.parent)
+    rpy = path.with_suffix(path.suffix[:-1])
+    try:
+        return rpy.relative_to(root).as_posix()
+    except ValueError:
+        return rpy.name
+
+
+def _source(code) -> str:
+    source = getattr(code, "source", code)
+    return str(source) if source is not None else ""
+
+
+def _store_name(node, name: str) -> str:
+    store = getattr(node, "store", "store") or "store"
+    return name if store == "store" else f"{store[len('store.'):]}.{name}"
+
+
+def iter_entries(ast) -> Iterator[Entry]:
+    """
+    The searchable statements of an AST, in script order: labels, say lines (who/what), menu
+    choices, defines and defaults (name and expression), jumps and calls (target) and python
+    blocks. Blocks are walked with an explicit stack, so deep nesting doesn't hit the recursion
+    limit; screens and ATL are not looked into.
+    """
+    stack: List[Iterator] = [iter(ast if isinstance(ast, (list, tuple)) else [ast])]
+    while stack:
+        try:
+            node = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            continue
+
+        kind = type(node).__name__
+        line = getattr(node, "linenumber", 0) or 0
+        if kind == "Label":
+            yield "label", str(node.name), "", line
+        elif kind == "Say":
+            yield "say", str(node.who or ""), str(node.what or ""), line
+        elif kind == "Menu":
+            for item in node.items:
+                if item[0] is not None:
+                    yield "menu", "", str(item[0]), line
+        elif kind in ("Define", "Default"):
+            yield kind.lower(), _store_name(node, str(node.varname)), _source(node.code), line
+        elif kind == "Jump":
+            yield "jump", "" if node.expression else str(node.target), str(node.target) if node.expression else "", line
+        elif kind == "Call":
+            yield "call", "" if node.expression else str(node.label), str(node.label) if node.expression else "", line
+        elif kind in ("Python", "EarlyPython"):
+            yield "python", "", _source(node.code), line
+
+        blocks = []
+        block = getattr(node, "block", None)
+        if isinstance(block, list):
+            blocks.append(block)
+        # If/elif entries and menu items are tuples ending in their block.
+        for attr in ("entries", "items"):
+            value = getattr(node, attr, None)
+            if isinstance(value, list):
+                blocks.extend(item[-1] for item in value if isinstance(item, tuple) and isinstance(item[-1], list))
+        for block in reversed(blocks):
+            stack.append(iter(block))
+
+
+def root_stack(input_path: Path) -> Optional[str]:
+    """The stack for every rpyc under a root, when the Ren'Py beside it tells (as in an auto decompile)."""
+    version = find_renpy_version(input_path)
+    if version is None:
+        return None
+    return "legacy" if version < 8 else "current"
+
+
+def _read_ast(path: Path, try_harder: bool, limits: Limits, stack: Optional[str] = None):
+    # Same choice of stack as an auto decompile: the legacy one for Ren'Py 7 and older games or
+    # files that look like it, or when the current one can't read the file.
+    if (stack or sniff_rpyc_stack(path)) != "legacy":
+        from .patches import extend_class_factory
+        from .rpyc import Context, _get_ast
+
+        try:
+            extend_class_factory()
+            return _get_ast(path, Context(), try_harder, False, False, True, limits=limits)
+        except LimitExceeded:
+            raise
+        except Exception as exc:
+            if not should_retry(exc, "read", "stack"):
+                raise
+
+    from .patches import extend_class_factory_module
+    from .rpyc_legacy import Context, _get_ast
+    from .vendor import import_unrpyc_legacy_renpycompat
+
+    extend_class_factory_module(import_unrpyc_legacy_renpycompat())
+    return _get_ast(path, Context(), try_harder, False, False, True, limits=limits)
+
+
+def _collect(task) -> Tuple[str, Optional[List[Entry]], Optional[ErrorRecord]]:
+    # Worker: reads one file and returns its entries as plain tuples, dropping the AST.
+    path, try_harder, limits, stack = task
+    try:
+        return path, list(iter_entries(_read_ast(Path(path), try_harder, limits, stack))), None
+    except Exception as exc:
+        return path, None, capture(exc, "read")
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(db_path))
+    connection.execute("PRAGMA journal_mode=WAL")
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version != _SCHEMA_VERSION:
+        for name, kind in connection.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'entries_fts_%'").fetchall():
+            connection.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+        connection.executescript(_SCHEMA)
+        connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        connection.commit()
+    return connection
+
+
+def build_index(
+    paths: Iterable[Path],
+    db_path: Optional[Path] = None,
+    *,
+    base_dir: Optional[Path] = None,
+    base_dirs: Optional[Sequence[Optional[Path]]] = None,
+    recursive: bool = True,
+    try_harder: bool = False,
+    processes: Optional[int] = None,
+    limits: Limits = DEFAULT_LIMITS,
+) -> IndexSummary:
+    """
+    Indexes the rpyc files under paths into a SQLite FTS5 database (default
+    <first path>/.unren/index.sqlite). Entries are located by the path of the .rpy a decompile
+    writes, relative to the file's base dir, and the statement's line number. A file whose
+    digest is unchanged since the last run is not read again; files that are no longer among the
+    inputs are dropped, and files that fail are left out so the next run retries them.
+    """
+    paths = list(paths)
+    if db_path is None:
+        db_path = default_index_path(paths, base_dir)
+    connection = _connect(db_path)
+    summary = IndexSummary(db_path)
+    try:
+        known = {path: (file_id, digest) for file_id, path, digest in connection.execute("SELECT id, path, digest FROM files")}
+        seen: Set[str] = set()
+        tasks = []
+        pending = {}
+        for input_path, input_base in zip(paths, root_bases(paths, base_dir, base_dirs)):
+            stack = root_stack(input_path)
+            for path in iter_files([input_path], recursive):
+                suffix = path.suffix.lower()
+                if suffix not in (".rpyc", ".rpymc"):
+                    continue
+                name = source_name(path, input_path, input_base)
+                # The first input wins a path, as in a decompile of several roots.
+                if name in seen:
+                    continue
+                seen.add(name)
+                digest = file_digest(path)
+                if name in known and known[name][1] == digest:
+                    summary.results.append(IndexResult(path, name, "skip"))
+                    continue
+                pending[str(path)] = (path, name, digest)
+                tasks.append((str(path), try_harder, limits, stack))
+
+        # Big files first, so one of them starting last doesn't leave a single worker running.
+        tasks.sort(key=lambda task: pending[task[0]][0].stat().st_size, reverse=True)
+
+        def record(collected) -> None:
+            with connection:
+                for item, entries, error in collected:
+                    path, name, digest = pending[item]
+                    if name in known:
+                        connection.execute("DELETE FROM entries WHERE file_id = ?", (known[name][0],))
+                        connection.execute("DELETE FROM files WHERE id = ?", (known[name][0],))
+                    if error is not None:
+                        summary.results.append(IndexResult(path, name, "error", error=error))
+                        continue
+                    file_id = connection.execute(
+                        "INSERT INTO files (path, digest, entries) VALUES (?, ?, ?)", (name, digest, len(entries))
+                    ).lastrowid
+                    connection.executemany(
+                        "INSERT INTO entries (file_id, kind, name, text, line) VALUES (?, ?, ?, ?, ?)",
+                        ((file_id,) + entry for entry in entries),
+                    )
+                    summary.results.append(IndexResult(path, name, "ok", len(entries)))
+
+                for name, (file_id, _) in known.items():
+                    if name not in seen:
+                        connection.execute("DELETE FROM entries WHERE file_id = ?", (file_id,))
+                        connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                        summary.removed += 1
+
+        from multiprocessing import Pool, cpu_count
+
+        if processes is None:
+            processes = cpu_count()
+        processes = max(1, min(processes, len(tasks)))
+        if processes > 1:
+            with Pool(processes) as pool:
+                record(pool.imap_unordered(_collect, tasks, 1))
+        else:
+            record(_collect(task) for task in tasks)
+    finally:
+        connection.close()
+    return summary
+
+
+def search_index(db_path: Path, query: str, *, kinds: Sequence[str] = (), limit: int = 50) -> List[SearchHit]:
+    """
+    Entries matching an FTS5 query over names and text, best match first. A query FTS5 can't
+    parse (stray punctuation, say) is searched for as a phrase.
+    """
+    if not db_path.is_file():
+        raise FileNotFoundError(f"No index at {db_path}")
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        sql = (
+            "SELECT entries.kind, entries.name, entries.text, files.path, entries.line FROM entries_fts"
+            " JOIN entries ON entries.id = entries_fts.rowid JOIN files ON files.id = entries.file_id"
+            " WHERE entries_fts MATCH ?"
+        )
+        if kinds:
+            sql += f" AND entries.kind IN ({', '.join('?' * len(kinds))})"
+        sql += " ORDER BY bm25(entries_fts), files.path, entries.line LIMIT ?"
+        try:
+            rows = connection.execute(sql, (query, *kinds, limit)).fetchall()
+        except sqlite3.OperationalError:
+            phrase = '"' + query.replace('"', '""') + '"'
+            rows = connection.execute(sql, (phrase, *kinds, limit)).fetchall()
+    finally:
+        connection.close()
+    return [SearchHit(*row) for row in rows]
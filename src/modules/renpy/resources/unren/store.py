@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import functools
+import io
+import os
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import replace
+from pathlib import Path
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .errors import capture
+from .timings import NULL_TIMINGS
+
+STORE_KINDS = ("zip", "sqlite")
+STORE_FILE_NAMES = {"zip": "decompiled.zip", "sqlite": "decompiled.sqlite"}
+
+DEFAULT_WRITE_THREADS = 4
+# Rendered text (in characters) waiting for the writer threads.
+DEFAULT_WRITE_BUFFER = 64 << 20
+
+_SQLITE_MAGIC = b"SQLite format 3\x00"
+
+
+class OutputStore:
+    """
+    Decompiled files kept in one container instead of one file each. Entries are named by their
+    path relative to root, the directory they would have been written to.
+    """
+
+    kind = ""
+
+    def __init__(self, path: Path, root: Path) -> None:
+        self.path = path
+        self.root = root
+
+    def name_for(self, out_path: Path) -> str:
+        return out_path.relative_to(self.root).as_posix()
+
+    def has(self, out_path: Path) -> bool:
+        return self.name_for(out_path) in self
+
+    def add(self, out_path: Path, text: str, timings=NULL_TIMINGS) -> None:
+        with timings.phase("write"):
+            self.write(self.name_for(out_path), text.encode("utf-8"))
+
+    def __contains__(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def names(self) -> List[str]:
+        raise NotImplementedError
+
+    def read(self, name: str) -> bytes:
+        raise NotImplementedError
+
+    def write(self, name: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def __enter__(self) -> "OutputStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ZipStore(OutputStore):
+    """
+    Deflated zip entries. zipfile keeps the central directory as a name lookup, so one entry is read
+    without scanning the others. A run's writes go to a new zip next to the store; close copies
+    over the entries it didn't rewrite and replaces the store with it, so the store on disk is
+    always a complete zip with one entry per name, even if a run is killed.
+    """
+
+    kind = "zip"
+
+    def __init__(self, path: Path, root: Path) -> None:
+        super().__init__(path, root)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._temp_path = path.with_name(path.name + ".tmp")
+        self._old: Optional[zipfile.ZipFile] = None
+        self._new: Optional[zipfile.ZipFile] = None
+        if path.is_file():
+            try:
+                self._old = zipfile.ZipFile(path, "r")
+            except zipfile.BadZipFile:
+                raise ValueError(f"{path} is not a readable zip store; remove it to start a new one") from None
+        self._names = set(self._old.namelist()) if self._old is not None else set()
+        self._written: Set[str] = set()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+
+    def names(self) -> List[str]:
+        return sorted(self._names)
+
+    def read(self, name: str) -> bytes:
+        if name in self._written:
+            return self._new.read(name)
+        if self._old is None:
+            raise KeyError(name)
+        return self._old.read(name)
+
+    def write(self, name: str, data: bytes) -> None:
+        if self._new is None:
+            self._new = zipfile.ZipFile(self._temp_path, "w", compression=zipfile.ZIP_DEFLATED)
+        if name in self._written:
+            import warnings
+
+            # Written twice in one run: the later entry is the one kept.
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                self._new.writestr(name, data)
+        else:
+            self._new.writestr(name, data)
+            self._written.add(name)
+            self._names.add(name)
+
+    def close(self) -> None:
+        if self._new is None:
+            if self._old is not None:
+                self._old.close()
+            return
+        try:
+            if self._old is not None:
+                # The last entry under a name is the one zipfile reads (stores from before kept every rewrite).
+                latest = {info.filename: info for info in self._old.infolist()}
+                for name, info in latest.items():
+                    if name not in self._written:
+                        self._new.writestr(info, self._old.read(info))
+            self._new.close()
+        finally:
+            if self._old is not None:
+                self._old.close()
+        os.replace(self._temp_path, self.path)
+        self._new = self._old = None
+
+
+class SqliteStore(OutputStore):
+    """One row per file, looked up through the primary key. Writing an existing name replaces it."""
+
+    kind = "sqlite"
+    # Rows written between commits.
+    COMMIT_EVERY = 256
+
+    def __init__(self, path: Path, root: Path) -> None:
+        import sqlite3
+
+        super().__init__(path, root)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path))
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER NOT NULL, data BLOB NOT NULL)")
+        self._pending = 0
+
+    def __contains__(self, name: str) -> bool:
+        return self._db.execute("SELECT 1 FROM files WHERE name = ?", (name,)).fetchone() is not None
+
+    def names(self) -> List[str]:
+        return [name for (name,) in self._db.execute("SELECT name FROM files ORDER BY name")]
+
+    def read(self, name: str) -> bytes:
+        row = self._db.execute("SELECT data FROM files WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return bytes(row[0])
+
+    def write(self, name: str, data: bytes) -> None:
+        self._db.execute("INSERT OR REPLACE INTO files (name, size, data) VALUES (?, ?, ?)", (name, len(data), data))
+        self._pending += 1
+        if self._pending >= self.COMMIT_EVERY:
+            self._db.commit()
+            self._pending = 0
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+
+def open_store(path: Path, root: Optional[Path] = None, kind: Optional[str] = None) -> OutputStore:
+    """
+    Opens (or creates) a store. Without kind, an existing file is recognized by its header and a new
+    one by its suffix. root defaults to the directory holding the store.
+    """
+    if kind is None:
+        if path.is_file():
+            with path.open("rb") as handle:
+                header = handle.read(len(_SQLITE_MAGIC))
+            kind = "sqlite" if header == _SQLITE_MAGIC else "zip"
+        else:
+            kind = "zip" if path.suffix.lower() == ".zip" else "sqlite"
+    if kind not in STORE_KINDS:
+        raise ValueError(f"Unknown output store {kind!r}")
+    if root is None:
+        root = path.parent
+    return ZipStore(path, root) if kind == "zip" else SqliteStore(path, root)
+
+
+class BackgroundWriter:
+    """
+    Writes rendered outputs to their files (temp file, then rename) on a few threads, so the next
+    file decompiles while the last one is written. add blocks while more than max_buffered bytes
+    are waiting; settle holds each result back until its file is written.
+    """
+
+    def __init__(self, threads: int = DEFAULT_WRITE_THREADS, max_buffered: int = DEFAULT_WRITE_BUFFER) -> None:
+        self.max_buffered = max_buffered
+        self._pool = ThreadPoolExecutor(max(1, threads), thread_name_prefix="unren-write")
+        self._buffered = 0
+        self._space = threading.Condition()
+        self._pending: Dict[Path, Future] = {}
+
+    def add(self, out_path: Path, text: str, timings=NULL_TIMINGS) -> None:
+        size = len(text)
+        with self._space:
+            while self._buffered and self._buffered + size > self.max_buffered:
+                self._space.wait()
+            self._buffered += size
+        self._pending[out_path] = self._pool.submit(self._write, out_path, text, size, timings)
+
+    def _write(self, out_path: Path, text: str, size: int, timings) -> None:
+        start = time.perf_counter()
+        try:
+            _write_file(out_path, text)
+        finally:
+            with self._space:
+                self._buffered -= size
+                self._space.notify_all()
+            timings.add("write", start, time.perf_counter() - start)
+
+    def settle(self, results: Iterable) -> Iterator:
+        """
+        Passes results through, holding back the ones whose output is still being written. A failed
+        write turns its result into an error.
+        """
+        held: Deque = deque()
+        for result in results:
+            if self._pending.get(result.output_path) is not None:
+                held.append(result)
+            else:
+                yield result
+            while held and self._pending[held[0].output_path].done():
+                yield self._finish(held.popleft())
+        while held:
+            yield self._finish(held.popleft())
+
+    def _finish(self, result):
+        exc = self._pending.pop(result.output_path).exception()
+        if exc is None:
+            return result
+        return replace(result, state="error", error=capture(exc, "write"))
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "BackgroundWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _write_file(out_path: Path, text: str) -> None:
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = out_path.with_suffix(out_path.suffix + ".tmp")
+    try:
+        with temp_path.open("w", encoding="utf-8") as out_file:
+            out_file.write(text)
+        temp_path.replace(out_path)
+    finally:
+        if temp_path.exists():
+            try:
+                temp_path.unlink()
+            except Exception:
+                pass
+
+
+def background_writes(iter_function):
+    """
+    Runs an iter_decompile_paths function with its outputs written by a BackgroundWriter. Adds the
+    write_threads (0 writes each file before the next one starts) and max_write_buffer (bytes
+    rendered but not yet written) arguments; outputs going to an output_store or to a caller's
+    output_writer are left alone.
+    """
+
+    @functools.wraps(iter_function)
+    def wrapper(*args, write_threads: int = DEFAULT_WRITE_THREADS, max_write_buffer: int = DEFAULT_WRITE_BUFFER, **kwargs):
+        if write_threads <= 0 or kwargs.get("output_store") is not None or kwargs.get("output_writer") is not None:
+            yield from iter_function(*args, **kwargs)
+            return
+        with BackgroundWriter(write_threads, max_write_buffer) as writer:
+            yield from writer.settle(iter_function(*args, output_writer=writer, **kwargs))
+
+    return wrapper
+
+
+@contextmanager
+def output_file(out_path: Path, sink=None, timings=NULL_TIMINGS) -> Iterator:
+    """
+    Text file for one decompiled output. Without a sink, a temp file renamed over out_path once the
+    body succeeds; with one (an OutputStore or a BackgroundWriter), a buffer handed to it.
+    """
+    if sink is not None:
+        buffer = io.StringIO()
+        yield timings.writer(buffer)
+        sink.add(out_path, buffer.getvalue(), timings)
+        return
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = out_path.with_suffix(out_path.suffix + ".tmp")
+    try:
+        with temp_path.open("w", encoding="utf-8") as out_file:
+            yield timings.writer(out_file)
+        with timings.phase("write"):
+            temp_path.replace(out_path)
+    finally:
+        if temp_path.exists():
+            try:
+                temp_path.unlink()
+            except Exception:
+                pass
+
+
+def output_exists(out_path: Path, store: Optional[OutputStore] = None) -> bool:
+    return store.has(out_path) if store is not None else out_path.exists()
+
+
+def materialize(
+    store: OutputStore,
+    output_dir: Optional[Path] = None,
+    names: Optional[Sequence[str]] = None,
+    overwrite: bool = False,
+) -> Iterator[Tuple[str, Path, str]]:
+    """
+    Writes store entries out as files under output_dir (default: the store's root), yielding
+    (name, path, state) with state "ok" or "skip" for each.
+    """
+    if output_dir is None:
+        output_dir = store.root
+    for name in store.names() if names is None else names:
+        path = output_dir.joinpath(*name.split("/"))
+        if path.exists() and not overwrite:
+            yield name, path, "skip"
+            continue
+        data = store.read(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        yield name, path, "ok"
@@ -25,7 +25,6 @@ from .util import DecompilerBase, First, WordConcatenator, reconstruct_paraminfo
 from .renpycompat import renpy
 
 from operator import itemgetter
-from io import StringIO
 
 from . import screendecompiler
 from . import sl2decompiler
@@ -58,6 +57,13 @@ def pprint(out_file, ast, options=Options()):
 
 # Implementation
 
+class SayDoesNotFit(Exception):
+    """
+    Raised out of a menu item that is being printed with the menu's say statement in front of it,
+    as soon as that has put the output behind the script's line numbers.
+    """
+    pass
+
 class Decompiler(DecompilerBase):
     """
     An object which hanldes the decompilation of renpy asts to a given stream
@@ -79,12 +85,22 @@ class Decompiler(DecompilerBase):
         self.is_356c6e34_or_later = False
         self.most_lines_behind = 0
         self.last_lines_behind = 0
+        # For each menu item being printed with a say statement in front of it (innermost last),
+        # how far behind the output may get before the say has to be taken out again.
+        self.say_attempts = []
 
     def advance_to_line(self, linenumber):
         self.last_lines_behind = max(self.linenumber + (0 if self.skip_indent_until_write else 1) - linenumber, 0)
         self.most_lines_behind = max(self.last_lines_behind, self.most_lines_behind)
+        self.check_say_attempt()
         super(Decompiler, self).advance_to_line(linenumber)
 
+    def check_say_attempt(self):
+        # most_lines_behind only grows while an item is printed, so once it is over the limit the
+        # item will be printed without the say whatever comes after. Stop now instead of at the end.
+        if self.say_attempts and self.most_lines_behind > self.say_attempts[-1]:
+            raise SayDoesNotFit()
+
     def save_state(self):
         return (super(Decompiler, self).save_state(),
                 self.paired_with, self.say_inside_menu, self.label_inside_menu, self.in_init, self.missing_init, self.most_lines_behind, self.last_lines_behind)
@@ -131,7 +147,9 @@ class Decompiler(DecompilerBase):
         if hasattr(ast, 'linenumber') and not isinstance(ast, (renpy.ast.TranslateString, renpy.ast.With, renpy.ast.Label, renpy.ast.Pass, renpy.ast.Return)):
             self.advance_to_line(ast.linenumber)
 
-        self.dispatch.get(type(ast), type(self).print_unknown)(self, ast)
+        # Printers of nodes that contain blocks are generators yielding their child blocks, so
+        # nesting doesn't recurse (see util.run_walker).
+        return self.dispatch.get(type(ast), type(self).print_unknown)(self, ast)
 
     # ATL subdecompiler hook
 
@@ -339,8 +357,7 @@ class Decompiler(DecompilerBase):
         # It's possible that we're an "init label", not a regular label. There's no way to know
         # if we are until we parse our children, so temporarily redirect all of our output until
         # that's done, so that we can squeeze in an "init " if we are.
-        out_file = self.out_file
-        self.out_file = StringIO()
+        mark = self.out_file.checkpoint()
         missing_init = self.missing_init
         self.missing_init = False
         try:
@@ -348,13 +365,12 @@ class Decompiler(DecompilerBase):
                 ast.name,
                 reconstruct_paraminfo(ast.parameters) if hasattr(ast, 'parameters') else '',
                 " hide" if hasattr(ast, 'hide') and ast.hide else ""))
-            self.print_nodes(ast.block, 1)
+            yield self.walk_nodes(ast.block, 1)
         finally:
             if self.missing_init:
-                out_file.write("init ")
+                self.out_file.insert(mark, "init ")
             self.missing_init = missing_init
-            out_file.write(self.out_file.getvalue())
-            self.out_file = out_file
+            self.out_file.commit(mark)
 
     @dispatch(renpy.ast.Jump)
     def print_jump(self, ast):
@@ -415,14 +431,14 @@ class Decompiler(DecompilerBase):
                 self.indent()
                 self.write(statement() % condition)
 
-            self.print_nodes(block, 1)
+            yield self.walk_nodes(block, 1)
 
     @dispatch(renpy.ast.While)
     def print_while(self, ast):
         self.indent()
         self.write("while %s:" % ast.condition)
 
-        self.print_nodes(ast.block, 1)
+        yield self.walk_nodes(ast.block, 1)
 
     @dispatch(renpy.ast.Pass)
     def print_pass(self, ast):
@@ -508,14 +524,14 @@ class Decompiler(DecompilerBase):
                 (ast.priority == (500 if self.is_356c6e34_or_later else 990) + self.init_offset and isinstance(ast.block[0], renpy.ast.Image))) and not (
                 self.should_come_before(ast, ast.block[0])):
                 # If they fulfill this criteria we just print the contained statement
-                self.print_nodes(ast.block)
+                yield self.walk_nodes(ast.block)
 
             # translatestring statements are split apart and put in an init block.
             elif (len(ast.block) > 0 and
                     ast.priority == self.init_offset and
                     all(isinstance(i, renpy.ast.TranslateString) for i in ast.block) and
                     all(i.language == ast.block[0].language for i in ast.block[1:])):
-                self.print_nodes(ast.block)
+                yield self.walk_nodes(ast.block)
 
             else:
                 self.indent()
@@ -526,10 +542,10 @@ class Decompiler(DecompilerBase):
                 if len(ast.block) == 1 and not self.should_come_before(ast, ast.block[0]):
                     self.write(" ")
                     self.skip_indent_until_write = True
-                    self.print_nodes(ast.block)
+                    yield self.walk_nodes(ast.block)
                 else:
                     self.write(":")
-                    self.print_nodes(ast.block, 1)
+                    yield self.walk_nodes(ast.block, 1)
         finally:
             self.in_init = in_init
 
@@ -549,7 +565,7 @@ class Decompiler(DecompilerBase):
             if isinstance(condition, renpy.ast.PyExpr):
                 self.write(" if %s" % condition)
             self.write(":")
-            self.print_nodes(block, 1)
+            yield self.walk_nodes(block, 1)
 
     @dispatch(renpy.ast.Menu)
     def print_menu(self, ast):
@@ -573,7 +589,7 @@ class Decompiler(DecompilerBase):
                 self.indent()
                 self.write("set %s" % ast.set)
 
-            if hasattr(ast, "item_arguments"):
+            if getattr(ast, "item_arguments", None) is not None:
                 item_arguments = ast.item_arguments
             else:
                 item_arguments = [None] * len(ast.items)
@@ -597,20 +613,30 @@ class Decompiler(DecompilerBase):
                     # The hard case: we don't know the line number that the menu item is on
                     # So try to put it in, but be prepared to back it out if that puts us behind on the line number
                     state = self.save_state()
+                    depth = len(self.block_stack)
                     self.most_lines_behind = self.last_lines_behind
-                    self.print_say_inside_menu()
-
-                self.print_menu_item(label, condition, block, arguments)
-
-                if state is not None:
-                    if self.most_lines_behind > state[7]: # state[7] is the saved value of self.last_lines_behind
+                    self.say_attempts.append(state[7]) # state[7] is the saved value of self.last_lines_behind
+                    try:
+                        self.print_say_inside_menu()
+                        yield self.print_menu_item(label, condition, block, arguments)
+                    except SayDoesNotFit:
                         # We tried to print the say statement that's inside the menu, but it didn't fit here
-                        # Undo it and print this item again without it. We'll fit it in later
+                        # Undo it and print this item without it. We'll fit it in later
+                        self.say_attempts.pop()
                         self.rollback_state(state)
-                        self.print_menu_item(label, condition, block, arguments)
+                        # The item was left mid-walk, so drop the blocks it had entered
+                        del self.block_stack[depth:]
+                        del self.index_stack[depth:]
+                        yield self.print_menu_item(label, condition, block, arguments)
                     else:
+                        self.say_attempts.pop()
                         self.most_lines_behind = max(state[6], self.most_lines_behind) # state[6] is the saved value of self.most_lines_behind
                         self.commit_state(state)
+                        # This may have put an enclosing attempt over its limit
+                        self.check_say_attempt()
+                    continue
+
+                yield self.print_menu_item(label, condition, block, arguments)
 
             if self.say_inside_menu is not None:
                 # There was no room for this before any of the menu options, so it will just have to go after them all
@@ -777,7 +803,7 @@ class Decompiler(DecompilerBase):
         self.indent()
         self.write("translate %s %s:" % (ast.language or "None", ast.identifier))
 
-        self.print_nodes(ast.block, 1)
+        yield self.walk_nodes(ast.block, 1)
 
     @dispatch(renpy.ast.EndTranslate)
     def print_endtranslate(self, ast):
@@ -818,7 +844,7 @@ class Decompiler(DecompilerBase):
             # Ren'Py counts the TranslateBlock from "translate python" and "translate style" as an Init.
             self.in_init = True
         try:
-            self.print_nodes(ast.block)
+            yield self.walk_nodes(ast.block)
         finally:
             self.in_init = in_init
 
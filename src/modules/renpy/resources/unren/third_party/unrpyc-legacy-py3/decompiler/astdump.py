@@ -23,6 +23,7 @@ from __future__ import unicode_literals
 import sys
 import inspect
 from . import codegen
+from .util import run_walker
 import ast as py_ast
 import renpy
 
@@ -53,25 +54,26 @@ class AstDumper(object):
         self.indent = 0
         self.passed = [] # We'll keep a stack of objects which we've traversed here so we don't recurse endlessly on circular references
         self.passed_where = []
-        self.print_ast(ast)
+        self.passed_ids = {} # id -> line of the objects in passed, so the cycle check doesn't scan the path
+        run_walker(self.print_ast(ast))
 
     def print_ast(self, ast):
         # Decides which function should be used to print the given ast object.
-        try:
-            i = self.passed.index(ast)
-        except ValueError:
-            pass
-        else:
-            self.p('<circular reference to object on line %d>' % self.passed_where[i])
+        # The printers of anything that contains other objects are generators which yield the
+        # printing of their items, so deep trees don't recurse (see util.run_walker)
+        line = self.passed_ids.get(id(ast))
+        if line is not None:
+            self.p('<circular reference to object on line %d>' % line)
             return
         self.passed.append(ast)
         self.passed_where.append(self.linenumber)
+        self.passed_ids[id(ast)] = self.linenumber
         if isinstance(ast, (list, tuple, set, frozenset)):
-            self.print_list(ast)
+            yield self.print_list(ast)
         elif isinstance(ast, renpy.ast.PyExpr):
-            self.print_pyexpr(ast)
+            yield self.print_pyexpr(ast)
         elif isinstance(ast, dict):
-            self.print_dict(ast)
+            yield self.print_dict(ast)
         elif isinstance(ast, (str, str)):
             self.print_string(ast)
         elif isinstance(ast, (int, int, bool)) or ast is None:
@@ -79,9 +81,10 @@ class AstDumper(object):
         elif inspect.isclass(ast):
             self.print_class(ast)
         elif isinstance(ast, object):
-            self.print_object(ast)
+            yield self.print_object(ast)
         else:
             self.print_other(ast)
+        del self.passed_ids[id(ast)]
         self.passed_where.pop()
         self.passed.pop()
 
@@ -101,7 +104,7 @@ class AstDumper(object):
 
         self.ind(1, ast)
         for i, obj in enumerate(ast):
-            self.print_ast(obj)
+            yield self.print_ast(obj)
             if i+1 != len(ast):
                 self.p(',')
                 self.ind()
@@ -117,9 +120,9 @@ class AstDumper(object):
 
         self.ind(1, ast)
         for i, key in enumerate(ast):
-            self.print_ast(key)
+            yield self.print_ast(key)
             self.p(': ')
-            self.print_ast(ast[key])
+            yield self.print_ast(ast[key])
             if i+1 != len(ast):
                 self.p(',')
                 self.ind()
@@ -206,7 +209,7 @@ class AstDumper(object):
 
         if isinstance(ast, py_ast.Module) and self.decompile_python:
             self.p('.code = ')
-            self.print_ast(codegen.to_source(ast, str(self.indentation)))
+            yield self.print_ast(codegen.to_source(ast, str(self.indentation)))
             self.p('>')
             return
 
@@ -218,7 +221,7 @@ class AstDumper(object):
             self.p('.')
             self.p(str(key))
             self.p(' = ')
-            self.print_ast(getattr(ast, key))
+            yield self.print_ast(getattr(ast, key))
             if i+1 != len(keys):
                 self.p(',')
                 self.ind()
@@ -227,7 +230,7 @@ class AstDumper(object):
 
     def print_pyexpr(self, ast):
         if not self.no_pyexpr:
-            self.print_object(ast)
+            yield self.print_object(ast)
             self.p(' = ')
         self.print_string(ast)
 
@@ -240,14 +243,14 @@ class AstDumper(object):
     def print_string(self, ast):
         # prints the representation of a string. If there are newlines in this string,
         # it will print it as a docstring.
-        if b'\n' in ast:
-            astlist = ast.split(b'\n')
+        if '\n' in ast:
+            astlist = ast.split('\n')
             if isinstance(ast, str):
                 self.p('u')
             self.p('"""')
             self.p(self.escape_string(astlist.pop(0)))
             for i, item in enumerate(astlist):
-                self.p('\n')
+                self.p('\n', 1)
                 self.p(self.escape_string(item))
             self.p('"""')
             self.ind()
@@ -258,9 +261,9 @@ class AstDumper(object):
     def escape_string(self, string):
         # essentially the representation of a string without the surrounding quotes
         if isinstance(string, str):
-            return repr(string)[2:-1]
-        elif isinstance(string, str):
             return repr(string)[1:-1]
+        elif isinstance(string, bytes):
+            return repr(string)[2:-1]
         else:
             return string
 
@@ -274,10 +277,10 @@ class AstDumper(object):
         # shouldn't indent in case there's only one or zero objects in this object to print
         if ast is None or len(ast) > 1:
             self.indent += diff_indent
-            self.p(u'\n' + self.indentation * self.indent)
+            self.p(u'\n' + self.indentation * self.indent, 1)
 
-    def p(self, string):
-        # write the string to the stream
-        string = str(string)
-        self.linenumber += string.count('\n')
-        self.out_file.write(string)
\ No newline at end of file
+    def p(self, string, newlines=0):
+        # write the string to the stream. Only ind() and multiline strings write newlines, and
+        # they pass how many, so the text isn't scanned for them
+        self.linenumber += newlines
+        self.out_file.write(str(string))
\ No newline at end of file
@@ -18,7 +18,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from .util import say_get_code
+from .util import say_get_code, run_walker
 import renpy
 
 import hashlib
@@ -32,8 +32,18 @@ class Translator(object):
         self.strings = {}
         self.dialogue = {}
         self.identifiers = set()
+        self.suffixes = {}
+        self.label = None
         self.alternate = None
 
+    def fork(self):
+        # A translator with fresh per-file state that shares this one's dialogue and strings,
+        # so one index can serve every file without copying or re-pickling it.
+        translator = Translator(self.language, self.saving_translations)
+        translator.dialogue = self.dialogue
+        translator.strings = self.strings
+        return translator
+
     # Adapted from Ren'Py's Restructurer.unique_identifier
     def unique_identifier(self, label, digest):
         if label is None:
@@ -41,19 +51,16 @@ class Translator(object):
         else:
             base = label.replace(".", "_") + "_" + digest
 
-        i = 0
-        suffix = ""
-
-        while True:
-
-            identifier = base + suffix
-
-            if identifier not in self.identifiers:
-                break
+        # identifiers only grows, so every suffix below the last one handed out for this base is
+        # still taken. Resume from there instead of probing from _1 on every collision.
+        i = self.suffixes.get(base, 0)
+        identifier = base + "_{0}".format(i) if i else base
 
+        while identifier in self.identifiers:
             i += 1
-            suffix = "_{0}".format(i)
+            identifier = base + "_{0}".format(i)
 
+        self.suffixes[base] = i
         return identifier
 
     # Adapted from Ren'Py's Restructurer.create_translate
@@ -97,19 +104,26 @@ class Translator(object):
             new_block.append(new_ast)
         return new_block
 
-    def walk(self, ast, f):
+    def child_blocks(self, ast):
         if isinstance(ast, (renpy.ast.Init, renpy.ast.Label, renpy.ast.While, renpy.ast.Translate, renpy.ast.TranslateBlock)):
-            f(ast.block)
+            return [ast.block]
         elif isinstance(ast, renpy.ast.Menu):
-            for i in ast.items:
-                if i[2] is not None:
-                    f(i[2])
+            return [i[2] for i in ast.items if i[2] is not None]
         elif isinstance(ast, renpy.ast.If):
-            for i in ast.entries:
-                f(i[1])
+            return [i[1] for i in ast.entries]
+        return []
+
+    def walk(self, ast, f):
+        for block in self.child_blocks(ast):
+            f(block)
 
     # Adapted from Ren'Py's Restructurer.callback
     def translate_dialogue(self, children):
+        run_walker(self.walk_dialogue(children))
+
+    def walk_dialogue(self, children):
+        # Generator version of translate_dialogue, nested blocks are run by run_walker instead of
+        # recursing into them.
         new_children = [ ]
         group = [ ]
 
@@ -127,7 +141,8 @@ class Translator(object):
                 self.strings[i.old] = i.new
 
             if not isinstance(i, renpy.ast.Translate):
-                self.walk(i, self.translate_dialogue)
+                for block in self.child_blocks(i):
+                    yield self.walk_dialogue(block)
             elif self.saving_translations and i.language == self.language:
                 self.dialogue[i.identifier] = i.block
                 if hasattr(i, 'alternate') and i.alternate is not None:
@@ -21,18 +21,53 @@
 from __future__ import unicode_literals
 import sys
 import re
-from io import StringIO
 from contextlib import contextmanager
+from types import GeneratorType
+
+from ..output import OutputBuffer
 
 class OptionBase(object):
     def __init__(self, indentation="    ", log=None):
         self.indentation = indentation
         self.log = [] if log is None else log
 
+def run_walker(walker):
+    """
+    Runs a tree walk written as a generator. Wherever the walker would have recursed into a
+    child, it yields the generator walking that child instead (or None if there's nothing to
+    walk). Those are run on an explicit stack here, so the depth of the tree isn't limited by
+    the recursion limit. Exceptions are thrown back into the walker that yielded the failing
+    child, so try/finally and with blocks in walkers behave like they did when recursing.
+    """
+    stack = [walker]
+    error = None
+    while stack:
+        try:
+            if error is None:
+                child = next(stack[-1])
+            else:
+                child, error = stack[-1].throw(error), None
+        except StopIteration:
+            stack.pop()
+            continue
+        except BaseException as e:
+            stack.pop()
+            if not stack:
+                raise
+            error = e
+            continue
+        if child is not None:
+            stack.append(child)
+
+
 class DecompilerBase(object):
     def __init__(self, out_file=None, options=OptionBase()):
-        # the file object that the decompiler outputs to
-        self.out_file = out_file or sys.stdout
+        # the file object that the decompiler outputs to. Sub-decompilers get handed the buffer
+        # of their parent so they share its checkpoints.
+        out_file = out_file or sys.stdout
+        if not isinstance(out_file, OutputBuffer):
+            out_file = OutputBuffer(out_file)
+        self.out_file = out_file
         # Decompilation options
         self.options = options
         # the string we use for indentation
@@ -81,7 +116,17 @@ class DecompilerBase(object):
         Shorthand method for writing `string` to the file
         """
         string = str(string)
-        self.linenumber += string.count('\n')
+        # Most fragments have no newline; the membership test is cheaper than counting
+        if '\n' in string:
+            self.linenumber += string.count('\n')
+        self.skip_indent_until_write = False
+        self.out_file.write(string)
+
+    def write_newlines(self, string, newlines):
+        """
+        Like write, for callers that already know how many newlines `string` contains
+        """
+        self.linenumber += newlines
         self.skip_indent_until_write = False
         self.out_file.write(string)
 
@@ -91,7 +136,7 @@ class DecompilerBase(object):
         """
         for line in lines:
             if line == '':
-                self.write('\n')
+                self.write_newlines('\n', 1)
             else:
                 self.indent()
                 self.write(line)
@@ -100,35 +145,34 @@ class DecompilerBase(object):
         """
         Save our current state.
         """
-        state = (self.out_file, self.skip_indent_until_write, self.linenumber,
+        return (self.out_file.checkpoint(), self.skip_indent_until_write, self.linenumber,
             self.block_stack, self.index_stack, self.indent_level, self.blank_line_queue)
-        self.out_file = StringIO()
-        return state
 
     def commit_state(self, state):
         """
         Commit changes since a saved state.
         """
-        out_file = state[0]
-        out_file.write(self.out_file.getvalue())
-        self.out_file = out_file
+        self.out_file.commit(state[0])
 
     def rollback_state(self, state):
         """
         Roll back to a saved state.
         """
-        (self.out_file, self.skip_indent_until_write, self.linenumber,
+        self.out_file.rollback(state[0])
+        (_, self.skip_indent_until_write, self.linenumber,
             self.block_stack, self.index_stack, self.indent_level, self.blank_line_queue) = state
 
     def advance_to_line(self, linenumber):
         # If there was anything that we wanted to do as soon as we found a blank line,
         # try to do it now.
-        self.blank_line_queue = filter(lambda m: m(linenumber), self.blank_line_queue)
+        if self.blank_line_queue:
+            self.blank_line_queue = [m for m in self.blank_line_queue if m(linenumber)]
         if self.linenumber < linenumber:
             # Stop one line short, since the call to indent() will advance the last line.
             # Note that if self.linenumber == linenumber - 1, this will write the empty string.
             # This is to make sure that skip_indent_until_write is cleared in that case.
-            self.write("\n" * (linenumber - self.linenumber - 1))
+            newlines = linenumber - self.linenumber - 1
+            self.write_newlines("\n" * newlines, newlines)
 
     def do_when_blank_line(self, m):
         """
@@ -145,18 +189,26 @@ class DecompilerBase(object):
         calls the write method
         """
         if not self.skip_indent_until_write:
-            self.write('\n' + self.indentation * self.indent_level)
+            self.write_newlines('\n' + self.indentation * self.indent_level, 1)
 
     def print_nodes(self, ast, extra_indent=0):
         # This node is a list of nodes
         # Print every node
+        run_walker(self.walk_nodes(ast, extra_indent))
+
+    def walk_nodes(self, ast, extra_indent=0):
+        # Generator version of print_nodes, for node printers that are generators themselves.
+        # print_node may return a generator for the node's children, which gets run by run_walker
+        # instead of recursing.
         with self.increase_indent(extra_indent):
             self.block_stack.append(ast)
             self.index_stack.append(0)
 
             for i, node in enumerate(ast):
                 self.index_stack[-1] = i
-                self.print_node(node)
+                children = self.print_node(node)
+                if isinstance(children, GeneratorType):
+                    yield children
 
             self.block_stack.pop()
             self.index_stack.pop()
@@ -389,6 +441,45 @@ KEYWORDS = set(['$', 'as', 'at', 'behind', 'call', 'expression', 'hide',
 
 word_regexp = '[a-zA-Z_\u00a0-\ufffd][0-9a-zA-Z_\u00a0-\ufffd]*'
 
+class LazyPattern(object):
+    # A regex that is compiled on first use. The unicode ranges in word_regexp take several ms
+    # to compile, which would otherwise be paid by every import of the decompiler.
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+
+    def __getattr__(self, name):
+        # Only reached for attributes not cached yet. Caching them on the instance makes later
+        # lookups as cheap as on the compiled pattern itself.
+        value = getattr(re.compile(self.pattern, self.flags), name)
+        setattr(self, name, value)
+        return value
+
+# The lexer below runs on nearly every statement, so all of its patterns are compiled once here
+# instead of on every match attempt.
+WHITESPACE_RE = re.compile(r"(\s+|\\\n)+", re.DOTALL)
+PYTHON_STRING_PATTERN = r"""(u?(?P<a>"(?:"")?|'(?:'')?).*?(?<=[^\\])(?:\\\\)*(?P=a))"""
+PYTHON_STRING_RE = re.compile(PYTHON_STRING_PATTERN, re.DOTALL)
+NUMBER_RE = re.compile(r'(\+|\-)?(\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?', re.DOTALL)
+WORD_RE = LazyPattern(word_regexp, re.DOTALL)
+DOT_RE = re.compile(r'\.', re.DOTALL)
+# a name, optionally followed by attribute accesses. The common case of simple_expression_guard
+DOTTED_NAME_RE = LazyPattern(r'%s(?:\.%s)*' % (word_regexp, word_regexp))
+
+# Master regex for split_logical_lines. The string is split into consecutive tokens, trying
+# what the old character-by-character scanner tried in the same order: a newline, brackets,
+# a comment, a string. Anything else is consumed as a run up to the next character that could
+# start one of those, or as a single character for a quote that doesn't start a valid string.
+LOGICAL_LINE_TOKEN_RE = re.compile(r"""
+    (?P<newline>\n)
+  | (?P<open>[(\[{])
+  | (?P<close>[)\]}])
+  | \#[^\n]*
+  | %s
+  | [^\n()\[\]{}\#'"]+
+  | .
+""" % PYTHON_STRING_PATTERN, re.DOTALL | re.VERBOSE)
+
 def simple_expression_guard(s):
     # Some things we deal with are supposed to be parsed by
     # ren'py's Lexer.simple_expression but actually cannot
@@ -398,6 +489,10 @@ def simple_expression_guard(s):
     # but we're not naive
     s = s.strip()
 
+    if DOTTED_NAME_RE.fullmatch(s) and not any(word in KEYWORDS or word[0].isspace()
+                                               for word in s.split('.')):
+        return s
+
     if Lexer(s).simple_expression():
         return s
     else:
@@ -420,7 +515,9 @@ class Lexer(object):
         if self.length == self.pos:
             return None
 
-        match = re.compile(regexp, re.DOTALL).match(self.string, self.pos)
+        if isinstance(regexp, str):
+            regexp = re.compile(regexp, re.DOTALL)
+        match = regexp.match(self.string, self.pos)
         if not match:
             return None
 
@@ -429,12 +526,12 @@ class Lexer(object):
 
     def eol(self):
         # eat the next whitespace and check for the end of this simple_expression
-        self.re(r"(\s+|\\\n)+")
+        self.re(WHITESPACE_RE)
         return self.pos >= self.length
 
     def match(self, regexp):
         # strip whitespace and match regexp
-        self.re(r"(\s+|\\\n)+")
+        self.re(WHITESPACE_RE)
         return self.re(regexp)
 
     def python_string(self, clear_whitespace=True):
@@ -442,9 +539,9 @@ class Lexer(object):
         # edit: now parses docstrings correctly. There was a degenerate case where '''string'string''' would
         # result in issues
         if clear_whitespace:
-            return self.match(r"""(u?(?P<a>"(?:"")?|'(?:'')?).*?(?<=[^\\])(?:\\\\)*(?P=a))""")
+            return self.match(PYTHON_STRING_RE)
         else:
-            return self.re(r"""(u?(?P<a>"(?:"")?|'(?:'')?).*?(?<=[^\\])(?:\\\\)*(?P=a))""")
+            return self.re(PYTHON_STRING_RE)
 
 
     def container(self):
@@ -474,11 +571,11 @@ class Lexer(object):
 
     def number(self):
         # parses a number, float or int (but not forced int)
-        return self.match(r'(\+|\-)?(\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+        return self.match(NUMBER_RE)
 
     def word(self):
         # parses a word
-        return self.match(word_regexp)
+        return self.match(WORD_RE)
 
     def name(self):
         # parses a word unless it's in KEYWORDS.
@@ -509,7 +606,7 @@ class Lexer(object):
         while not self.eol():
 
             # if the previous was followed by a dot, there should be a word after it
-            if self.match(r'\.'):
+            if self.match(DOT_RE):
                 if not self.name():
                     # ren'py errors here. I just stop caring
                     return False
@@ -533,39 +630,28 @@ class Lexer(object):
 
         contained = 0
 
+        string = self.string
         startpos = self.pos
 
-        while self.pos < self.length:
-            c = self.string[self.pos]
+        for match in LOGICAL_LINE_TOKEN_RE.finditer(string, self.pos):
+            kind = match.lastgroup
 
-            if c == '\n' and not contained and (not self.pos or self.string[self.pos - 1] != '\\'):
-                lines.append(self.string[startpos:self.pos])
-                # the '\n' is not included in the emitted line
-                self.pos += 1
-                startpos = self.pos
-                continue
+            if kind == 'newline':
+                pos = match.start()
+                if not contained and (not pos or string[pos - 1] != '\\'):
+                    lines.append(string[startpos:pos])
+                    # the '\n' is not included in the emitted line
+                    startpos = pos + 1
 
-            if c in ('(', '[', '{'):
+            elif kind == 'open':
                 contained += 1
-                self.pos += 1
-                continue
 
-            if c in (')', ']', '}') and contained:
+            elif kind == 'close' and contained:
                 contained -= 1
-                self.pos += 1
-                continue
-
-            if c == '#':
-                self.re("[^\n]*")
-                continue
-
-            if self.python_string(False):
-                continue
-
-            self.re(r'\w+| +|.') # consume a word, whitespace or one symbol
 
+        self.pos = self.length
         if self.pos != startpos:
-            lines.append(self.string[startpos:])
+            lines.append(string[startpos:])
         return lines
 
 # Versions of Ren'Py prior to 6.17 put trailing whitespace on the end of
@@ -604,6 +690,8 @@ class Dispatcher(dict):
         return closure
 
 # ren'py string handling
+DOUBLE_SPACE_RE = re.compile(r'(?<= ) ')
+
 def encode_say_string(s):
     """
     Encodes a string in the format used by Ren'Py say statements.
@@ -612,7 +700,8 @@ def encode_say_string(s):
     s = s.replace("\\", "\\\\")
     s = s.replace("\n", "\\n")
     s = s.replace("\"", "\\\"")
-    s = re.sub(r'(?<= ) ', '\\ ', s)
+    if "  " in s:
+        s = DOUBLE_SPACE_RE.sub('\\ ', s)
 
     return "\"" + s + "\""
 
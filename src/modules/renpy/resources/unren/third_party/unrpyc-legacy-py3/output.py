@@ -0,0 +1,56 @@
+"""
+Output buffer shared by both decompiler stacks: this tree's decompilers use it directly, and the
+current stack gets it through unren's patches. It sits outside the decompiler package so importing
+it doesn't load the package (and its fake renpy modules).
+"""
+
+
+class OutputBuffer(object):
+    """
+    Output engine shared by a decompiler and the sub-decompilers it hands its output to.
+
+    While no checkpoint is open, text is written straight through to `out_file`. Once one is
+    open, text is appended to a list of fragments instead. A checkpoint is just a mark into that
+    list, so saving is free, rolling back truncates the list and committing only has to flush
+    the fragments once the outermost checkpoint is closed.
+    """
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.fragments = []
+        self.depth = 0
+
+    def write(self, string):
+        if self.depth:
+            self.fragments.append(string)
+        else:
+            self.out_file.write(string)
+
+    def getvalue(self):
+        # Lets code that swaps out_file for a StringIO keep reading it back
+        self.flush()
+        return self.out_file.getvalue()
+
+    def checkpoint(self):
+        mark = (len(self.fragments), self.depth)
+        self.depth += 1
+        return mark
+
+    def insert(self, mark, string):
+        # Insert text at an open checkpoint. Any checkpoints opened after it must be closed.
+        self.fragments.insert(mark[0], string)
+
+    def commit(self, mark):
+        # marks carry the depth they were taken at, so checkpoints that were abandoned by an
+        # exception get closed along with the one that is committed or rolled back.
+        self.depth = mark[1]
+        if not self.depth:
+            self.flush()
+
+    def rollback(self, mark):
+        del self.fragments[mark[0]:]
+        self.commit(mark)
+
+    def flush(self):
+        if self.fragments:
+            self.out_file.write("".join(self.fragments))
+            self.fragments = []
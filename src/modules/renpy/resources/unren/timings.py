@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class Timings:
+    """Per-file phase timings (seconds) and byte counters, filled in when --timings is on."""
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        # (phase, start, duration) in perf_counter seconds, for the JSON trace.
+        self.events: List[Tuple[str, float, float]] = []
+        self.fallback: Optional[str] = None
+
+    @contextmanager
+    def phase(self, name: str, exclude: Optional[str] = None):
+        # Time charged to the exclude phase while this one runs (nested writes) is not counted
+        # twice.
+        start = time.perf_counter()
+        excluded = self.phases.get(exclude, 0.0) if exclude else 0.0
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if exclude:
+                duration -= self.phases.get(exclude, 0.0) - excluded
+            self.add(name, start, duration)
+
+    def writer(self, out_file):
+        return TimedWriter(out_file, self)
+
+    def add(self, name: str, start: float, duration: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+        self.events.append((name, start, duration))
+
+    def count(self, name: str, amount: int) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, other: "Timings") -> None:
+        for name, start, duration in other.events:
+            self.add(name, start, duration)
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+        if other.fallback is not None:
+            self.fallback = other.fallback
+
+    @property
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    def to_dict(self) -> Dict:
+        return {
+            "phases": {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()},
+            "counters": dict(self.counters),
+            "fallback": self.fallback,
+        }
+
+
+class NullTimings:
+    """Stand-in used when timings are off, so call sites don't need to check."""
+
+    fallback = None
+
+    def phase(self, name: str, exclude: Optional[str] = None):
+        return nullcontext()
+
+    def writer(self, out_file):
+        return out_file
+
+    def add(self, name: str, start: float, duration: float) -> None:
+        pass
+
+    def count(self, name: str, amount: int) -> None:
+        pass
+
+    def merge(self, other) -> None:
+        pass
+
+
+NULL_TIMINGS = NullTimings()
+
+
+def new_timings(enabled: bool):
+    return Timings() if enabled else NULL_TIMINGS
+
+
+def result_timings(timings) -> Optional[Timings]:
+    return timings if isinstance(timings, Timings) else None
+
+
+class TimedWriter:
+    """Text file wrapper that charges write() calls to a phase and counts the bytes written."""
+
+    def __init__(self, out_file, timings, phase: str = "write", counter: str = "written_bytes") -> None:
+        self.out_file = out_file
+        self.timings = timings
+        self.phase = phase
+        self.counter = counter
+
+    def write(self, string: str) -> int:
+        start = time.perf_counter()
+        result = self.out_file.write(string)
+        self.timings.add(self.phase, start, time.perf_counter() - start)
+        self.timings.count(self.counter, len(string.encode("utf-8")))
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.out_file, name)
+
+
+def summarize(items: Iterable[Tuple[str, Optional[Timings]]], top: int = 5) -> List[str]:
+    """Summary lines for (label, timings) pairs: totals per phase and counter, and the slowest files."""
+    items = [(label, timings) for label, timings in items if timings is not None]
+    if not items:
+        return []
+
+    phases: Dict[str, float] = {}
+    counters: Dict[str, int] = {}
+    fallbacks: Dict[str, int] = {}
+    for _, timings in items:
+        for name, seconds in timings.phases.items():
+            phases[name] = phases.get(name, 0.0) + seconds
+        for name, amount in timings.counters.items():
+            counters[name] = counters.get(name, 0) + amount
+        if timings.fallback is not None:
+            fallbacks[timings.fallback] = fallbacks.get(timings.fallback, 0) + 1
+
+    total = sum(phases.values())
+    lines = [f"Timings for {len(items)} files, {total * 1000:.1f} ms:"]
+    for name, seconds in sorted(phases.items(), key=lambda item: -item[1]):
+        share = seconds / total * 100 if total else 0.0
+        lines.append(f"  {name:<32} {seconds * 1000:>10.1f} ms {share:>5.1f}%")
+    for name, amount in sorted(counters.items()):
+        lines.append(f"  {name:<32} {amount:>13,}")
+    for name, amount in sorted(fallbacks.items()):
+        lines.append(f"  fallback {name:<23} {amount:>10} files")
+
+    lines.append("Slowest files:")
+    for label, timings in sorted(items, key=lambda item: -item[1].total)[:top]:
+        slowest = max(timings.phases.items(), key=lambda item: item[1], default=("-", 0.0))
+        lines.append(f"  {timings.total * 1000:>10.1f} ms  {label} (mostly {slowest[0]})")
+    return lines
+
+
+def write_trace(path, items: Iterable[Tuple[str, Optional[Timings]]]) -> None:
+    """Writes a Chrome/Perfetto trace (trace event format), one row per file."""
+    events = []
+    origin = None
+    rows = [(label, timings) for label, timings in items if timings is not None]
+    for _, timings in rows:
+        for _, start, _ in timings.events:
+            origin = start if origin is None else min(origin, start)
+    for row, (label, timings) in enumerate(rows):
+        events.append({"ph": "M", "name": "thread_name", "pid": 1, "tid": row, "args": {"name": label}})
+        for name, start, duration in timings.events:
+            events.append({
+                "ph": "X",
+                "name": name,
+                "pid": 1,
+                "tid": row,
+                "ts": round((start - origin) * 1e6, 3),
+                "dur": round(duration * 1e6, 3),
+            })
+        events.append({"ph": "i", "name": "summary", "pid": 1, "tid": row, "s": "t",
+                       "ts": 0, "args": timings.to_dict()})
+    with open(path, "w", encoding="utf-8") as out_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, out_file)
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import hashlib
+import importlib
+import re
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .detect import iter_files
+from .limits import DEFAULT_LIMITS, Limits
+
+CACHE_MAGIC = b"UNREN-TL 1\n"
+CACHE_DIR_NAME = ".unren"
+
+
+@dataclass
+class TranslationIndex:
+    language: str
+    translator: object
+    files: int = 0
+    cached: bool = False
+    errors: List[Tuple[Path, str]] = field(default_factory=list)
+
+    def fork(self):
+        """Returns a translator for one file that shares the index's dialogue and strings."""
+        fork = getattr(self.translator, "fork", None)
+        if fork is not None:
+            return fork()
+        translator = type(self.translator)(self.translator.language)
+        translator.dialogue = self.translator.dialogue
+        translator.strings = self.translator.strings
+        return translator
+
+
+def _stack_modules(legacy: bool):
+    from .patches import extend_class_factory_module
+    from .vendor import (
+        import_unrpyc_decompiler,
+        import_unrpyc_legacy_decompiler,
+        import_unrpyc_legacy_renpycompat,
+        import_unrpyc_renpycompat,
+    )
+
+    if legacy:
+        renpycompat = import_unrpyc_legacy_renpycompat()
+        decompiler_module = import_unrpyc_legacy_decompiler()
+    else:
+        renpycompat = import_unrpyc_renpycompat()
+        decompiler_module = import_unrpyc_decompiler()
+    extend_class_factory_module(renpycompat)
+    translate = importlib.import_module(decompiler_module.__name__ + ".translate")
+    return renpycompat, translate
+
+
+def default_cache_dir(
+    paths: Sequence[Path],
+    output_dir: Optional[Path] = None,
+    base_dir: Optional[Path] = None,
+) -> Path:
+    if output_dir is not None:
+        root = output_dir
+    elif base_dir is not None:
+        root = base_dir
+    else:
+        first = Path(paths[0]) if paths else Path(".")
+        root = first if first.is_dir() else first.parent
+    return root / CACHE_DIR_NAME
+
+
+def cache_path(cache_dir: Path, language: str, legacy: bool) -> Path:
+    safe_language = re.sub(r"[^A-Za-z0-9_.-]", "_", language)
+    stack = "legacy" if legacy else "current"
+    return cache_dir / f"translations-{safe_language}-{stack}.pickle"
+
+
+def _fingerprint(files: Sequence[Path], language: str, legacy: bool) -> bytes:
+    digest = hashlib.sha256()
+    digest.update(f"{language}\0{'legacy' if legacy else 'current'}\0".encode("utf-8"))
+    for path in files:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        digest.update(f"{path.resolve()}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
+    return digest.hexdigest().encode("ascii")
+
+
+def _read_cache(path: Path, fingerprint: bytes, renpycompat):
+    try:
+        with path.open("rb") as in_file:
+            if in_file.readline() != CACHE_MAGIC:
+                return None
+            # The fingerprint sits in front of the pickle, so a stale cache is rejected without
+            # unpickling it.
+            if in_file.readline().rstrip(b"\n") != fingerprint:
+                return None
+            return renpycompat.pickle_loads(in_file.read())
+    except Exception:
+        return None
+
+
+def _write_cache(path: Path, fingerprint: bytes, payload: bytes) -> None:
+    temp_path = path.with_suffix(path.suffix + ".tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with temp_path.open("wb") as out_file:
+            out_file.write(CACHE_MAGIC)
+            out_file.write(fingerprint + b"\n")
+            out_file.write(payload)
+        temp_path.replace(path)
+    except OSError:
+        pass
+    finally:
+        if temp_path.exists():
+            try:
+                temp_path.unlink()
+            except Exception:
+                pass
+
+
+def _collect(task) -> Tuple[str, Optional[bytes], Optional[str]]:
+    # First pass worker: gathers one file's translations. The result is pickled by hand because
+    # the fake AST classes can't go through multiprocessing's pickler.
+    path, language, legacy, try_harder, use_runtime, use_yvan, renpy_path, auto_retry, limits = task
+    if renpy_path is not None and renpy_path not in sys.path:
+        sys.path.insert(0, renpy_path)
+    try:
+        renpycompat, translate = _stack_modules(legacy)
+        if legacy:
+            from .rpyc_legacy import Context, _get_ast
+        else:
+            from .rpyc import Context, _get_ast
+
+        ast = _get_ast(Path(path), Context(), try_harder, use_runtime, use_yvan, auto_retry, limits=limits)
+        translator = translate.Translator(language, True)
+        translator.translate_dialogue(ast)
+        return path, renpycompat.pickle_safe_dumps((translator.dialogue, translator.strings)), None
+    except Exception as exc:
+        return path, None, f"{type(exc).__name__}: {exc}"
+
+
+def build_translation_index(
+    paths: Iterable[Path],
+    language: str,
+    *,
+    recursive: bool = True,
+    legacy: bool = False,
+    try_harder: bool = False,
+    use_runtime: bool = False,
+    use_yvan: bool = False,
+    renpy_path: Optional[Path] = None,
+    auto_retry: bool = True,
+    processes: Optional[int] = None,
+    cache_dir: Optional[Path] = None,
+    limits: Limits = DEFAULT_LIMITS,
+) -> TranslationIndex:
+    renpycompat, translate = _stack_modules(legacy)
+
+    files = sorted(
+        path for path in iter_files(paths, recursive) if path.suffix.lower() in (".rpyc", ".rpymc")
+    )
+    fingerprint = _fingerprint(files, language, legacy)
+    path = cache_path(cache_dir, language, legacy) if cache_dir is not None else None
+
+    translator = translate.Translator(language)
+    if path is not None:
+        cached = _read_cache(path, fingerprint, renpycompat)
+        if cached is not None:
+            translator.dialogue, translator.strings = cached
+            return TranslationIndex(language, translator, len(files), cached=True)
+
+    # Big files first, so one of them starting last doesn't leave a single worker running.
+    files.sort(key=lambda item: item.stat().st_size, reverse=True)
+    options = (
+        language,
+        legacy,
+        try_harder,
+        use_runtime,
+        use_yvan,
+        str(renpy_path) if renpy_path is not None else None,
+        auto_retry,
+        limits,
+    )
+    tasks = [(str(item),) + options for item in files]
+
+    from multiprocessing import Pool, cpu_count
+
+    if processes is None:
+        processes = cpu_count()
+    processes = max(1, min(processes, len(tasks)))
+    if processes > 1:
+        with Pool(processes) as pool:
+            collected = pool.map(_collect, tasks, 1)
+    else:
+        collected = [_collect(task) for task in tasks]
+
+    dialogue: Dict = {}
+    strings: Dict = {}
+    errors: List[Tuple[Path, str]] = []
+    for item, payload, error in collected:
+        if error is not None:
+            errors.append((Path(item), error))
+            continue
+        new_dialogue, new_strings = renpycompat.pickle_loads(payload)
+        dialogue.update(new_dialogue)
+        strings.update(new_strings)
+
+    translator.dialogue = dialogue
+    translator.strings = strings
+    # Partial indexes aren't cached, so a file that failed to load is retried next run.
+    if path is not None and not errors:
+        _write_cache(path, fingerprint, renpycompat.pickle_safe_dumps((dialogue, strings)))
+    return TranslationIndex(language, translator, len(files), errors=errors)
+
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import ast as pyast
+import json
+import math
+import textwrap
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .dedup import root_bases
+from .detect import iter_files
+from .errors import ErrorRecord, capture
+from .limits import DEFAULT_LIMITS, Limits
+from .searchindex import _read_ast, _source, _store_name, root_stack, source_name
+
+
+@dataclass
+class Variable:
+    name: str
+    # "define", "default" or "init python" (a top level assignment in an init block).
+    kind: str
+    expression: str
+    path: str
+    line: int
+    priority: int = 0
+    # Whether the expression is a plain literal; only then is value its value.
+    literal: bool = False
+    value: object = None
+
+    def to_json(self) -> Dict:
+        data = {"name": self.name, "kind": self.kind, "expression": self.expression}
+        if self.literal:
+            data["type"] = type(self.value).__name__
+            data["value"] = _plain(self.value)
+        else:
+            data["type"] = None
+        data.update(path=self.path, line=self.line, priority=self.priority)
+        return data
+
+
+@dataclass
+class VariablesResult:
+    files: int = 0
+    variables: List[Variable] = field(default_factory=list)
+    errors: List[Tuple[Path, ErrorRecord]] = field(default_factory=list)
+
+    def to_json(self) -> Dict:
+        return {
+            "files": self.files,
+            "variables": [variable.to_json() for variable in self.variables],
+            "errors": [{"path": str(path), "error": str(error)} for path, error in self.errors],
+        }
+
+
+def _plain(value):
+    # Literal values as JSON: tuples and sets become lists, dicts keep only string keys.
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((_plain(item) for item in value), key=repr)
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    return value
+
+
+def _json_safe(value) -> bool:
+    if isinstance(value, float):
+        return math.isfinite(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return all(_json_safe(item) for item in value)
+    if isinstance(value, dict):
+        return all(isinstance(key, str) and _json_safe(item) for key, item in value.items())
+    return value is None or isinstance(value, (bool, int, str))
+
+
+def _variable(name: str, kind: str, expression: str, path: str, line: int, priority: int) -> Variable:
+    try:
+        value = pyast.literal_eval(expression.strip())
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return Variable(name, kind, expression, path, line, priority)
+    if not _json_safe(value):
+        return Variable(name, kind, expression, path, line, priority)
+    return Variable(name, kind, expression, path, line, priority, True, value)
+
+
+def _top_level_chunks(source: str) -> Iterator[Tuple[str, int]]:
+    # (text, line offset) of each statement starting at column 0, with the indented lines after it.
+    lines = source.splitlines()
+    start = None
+    for number, text in enumerate(lines):
+        if text and not text[0].isspace() and not text.startswith("#"):
+            if start is not None:
+                yield "\n".join(lines[start:number]), start
+            start = number
+    if start is not None:
+        yield "\n".join(lines[start:]), start
+
+
+def _assignments(source: str) -> Iterator[Tuple[str, str, int]]:
+    """(name, expression, line offset) for each top level `name = ...` in a python block."""
+    source = textwrap.dedent(source)
+    try:
+        modules = [(pyast.parse(source), source, 0)]
+    except (SyntaxError, ValueError):
+        # Python 2 only syntax somewhere in the block: parse its top level statements one by one.
+        modules = []
+        for chunk, offset in _top_level_chunks(source):
+            try:
+                modules.append((pyast.parse(chunk), chunk, offset))
+            except (SyntaxError, ValueError):
+                continue
+
+    for module, text, offset in modules:
+        for statement in module.body:
+            if isinstance(statement, pyast.Assign):
+                targets, value = statement.targets, statement.value
+            elif isinstance(statement, pyast.AnnAssign) and statement.value is not None:
+                targets, value = [statement.target], statement.value
+            else:
+                continue
+            expression = pyast.get_source_segment(text, value) or ""
+            line = offset + statement.lineno - 1
+            for target in targets:
+                if isinstance(target, pyast.Name):
+                    yield target.id, expression, line
+                elif isinstance(target, pyast.Attribute) and isinstance(target.value, pyast.Name) and target.value.id == "store":
+                    yield target.attr, expression, line
+
+
+def iter_variables(ast, path: str) -> Iterator[Variable]:
+    """
+    The store variables a script sets up: define and default statements, and plain assignments at
+    the top level of init python blocks (and `init: $ x = ...`). Python outside init blocks runs
+    in the game, not at start, and is left out.
+    """
+    # (nodes, init priority or None outside init blocks)
+    stack: List[Tuple[Iterator, Optional[int]]] = [(iter(ast if isinstance(ast, (list, tuple)) else [ast]), None)]
+    while stack:
+        nodes, priority = stack[-1]
+        try:
+            node = next(nodes)
+        except StopIteration:
+            stack.pop()
+            continue
+
+        kind = type(node).__name__
+        line = getattr(node, "linenumber", 0) or 0
+        if kind in ("Define", "Default"):
+            # `define x[key] = ...` and `define x += ...` change a variable rather than set it up.
+            if getattr(node, "index", None) is None and getattr(node, "operator", "=") == "=":
+                yield _variable(_store_name(node, str(node.varname)), kind.lower(), _source(node.code), path, line, priority or 0)
+            continue
+        if kind in ("Python", "EarlyPython") and (priority is not None or kind == "EarlyPython"):
+            for name, expression, offset in _assignments(_source(node.code)):
+                yield _variable(_store_name(node, name), "init python", expression, path, line + offset, priority or 0)
+            continue
+
+        if kind == "Init":
+            stack.append((iter(node.block), getattr(node, "priority", 0) or 0))
+            continue
+        blocks = []
+        block = getattr(node, "block", None)
+        if isinstance(block, list):
+            blocks.append(block)
+        for attr in ("entries", "items"):
+            value = getattr(node, attr, None)
+            if isinstance(value, list):
+                blocks.extend(item[-1] for item in value if isinstance(item, tuple) and isinstance(item[-1], list))
+        for block in reversed(blocks):
+            stack.append((iter(block), priority))
+
+
+def _collect(task) -> Tuple[str, Optional[List[Variable]], Optional[ErrorRecord]]:
+    path, name, try_harder, limits, stack = task
+    try:
+        return path, list(iter_variables(_read_ast(Path(path), try_harder, limits, stack), name)), None
+    except Exception as exc:
+        return path, None, capture(exc, "read")
+
+
+def collect_variables(
+    paths: Iterable[Path],
+    *,
+    base_dir: Optional[Path] = None,
+    base_dirs: Optional[Sequence[Optional[Path]]] = None,
+    recursive: bool = True,
+    try_harder: bool = False,
+    processes: Optional[int] = None,
+    limits: Limits = DEFAULT_LIMITS,
+) -> VariablesResult:
+    """
+    Reads the AST of every rpyc file under paths and returns the variables they set up (see
+    iter_variables), in init order: by priority, then by file and line. No decompiler runs and
+    nothing is written. Paths are those of the .rpy a decompile would write, relative to the base
+    dir, as in unren index.
+    """
+    paths = list(paths)
+    tasks = []
+    seen = set()
+    for input_path, input_base in zip(paths, root_bases(paths, base_dir, base_dirs)):
+        stack = root_stack(input_path)
+        for path in iter_files([input_path], recursive):
+            suffix = path.suffix.lower()
+            if suffix not in (".rpyc", ".rpymc"):
+                continue
+            name = source_name(path, input_path, input_base)
+            if name in seen:
+                continue
+            seen.add(name)
+            tasks.append((str(path), name, try_harder, limits, stack))
+
+    from multiprocessing import Pool, cpu_count
+
+    if processes is None:
+        processes = cpu_count()
+    processes = max(1, min(processes, len(tasks)))
+    if processes > 1:
+        with Pool(processes) as pool:
+            collected = pool.map(_collect, tasks, 1)
+    else:
+        collected = [_collect(task) for task in tasks]
+
+    result = VariablesResult(files=len(tasks))
+    for item, variables, error in collected:
+        if error is not None:
+            result.errors.append((Path(item), error))
+            continue
+        result.variables.extend(variables)
+    result.variables.sort(key=lambda variable: (variable.priority, variable.path, variable.line))
+    return result
+
+
+def write_json(result: VariablesResult, out_file) -> None:
+    json.dump(result.to_json(), out_file, indent=2, ensure_ascii=False)
+    out_file.write("\n")
@@ -80,6 +80,11 @@ def import_unrpyc_legacy_deobfuscate():
     return importlib.import_module("unren_legacy.deobfuscate")
 
 
+def import_unrpyc_legacy_output():
+    _ensure_alias_package("unren_legacy", unrpyc_legacy_py3_dir())
+    return importlib.import_module("unren_legacy.output")
+
+
 def import_unrpyc_legacy_renpycompat():
     _ensure_alias_package("unren_legacy", unrpyc_legacy_py3_dir())
     return importlib.import_module("unren_legacy.decompiler.renpycompat")
@@ -34,26 +34,65 @@ function resolveUnrenRoot() {
   return null;
 }
 
+function existsFile(p) {
+  try {
+    return fs.existsSync(p) && fs.statSync(p).isFile();
+  } catch {
+    return false;
+  }
+}
+
+function bundleEntry(bundleDir) {
+  const zipPath = path.join(bundleDir, "unren.zip");
+  if (existsFile(zipPath)) return zipPath;
+  if (existsDir(path.join(bundleDir, "unren"))) return bundleDir;
+  return null;
+}
+
+// Precompiled bundle from scripts/build-unren-bundle.mjs. Returns the PYTHONPATH entry.
+// Dev runs only use one when MACLAUNCHER_UNREN_BUNDLE points at it, so edits to the
+// source tree are never shadowed by a stale build.
+function resolveUnrenBundle() {
+  const override = process.env.MACLAUNCHER_UNREN_BUNDLE;
+  if (override) {
+    if (override === "0") return null;
+    return existsFile(override) ? override : bundleEntry(override);
+  }
+  if (!isPackaged || !process.resourcesPath) return null;
+  const candidates = [
+    path.join(process.resourcesPath, "unren-bundle"),
+    path.join(process.resourcesPath, "resources", "unren-bundle")
+  ];
+  for (const candidate of candidates) {
+    const entry = bundleEntry(candidate);
+    if (entry) return entry;
+  }
+  return null;
+}
+
 function buildUnrenCommand({ userDataDir } = {}) {
   const resolved = resolvePythonBinary({ userDataDir });
-  const unrenRoot = resolveUnrenRoot();
-  if (!unrenRoot) throw new Error("UnRen tools not found.");
+  const bundle = resolveUnrenBundle();
+  const unrenRoot = bundle ? null : resolveUnrenRoot();
+  if (!bundle && !unrenRoot) throw new Error("UnRen tools not found.");
   const env = {
     ...process.env,
     PYTHONDONTWRITEBYTECODE: "1"
   };
-  const pythonPathParts = [path.dirname(unrenRoot), env.PYTHONPATH || ""].filter(Boolean);
+  const pythonPathParts = [bundle || path.dirname(unrenRoot), env.PYTHONPATH || ""].filter(Boolean);
   env.PYTHONPATH = pythonPathParts.join(path.delimiter);
   return {
     command: resolved.pythonPath,
     args: ["-m", "unren"],
     env,
     source: resolved.source,
-    unrenRoot
+    unrenRoot,
+    bundle
   };
 }
 
 module.exports = {
   resolveUnrenRoot,
+  resolveUnrenBundle,
   buildUnrenCommand
 };